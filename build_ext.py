@@ -5,11 +5,25 @@ from setuptools import Extension
 from Cython.Build import cythonize
 import numpy as np
 
+# OpenMP is used for multi-threaded basis evaluation. It can be disabled by
+# setting SPLIPY_NO_OPENMP, in which case evaluation is single-threaded.
+if os.environ.get('SPLIPY_NO_OPENMP'):
+    openmp_args = []
+elif sys.platform == 'win32':
+    openmp_args = ['/openmp']
+elif sys.platform == 'darwin':
+    # Apple clang does not ship with OpenMP
+    openmp_args = []
+else:
+    openmp_args = ['-fopenmp']
+
 extensions = cythonize(
     Extension(
         "splipy.basis_eval",
         ["splipy/basis_eval.pyx"],
         include_dirs=[np.get_include()],
+        extra_compile_args=openmp_args,
+        extra_link_args=openmp_args if sys.platform != 'win32' else [],
     )
 )
 
@@ -1,15 +1,144 @@
 # -*- coding: utf-8 -*-
 
 from bisect import bisect_right, bisect_left
+from collections import OrderedDict, namedtuple
 import copy
+import os
 
 import numpy as np
 from scipy.sparse import csr_matrix
 
-from .utils import ensure_listlike
+from .utils import ensure_listlike, is_singleton
 from . import basis_eval, state
 
-__all__ = ['BSplineBasis']
+__all__ = ['BSplineBasis', 'LocalBasis']
+
+
+def _num_threads(threads):
+    """Resolve the *threads* argument of the evaluation functions."""
+    if threads is None:
+        return os.cpu_count() or 1
+    return max(int(threads), 1)
+
+
+CacheInfo = namedtuple('CacheInfo', ['hits', 'misses', 'maxsize', 'currsize'])
+
+KnotInfo = namedtuple('KnotInfo', ['knots', 'multiplicities', 'continuity', 'elements'])
+
+
+class _EvaluationCache:
+    """Least-recently-used cache of basis evaluations, shared by all
+    :class:`BSplineBasis` objects. Its size is bounded by
+    :data:`splipy.state.basis_cache_size`, and zero disables it."""
+
+    def __init__(self):
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        try:
+            value = self.entries[key]
+        except KeyError:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        self.entries[key] = value
+        while len(self.entries) > max(state.basis_cache_size, 0):
+            self.entries.popitem(last=False)
+
+    def info(self):
+        return CacheInfo(self.hits, self.misses, state.basis_cache_size, len(self.entries))
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+_cache = _EvaluationCache()
+
+
+class LocalBasis:
+    """LocalBasis()
+
+    Represents a set of B-spline basis functions evaluated in a number of
+    points, storing only the functions that are nonzero.
+
+    In every evaluation point at most *p* consecutive basis functions are
+    nonzero, where *p* is the order. Instead of an *m* × *n* matrix (mostly
+    zeros), this stores an *m* × *p* table of values together with the index
+    of the first nonzero function in each point. Memory use and the cost of
+    contracting with control points is then *O(mp)* rather than *O(mn)*.
+    """
+
+    def __init__(self, values, spans, n):
+        """  Construct a local basis representation.
+
+        :param numpy.array values: An *m* × *p* array of nonzero function values
+        :param numpy.array spans: The index of the first nonzero function in each
+            point. Indices are taken modulo *n* (for periodic bases).
+        :param int n: The total number of basis functions
+        """
+        self.values = values
+        self.spans = spans
+        self.n = n
+
+    @property
+    def shape(self):
+        """The shape of the equivalent dense matrix, *m* × *n*."""
+        return (self.values.shape[0], self.n)
+
+    @property
+    def indices(self):
+        """An *m* × *p* array of the function indices corresponding to
+        :attr:`values`."""
+        p = self.values.shape[1]
+        return (self.spans[:, None] + np.arange(p)) % self.n
+
+    def tosparse(self):
+        """Convert to a sparse matrix.
+
+        :rtype: scipy.sparse.csr_matrix
+        """
+        (m, p) = self.values.shape
+        indptr = np.arange(0, m*p+1, p)
+        return csr_matrix((self.values.flatten(), self.indices.ravel(), indptr), self.shape)
+
+    def toarray(self):
+        """Convert to a dense matrix.
+
+        :rtype: numpy.array
+        """
+        return self.tosparse().toarray()
+
+    def dot(self, cps, axis=0):
+        """  Contract the basis functions with an array of coefficients.
+
+        This is equivalent to multiplying the dense matrix with `cps` along the
+        given axis, which is replaced by an axis over the evaluation points.
+
+        :param numpy.array cps: Coefficients, with the *n* basis functions
+            along `axis`
+        :param int axis: The axis to contract
+        :return: The contracted array
+        :rtype: numpy.array
+        """
+        cps = np.moveaxis(np.asarray(cps), axis, 0)
+        rest = cps.shape[1:]
+        cps = cps.reshape(cps.shape[0], -1)
+
+        indices = self.indices
+        result = self.values[:, 0, None] * cps[indices[:, 0]]
+        for j in range(1, self.values.shape[1]):
+            result += self.values[:, j, None] * cps[indices[:, j]]
+
+        result = result.reshape((result.shape[0],) + rest)
+        return np.moveaxis(result, 0, axis)
 
 
 class BSplineBasis:
@@ -23,6 +152,11 @@ class BSplineBasis:
     knots = [0, 0, 1, 1]
     order = 2
     periodic = -1
+    _fingerprint = None
+    _knot_info = None
+    _integrals = None
+    _bezier = None
+    _quadrature = None
 
     def __init__(self, order=2, knots=None, periodic=-1):
         """  Construct a B-Spline basis with a given order and knot vector.
@@ -63,6 +197,81 @@ class BSplineBasis:
             if knots[i + 1] - knots[i] < -state.knot_tolerance:
                 raise ValueError('knot vector needs to be non-decreasing')
 
+    def __setattr__(self, name, value):
+        # any change to the defining attributes invalidates cached evaluations
+        if name in ('knots', 'order', 'periodic'):
+            self._invalidate()
+        super().__setattr__(name, value)
+
+    def _invalidate(self):
+        """Drop all cached data derived from the knot vector."""
+        for name in ('_fingerprint', '_knot_info', '_integrals', '_bezier', '_quadrature'):
+            self.__dict__[name] = None
+
+    def _check_cache(self):
+        """Drop all cached data if the knot vector has been edited in place
+        since it was cached, and return the current fingerprint."""
+        fingerprint = (self.order, self.periodic, self.knots.tobytes())
+        if fingerprint != self._fingerprint:
+            self._invalidate()
+            self.__dict__['_fingerprint'] = fingerprint
+        return fingerprint
+
+    def _cache_key(self, *args):
+        """Key for the evaluation cache, from the current knot vector."""
+        return (self._check_cache(), state.knot_tolerance) + args
+
+    def knot_info(self):
+        """  Metadata about the unique knots of the knot vector. Knots closer
+        than :data:`splipy.state.knot_tolerance` are considered equal. The
+        result is computed once, and kept until the basis is modified.
+
+        The fields of the result are:
+
+        - *knots*: the unique knots, including ghost knots of periodic bases
+        - *multiplicities*: the multiplicity of each unique knot
+        - *continuity*: the continuity of the basis functions at each
+          unique knot, *p*--*m*--1
+        - *elements*: for each (nonempty) element of the parametric domain,
+          the index of its left end in *knots*
+
+        :return: Unique knots, multiplicities, continuities and elements
+        :rtype: KnotInfo
+        """
+        self._check_cache()
+        if self._knot_info is None or self._knot_info[0] != state.knot_tolerance:
+            knots = self.knots
+            p = self.order
+            jumps = np.diff(knots) > state.knot_tolerance
+            starts = np.concatenate(([0], np.flatnonzero(jumps) + 1))
+            multiplicities = np.diff(np.append(starts, len(knots)))
+
+            # index of the unique knot for every knot in the knot vector
+            group = np.concatenate(([0], np.cumsum(jumps)))
+            elements = np.arange(group[p-1], group[-p])
+
+            info = KnotInfo(knots[starts], multiplicities, p - multiplicities - 1, elements)
+            for array in info:
+                array.flags.writeable = False
+            self._knot_info = (state.knot_tolerance, info)
+        return self._knot_info[1]
+
+    @staticmethod
+    def cache_info():
+        """  Statistics for the evaluation cache, which is enabled by setting
+        :data:`splipy.state.basis_cache_size` to a positive number of entries.
+
+        :return: The number of hits and misses, the maximal size and the
+            current size
+        :rtype: CacheInfo
+        """
+        return _cache.info()
+
+    @staticmethod
+    def cache_clear():
+        """Clear the evaluation cache and its statistics."""
+        _cache.clear()
+
     def num_functions(self):
         """  Returns the number of basis functions in the basis.
 
@@ -106,7 +315,7 @@ class BSplineBasis:
             result = float(np.sum(self.knots[index + 1:index + p])) / (p - 1)
         return result
 
-    def evaluate(self, t, d=0, from_right=True, sparse=False):
+    def evaluate(self, t, d=0, from_right=True, sparse=False, threads=1, dtype=float):
         """  Evaluate all basis functions in a given set of points.
 
         :param t: The parametric coordinate(s) in which to evaluate
@@ -115,25 +324,113 @@ class BSplineBasis:
         :param bool from_right: True if evaluation should be done in the limit
             from above
         :param bool sparse: True if computed matrix should be returned as sparse
+        :param int threads: Number of threads to use for the evaluation. Use
+            *None* for one per available core.
+        :param dtype: Floating point type of the result, float32 or float64
         :return: A matrix *N[i,j]* of all basis functions *j* evaluated in all
             points *i*
         :rtype: numpy.array
         """
 
+        N = self.evaluate_local(t, d, from_right, threads, dtype=dtype)
+        if sparse:
+            return N.tosparse()
+        return N.toarray()
+
+    def evaluate_local(self, t, d=0, from_right=True, threads=1, cache=True, dtype=float):
+        """  Evaluate the nonzero basis functions in a given set of points.
+
+        This is equivalent to :func:`splipy.BSplineBasis.evaluate`, but returns
+        a compact representation which only stores the *p* nonzero functions
+        in each point.
+
+        :param t: The parametric coordinate(s) in which to evaluate
+        :type t: float or [float]
+        :param int d: Number of derivatives to compute
+        :param bool from_right: True if evaluation should be done in the limit
+            from above
+        :param int threads: Number of threads to use for the evaluation. Use
+            *None* for one per available core.
+        :param bool cache: Whether to use the evaluation cache, see
+            :func:`splipy.BSplineBasis.cache_info`
+        :param dtype: Floating point type of the function values, float32
+            or float64. Single precision halves the memory footprint, but the
+            knot spans are always located in double precision.
+        :return: The basis functions evaluated in all points
+        :rtype: LocalBasis
+        """
         # for single-value input, wrap it into a list so it don't crash on the loop below
         t = ensure_listlike(t)
         t = np.array(t, dtype=float)
-        basis_eval.snap(self.knots, t, state.knot_tolerance)
+        dtype = np.dtype(dtype)
+
+        if cache and state.basis_cache_size > 0:
+            key = self._cache_key('local', d, bool(from_right), dtype.str, t.tobytes())
+            result = _cache.get(key)
+            if result is None:
+                result = self.evaluate_local(t, d, from_right, threads, cache=False, dtype=dtype)
+                result.values.flags.writeable = False
+                result.spans.flags.writeable = False
+                _cache.put(key, result)
+            return result
 
         if self.order <= d: # requesting more derivatives than polymoial degree: return all zeros
-            return np.zeros((len(t), self.num_functions()))
+            values = np.zeros((len(t), self.order), dtype=dtype)
+            spans = np.zeros(len(t), dtype=np.intp)
+        else:
+            values, spans = basis_eval.evaluate_local(self.knots, self.order, t, self.periodic,
+                                                      state.knot_tolerance, d, from_right,
+                                                      _num_threads(threads), dtype)
 
-        (data, size) = basis_eval.evaluate(self.knots, self.order, t, self.periodic, state.knot_tolerance, d, from_right)
+        return LocalBasis(values, spans, self.num_functions())
 
-        N = csr_matrix(data, size)
-        if not sparse:
-            N = N.toarray()
-        return N
+    def evaluate_jet(self, t, d=1, from_right=True, threads=1, cache=True, dtype=float):
+        """  Evaluate the nonzero basis functions and all their derivatives up
+        to a given order in a given set of points.
+
+        This is equivalent to calling :func:`splipy.BSplineBasis.evaluate_local`
+        once for each derivative order 0, 1, ..., *d*, but the knot spans are
+        only located once, and all orders are computed in the same pass.
+
+        :param t: The parametric coordinate(s) in which to evaluate
+        :type t: float or [float]
+        :param int d: Highest number of derivatives to compute
+        :param bool from_right: True if evaluation should be done in the limit
+            from above
+        :param int threads: Number of threads to use for the evaluation. Use
+            *None* for one per available core.
+        :param bool cache: Whether to use the evaluation cache, see
+            :func:`splipy.BSplineBasis.cache_info`
+        :param dtype: Floating point type of the function values, float32
+            or float64
+        :return: The basis functions and their derivatives, indexed by order
+        :rtype: [LocalBasis]
+        """
+        # for single-value input, wrap it into a list so it don't crash on the loop below
+        t = ensure_listlike(t)
+        t = np.array(t, dtype=float)
+        dtype = np.dtype(dtype)
+
+        if cache and state.basis_cache_size > 0:
+            key = self._cache_key('jet', d, bool(from_right), dtype.str, t.tobytes())
+            result = _cache.get(key)
+            if result is None:
+                result = tuple(self.evaluate_jet(t, d, from_right, threads, cache=False, dtype=dtype))
+                for N in result:
+                    N.values.flags.writeable = False
+                    N.spans.flags.writeable = False
+                _cache.put(key, result)
+            return list(result)
+
+        # derivatives beyond the polynomial degree vanish, and are not computed
+        values = np.zeros((d+1, len(t), self.order), dtype=dtype)
+        dmax = min(d, self.order - 1)
+        values[:dmax+1], spans = basis_eval.evaluate_jet(self.knots, self.order, t, self.periodic,
+                                                         state.knot_tolerance, dmax, from_right,
+                                                         _num_threads(threads), dtype)
+
+        n = self.num_functions()
+        return [LocalBasis(v, spans, n) for v in values]
 
     def evaluate_old(self, t, d=0, from_right=True, sparse=False):
         """  Evaluate all basis functions in a given set of points.
@@ -213,33 +510,174 @@ class BSplineBasis:
         return N
 
     def integrate(self, t0, t1):
-        """  Integrate all basis functions over a given domain
+        """  Integrate all basis functions over one or more intervals
+
+        :param t0: The parametric starting point(s)
+        :type t0: float or [float]
+        :param t1: The parametric end point(s)
+        :type t1: float or [float]
+        :return: The integration of all functions over the input domain. For
+            several intervals, a matrix *I[i,j]* of function *j* integrated
+            over interval *i*.
+        :rtype: list or numpy.array
+        """
+        squeeze = is_singleton(t0) and is_singleton(t1)
+        t0, t1 = np.broadcast_arrays(np.array(ensure_listlike(t0), dtype=float),
+                                     np.array(ensure_listlike(t1), dtype=float))
+        if self.periodic > -1 and (np.any(t0 < self.start()) or np.any(t1 > self.end())):
+            raise NotImplementedError('Periodic functions integrated across seam')
+
+        t0 = np.maximum(t0, self.start())
+        t1 = np.minimum(t1, self.end())
+        result = self._antiderivative(t1) - self._antiderivative(t0)
+
+        if squeeze:
+            return result[0].tolist()
+        return result
 
-        :param float t0: The parametric starting point
-        :param float t1: The parametric end point
-        :return: The integration of all functions over the input domain
-        :rtype: list
+    def element_integrals(self):
+        """  Integrals of the basis functions over each element. Row *e* of the
+        result holds the integrals over element *e* (see
+        :func:`splipy.BSplineBasis.knot_info`). Only the *p* functions which
+        are nonzero on an element are stored. The table is computed once, and
+        kept until the basis is modified.
+
+        Summing the rows gives the integrals over the whole domain, and a
+        lumped mass vector is obtained by contracting with the control points.
+
+        :return: Element integrals, an (elements) × (functions) operator
+        :rtype: LocalBasis
+        """
+        values, spans = self._integral_table()[:2]
+        return LocalBasis(values, spans, self.num_functions())
+
+    def quadrature(self, points=None):
+        """  Gauss-Legendre quadrature on every element (see
+        :func:`splipy.BSplineBasis.knot_info`). The rule with *n* points
+        integrates polynomials of degree 2 *n* - 1 exactly. The tables are
+        computed once for each number of points, and kept until the basis is
+        modified.
+
+        :param int points: Number of points per element. Defaults to the
+            order of the basis.
+        :return: The quadrature points and weights, two *E* × *n* arrays
+            where *E* is the number of elements
+        :rtype: (numpy.array, numpy.array)
+        """
+        if points is None:
+            points = self.order
+        self._check_cache()
+        if self._quadrature is None or self._quadrature[0] != state.knot_tolerance:
+            self._quadrature = (state.knot_tolerance, {})
+        tables = self._quadrature[1]
+        if points not in tables:
+            x, w = np.polynomial.legendre.leggauss(points)
+            info = self.knot_info()
+            left = info.knots[info.elements]
+            h = info.knots[info.elements + 1] - left
+            t = left[:, None] + h[:, None] * (x + 1) / 2
+            w = h[:, None] * w / 2
+            for array in (t, w):
+                array.flags.writeable = False
+            tables[points] = (t, w)
+        return tables[points]
+
+    def bezier_extraction(self):
+        """  Bezier extraction operators of all elements (see
+        :func:`splipy.BSplineBasis.knot_info`). On element *e*, the *p* nonzero
+        basis functions are
+
+        .. math:: N_{s_e + a}(t) = \\sum_b C_{e,a,b} B_b(\\xi)
+
+        where *B* are the Bernstein polynomials of the same order on the
+        reference element [0,1], ξ is the reference coordinate of *t*, and
+        the function indices are taken modulo the number of functions. The
+        operators are computed once, and kept until the basis is modified.
+
+        :return: The *E* × *p* × *p* operators *C*, and the index *s* of
+            the first nonzero function on each element
+        :rtype: (numpy.array, numpy.array)
         """
-        if self.periodic > -1 and (t0<self.start() or t1>self.end()):
-            raise NotImplemented('Periodic functions integrated across sem')
-
-        t0 = max(t0, self.start())
-        t1 = min(t1, self.end()  )
-        p  = self.order
-        knot = [self.knots[0]] + list(self.knots) + [self.knots[-1]]
-        integration_basis = BSplineBasis(p + 1, knot)
-        N0 = np.array(integration_basis.evaluate(t0)).flatten()
-        N1 = np.array(integration_basis.evaluate(t1)).flatten()
-        N  = [(knot[i+p]-knot[i])*1.0/p * np.sum(N1[i:]-N0[i:]) for i in range(N0.size)]
-        N  = N[1:]
+        self._check_cache()
+        if self._bezier is not None and self._bezier[0] == state.knot_tolerance:
+            return self._bezier[1]
 
-        # collapse periodic functions onto themselves
-        if self.periodic > -1:
-            for j in range(self.periodic + 1):
-                N[j] += N[-self.periodic - 1 + j]
-            N = N[:-self.periodic-1]
+        p = self.order
+        info = self.knot_info()
+        left = info.knots[info.elements]
+        h = info.knots[info.elements + 1] - left
+
+        # interpolate the functions from their values in p (Chebyshev) points
+        # on every element
+        xi = (1 - np.cos(np.pi * (2 * np.arange(p) + 1) / (2 * p))) / 2
+        N = self.evaluate_local((left[:, None] + h[:, None] * xi).ravel(), cache=False)
+        B = BSplineBasis(p).evaluate_local(xi, cache=False).values
+        operators = np.linalg.solve(B, N.values.reshape(len(left), p, p)).transpose(0, 2, 1)
+        spans = N.spans[::p]
+
+        for array in (operators, spans):
+            array.flags.writeable = False
+        self._bezier = (state.knot_tolerance, (operators, spans))
+        return self._bezier[1]
+
+    def _integral_table(self):
+        """Compute the element integrals, and for each of them, the integral
+        of the same function over all preceding elements, together with the
+        integral of each (unwrapped) function over the domain."""
+        self._check_cache()
+        if self._integrals is not None and self._integrals[0] == state.knot_tolerance:
+            return self._integrals[1]
 
-        return N
+        p = self.order
+        info = self.knot_info()
+        left = info.knots[info.elements]
+        h = (info.knots[info.elements + 1] - left) / 2
+
+        # Gauss-Legendre quadrature with p points is exact for degree p-1
+        x, w = np.polynomial.legendre.leggauss(p)
+        N = self.evaluate_local(((left + h)[:, None] + h[:, None] * x).ravel(), cache=False)
+        values = np.einsum('egj,eg->ej', N.values.reshape(len(left), p, p), h[:, None] * w)
+        spans = N.spans[::p]
+
+        # the elements supporting each function are consecutive, so the
+        # integrals over preceding elements are cumulative sums per function
+        functions = (spans[:, None] + np.arange(p)).ravel()
+        order = np.lexsort((np.repeat(np.arange(len(left)), p), functions))
+        sums = np.cumsum(values.ravel()[order]) - values.ravel()[order]
+        first = np.concatenate(([True], np.diff(functions[order]) > 0))
+        sums -= sums[np.maximum.accumulate(np.where(first, np.arange(len(sums)), 0))]
+        before = np.empty(values.size)
+        before[order] = sums
+
+        totals = np.bincount(functions, values.ravel(), minlength=len(self.knots) - p)
+        for array in (values, spans, before, totals):
+            array.flags.writeable = False
+        self._integrals = (state.knot_tolerance, (values, spans, before.reshape(values.shape), totals))
+        return self._integrals[1]
+
+    def _antiderivative(self, t):
+        """The integrals of all functions from the start of the domain to each
+        of the points *t*, as an *m* × *n* matrix."""
+        values, spans, before, totals = self._integral_table()
+        p = self.order
+        n = self.num_functions()
+        info = self.knot_info()
+        left = info.knots[info.elements]
+
+        # the partial integral over the element containing each point
+        e = np.clip(np.searchsorted(left, t, 'right') - 1, 0, len(left) - 1)
+        h = (t - left[e]) / 2
+        x, w = np.polynomial.legendre.leggauss(p)
+        N = self.evaluate_local(((left[e] + h)[:, None] + h[:, None] * x).ravel(), cache=False)
+        partial = np.einsum('igj,ig->ij', N.values.reshape(len(t), p, p), h[:, None] * w)
+
+        # functions entirely to the left of the point contribute everything
+        result = np.where(np.arange(len(totals)) < spans[e, None], totals, 0.0)
+        np.put_along_axis(result, spans[e, None] + np.arange(p), before[e] + partial, axis=1)
+
+        # collapse periodic functions onto themselves
+        result[:, :len(totals)-n] += result[:, n:]
+        return result[:, :n]
 
     def normalize(self):
         """Set the parametric domain to be (0,1)."""
@@ -265,25 +703,29 @@ class BSplineBasis:
     def continuity(self, knot):
         """Get the continuity of the basis functions at a given point.
 
+        :param knot: The parametric coordinate(s)
+        :type knot: float or [float]
         :return: *p*--*m*--1 at a knot with multiplicity *m*, or ``inf``
-            between knots.
-        :rtype: int or float
+            between knots. An array of these for array input.
+        :rtype: int or float or numpy.array
+        :raises ValueError: If any point is outside the domain
         """
+        t = np.array(knot, dtype=float)
         if self.periodic >= 0:
-            if knot < self.start() or knot > self.end():
-                knot = (knot - self.start()) % (self.end() - self.start()) + self.start()
-        elif knot < self.start() or self.end() < knot:
+            outside = (t < self.start()) | (t > self.end())
+            t = np.where(outside, (t - self.start()) % (self.end() - self.start()) + self.start(), t)
+        elif np.any(t < self.start()) or np.any(self.end() < t):
             raise ValueError('out of range')
 
-        # First knot that is larger than the right tolerance point
-        hi = bisect_left(self.knots, knot + state.knot_tolerance)
+        # first unique knot which is not smaller than the left tolerance point
+        info = self.knot_info()
+        i = np.minimum(np.searchsorted(info.knots, t - state.knot_tolerance), len(info.knots) - 1)
+        hit = np.abs(info.knots[i] - t) <= state.knot_tolerance
+        result = np.where(hit, info.continuity[i], np.inf)
 
-        # Last knot that is smaller than the left tolerance point
-        lo = bisect_left(self.knots, knot - state.knot_tolerance)
-
-        if hi == lo:
-            return np.inf
-        return self.order - (hi - lo) - 1
+        if result.ndim == 0:
+            return int(result) if hit else np.inf
+        return result
 
     def make_periodic(self, continuity):
         """Create a periodic basis with a given continuity."""
@@ -307,18 +749,12 @@ class BSplineBasis:
             included. These knots are used by periodic basis.
         :return: List of unique knots
         :rtype: [float]"""
-        p = self.order
+        info = self.knot_info()
         if include_ghost_knots:
-            result = [self.knots[0]]
-            for k in self.knots:
-                if abs(k - result[-1]) > state.knot_tolerance:
-                    result.append(k)
-        else:
-            result = [self.knots[p-1]]
-            for k in self.knots[p-1:-p+1]:
-                if abs(k - result[-1]) > state.knot_tolerance:
-                    result.append(k)
-        return result
+            return info.knots.tolist()
+        if len(info.elements) == 0:
+            return [self.start()]
+        return info.knots[info.elements[0]:info.elements[-1]+2].tolist()
 
     def raise_order(self, amount):
         """Create a knot vector with higher order.
@@ -337,15 +773,13 @@ class BSplineBasis:
             raise ValueError('amount needs to be a non-negative integer')
         if amount == 0:
             return self.clone()
-        knot_spans = list(self.knot_spans(True))  # list of unique knots
+        unique = self.knot_info().knots
         # For every degree we raise, we need to increase the multiplicity by one
-        knots = list(self.knots) + knot_spans * amount
-        # make it a proper knot vector by ensuring that it is non-decreasing
-        knots.sort()
+        knots = np.sort(np.concatenate((self.knots, np.repeat(unique, amount))))
         if self.periodic > -1:
             # remove excessive ghost knots which appear at both ends of the knot vector
-            n0 =                   bisect_left(knot_spans, self.start())
-            n1 = len(knot_spans) - bisect_left(knot_spans, self.end())   - 1
+            n0 =               np.searchsorted(unique, self.start())
+            n1 = len(unique) - np.searchsorted(unique, self.end())   - 1
             knots = knots[n0*amount : -n1*amount]
 
         return BSplineBasis(self.order + amount, knots, self.periodic)
@@ -369,16 +803,17 @@ class BSplineBasis:
             raise ValueError('cannot lower order to less than linears')
 
         p = self.order - amount
-        knots = [ [k] * max(p-1-self.continuity(k), 1) for k in self.knot_spans(True)]
-        knots = [ k for sublist in knots for k in sublist]
-
-        if self.periodic > -1:
-            # remove excessive ghost knots which appear at both ends of the knot vector
-            n0 =                   bisect_left(knot_spans, self.start())
-            n1 = len(knot_spans) - bisect_left(knot_spans, self.end())   - 1
-            knots = knots[n0*amount : -n1*amount]
+        info = self.knot_info()
+        if self.periodic < 0:
+            knots = np.repeat(info.knots, np.maximum(info.multiplicities - amount, 1))
+            return BSplineBasis(p, knots)
 
-        return BSplineBasis(p, knots, self.periodic)
+        # lower the open basis on the parametric domain, and rebuild the ghost knots
+        domain = slice(info.elements[0], info.elements[-1] + 2)
+        multiplicities = np.maximum(info.multiplicities[domain] - amount, 1)
+        multiplicities[[0, -1]] = p
+        knots = np.repeat(info.knots[domain], multiplicities)
+        return BSplineBasis(p, knots).make_periodic(min(self.periodic, p-2))
 
     def insert_knot(self, new_knot):
         """Inserts a knot in the knot vector.
@@ -392,50 +827,85 @@ class BSplineBasis:
         :rtype: numpy.array
         :raises ValueError: If the new knot is outside the domain
         """
-        if self.periodic >= 0:
-            if new_knot < self.start() or new_knot > self.end():
-                new_knot = (new_knot - self.start()) % (self.end() - self.start()) + self.start()
-        elif new_knot < self.start() or self.end() < new_knot:
-            raise ValueError('new_knot out of range')
-        # mu is the index of last non-zero (old) basis function
-        mu = bisect_right(self.knots, new_knot)
-        n = self.num_functions()
+        return self.insert_knots([new_knot]).toarray()
+
+    def insert_knots(self, new_knots):
+        """  Inserts any number of knots in the knot vector.
+
+        All knots are inserted in one pass (using the Oslo algorithm). The
+        return value is the knot insertion operator *C* such that *N_old* =
+        *N_new* x *C*, where *N* are row vectors of basis functions. Each row
+        of *C* has at most *p* nonzero entries, so it is returned in the same
+        compact form as evaluated basis functions. Use
+        :func:`splipy.LocalBasis.dot` to apply it to control points.
+
+        :param [float] new_knots: The parametric coordinates of the points to insert
+        :return: Transformation operator *C*
+        :rtype: LocalBasis
+        :raises ValueError: If any of the new knots are outside the domain
+        """
+        new_knots = np.array(ensure_listlike(new_knots), dtype=float)
+        old_knots = self.knots
+        n_old = self.num_functions()
         p = self.order
-        C = np.zeros((n + 1, n))
-        # the modulus operator i%n in the C-matrix is needed for periodic basis functions
-        for i in range(mu - p):
-            C[i % (n + 1), i % n] = 1
-        for i in range(mu - p, mu):
-            if self.knots[i + p - 1] <= new_knot and new_knot <= self.knots[i + p]:
-                C[i % (n + 1), i % n] = 1
-            else:
-                C[i % (n + 1), i % n] = (new_knot - self.knots[i]) / (
-                    self.knots[i + p - 1] - self.knots[i])
-            if self.knots[i] <= new_knot and new_knot <= self.knots[i + 1]:
-                C[(i + 1) % (n + 1), i % n] = 1
-            else:
-                C[(i + 1) % (n + 1), i % n] = (self.knots[i + p] - new_knot) / (
-                    self.knots[i + p] - self.knots[i + 1])
-        for i in range(mu, n + 1):
-            C[i % (n + 1), (i - 1) % n] = 1
 
+        if self.periodic < 0:
+            if np.any(new_knots < self.start()) or np.any(self.end() < new_knots):
+                raise ValueError('new_knot out of range')
+            new_knots = np.sort(new_knots)
+            self.knots = np.insert(old_knots, np.searchsorted(old_knots, new_knots, 'right'), new_knots)
+
+            # extend both knot vectors, so that the functions at the ends are
+            # computed like all others. Coefficients for the extra functions vanish
+            pad = lambda knots: np.concatenate([[knots[0]] * p, knots, [knots[-1]] * p])
+            values, spans = basis_eval.knot_insertion(pad(old_knots), pad(self.knots), p, p, len(self.knots) - p,
+                                                      state.knot_tolerance)
+            spans -= p
+
+            # shift windows which extend past the ends, and drop the vanishing entries
+            shift = spans - np.clip(spans, 0, n_old - p)
+            cols = np.arange(p) - shift[:, None]
+            values = np.where((0 <= cols) & (cols < p),
+                              np.take_along_axis(values, np.clip(cols, 0, p-1), axis=1), 0.0)
+            spans -= shift
+        else:
+            for k in new_knots:
+                self._insert_periodic_knot(k)
+
+            # compute against a periodic extension of the old knot vector, and
+            # wrap the old function indices around
+            copies = p // n_old + 1
+            idx = np.arange(-copies * n_old, len(old_knots) + copies * n_old)
+            period = old_knots[n_old] - old_knots[0]
+            extended = old_knots[idx % n_old] + (idx // n_old) * period
+            values, spans = basis_eval.knot_insertion(extended, self.knots, p, 0, self.num_functions(),
+                                                      state.knot_tolerance)
+            spans = (spans - copies * n_old) % n_old
+
+        return LocalBasis(values, spans, n_old)
+
+    def _insert_periodic_knot(self, new_knot):
+        """Insert a single knot in a periodic knot vector, keeping the ghost
+        knots at both ends consistent."""
+        if new_knot < self.start() or new_knot > self.end():
+            new_knot = (new_knot - self.start()) % (self.end() - self.start()) + self.start()
+        mu = bisect_right(self.knots, new_knot)
+        p = self.order
         self.knots = np.insert(self.knots, mu, new_knot)
 
         # make sure that it is correct periodic after knot insertion
-        if self.periodic > -1:
-            m  = len(self.knots)
-            r  = self.periodic
-            if mu <= p+r: # need to fix ghost knots on right side
-                k0 = self.knots[0]
-                k1 = self.knots[-p-r-1]
-                for i in range(p+r+1):
-                    self.knots[m-p-r-1+i] = k1 + (self.knots[i]-k0)
-            elif mu >= m-p-r-1: # need to fix ghost knots on left side
-                k0 = self.knots[p+r]
-                k1 = self.knots[-1]
-                for i in range(p+r+1):
-                    self.knots[i] = k0 - (k1-self.knots[m-p-r-1+i])
-        return C
+        m  = len(self.knots)
+        r  = self.periodic
+        if mu <= p+r: # need to fix ghost knots on right side
+            k0 = self.knots[0]
+            k1 = self.knots[-p-r-1]
+            for i in range(p+r+1):
+                self.knots[m-p-r-1+i] = k1 + (self.knots[i]-k0)
+        elif mu >= m-p-r-1: # need to fix ghost knots on left side
+            k0 = self.knots[p+r]
+            k1 = self.knots[-1]
+            for i in range(p+r+1):
+                self.knots[i] = k0 - (k1-self.knots[m-p-r-1+i])
 
     def roll(self, new_start):
         """rotate a periodic knot vector by setting a new starting index.
@@ -453,6 +923,7 @@ class BSplineBasis:
         len_left = left.stop - left.start
         right = slice(0, n-len_left, None)
         (self.knots[:len_left], self.knots[len_left:]) = (self.knots[left], self.knots[right] - t1)
+        self._invalidate()
 
     def matches(self, bspline, reverse=False):
         """ Checks if this basis equals another basis, when disregarding
@@ -480,14 +951,12 @@ class BSplineBasis:
         :type  t: [float]
         :return: none
         """
-        n = len(self.knots)
-        for j in range(len(t)):
-            i = bisect_left(self.knots, t[j])
-            if i < n and abs(self.knots[i]-t[j]) < state.knot_tolerance:
-                t[j] = self.knots[i]
-            elif i > 0 and abs(self.knots[i-1]-t[j]) < state.knot_tolerance:
-                t[j] = self.knots[i-1]
-
+        if isinstance(t, np.ndarray) and t.dtype == float and t.ndim == 1:
+            basis_eval.snap(self.knots, t, state.knot_tolerance)
+            return
+        snapped = np.array(t, dtype=float)
+        basis_eval.snap(self.knots, snapped, state.knot_tolerance)
+        t[:] = snapped.tolist()
 
     def clone(self):
         """Clone the object."""
@@ -3,9 +3,17 @@ import numpy as np
 cimport numpy as np
 import copy
 cimport cython
+from cython.parallel cimport prange
+from libc.math cimport fabs, fmod
 
+# Function values may be stored in single or double precision. Knots and
+# evaluation points are always double precision.
+ctypedef fused real:
+    float
+    double
 
-cdef my_bisect_left(np.float_t[:] array, np.float_t value, unsigned int hi):
+
+cdef unsigned int my_bisect_left(np.float_t[:] array, np.float_t value, unsigned int hi) noexcept nogil:
     cdef unsigned int lo = 0
     cdef unsigned int mid
     while lo < hi:
@@ -17,7 +25,7 @@ cdef my_bisect_left(np.float_t[:] array, np.float_t value, unsigned int hi):
     return lo
 
 
-cdef my_bisect_right(np.float_t[:] array, np.float_t value, unsigned int hi):
+cdef unsigned int my_bisect_right(np.float_t[:] array, np.float_t value, unsigned int hi) noexcept nogil:
     cdef unsigned int lo = 0
     cdef unsigned int mid
     while lo < hi:
@@ -29,14 +37,300 @@ cdef my_bisect_right(np.float_t[:] array, np.float_t value, unsigned int hi):
     return lo
 
 
-@cython.boundscheck(False) # turn off bounds-checking for entire function
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef bint is_sorted(np.float_t[:] t) noexcept nogil:
+    """Check whether the evaluation points are non-decreasing."""
+    cdef unsigned int i
+    for i in range(1, t.shape[0]):
+        if t[i] < t[i-1]:
+            return False
+    return True
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef unsigned int sweep_left(np.float_t[:] knots, np.float_t value, unsigned int lo) noexcept nogil:
+    """Same result as my_bisect_left, provided that all knots before *lo* are
+    less than *value*. For non-decreasing evaluation points, passing the
+    previous result as *lo* makes the total cost of all lookups linear."""
+    cdef unsigned int n = knots.shape[0]
+    while lo < n and knots[lo] < value:
+        lo += 1
+    return lo
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+cdef int find_span(np.float_t[:] knots, unsigned int p, int periodic, np.float_t tol,
+                   bint from_right, np.float_t* t, unsigned int lo) noexcept nogil:
+    """Prepare a single evaluation point: snap it to a nearby knot, wrap it
+    into the domain (for periodic bases) and locate its knot span. The point
+    *t* is modified in place, and *lo* must be my_bisect_left of its
+    original value. Returns the index of the last nonzero basis function plus
+    one, or -1 if the point is outside the domain."""
+    cdef unsigned int n_knots = knots.shape[0]
+    cdef unsigned int n_all   = n_knots - p  # number of basis functions (without periodicity)
+    cdef np.float_t start     = knots[p-1]
+    cdef np.float_t end       = knots[n_all]
+    cdef np.float_t evalT     = t[0]
+    cdef unsigned int mu
+    cdef bint right = from_right
+
+    # Snap to the closest knot if sufficiently close
+    if lo < n_knots and fabs(knots[lo] - evalT) < tol:
+        evalT = knots[lo]
+    elif lo > 0 and fabs(knots[lo-1] - evalT) < tol:
+        evalT = knots[lo-1]
+        while lo > 0 and knots[lo-1] >= evalT:
+            lo -= 1
+
+    if periodic >= 0:
+        # Wrap periodic evaluation into domain
+        if evalT < start or evalT > end:
+            evalT = fmod(evalT - start, end - start) + start
+            if evalT < start:  # C remainder keeps the sign of the dividend
+                evalT += end - start
+            lo = my_bisect_left(knots, evalT, n_knots)
+        if fabs(evalT - start) < tol and not from_right:
+            evalT = end
+            lo = my_bisect_left(knots, evalT, n_knots)
+    t[0] = evalT
+
+    # Special-case the endpoint, so the user doesn't need to
+    if fabs(evalT - end) < tol:
+        right = False
+    # Skip non-periodic evaluation points outside the domain
+    if evalT < start or evalT > end or (fabs(evalT-start) < tol and not right):
+        return -1
+
+    # mu = index of last non-zero basis function
+    mu = lo
+    if right:
+        while mu < n_knots and knots[mu] <= evalT:
+            mu += 1
+    return <int> min(mu, n_all)
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+cdef void basis_level(np.float_t[:] knots, unsigned int p, unsigned int mu, np.float_t evalT,
+                      unsigned int q, real* M) noexcept nogil:
+    """Raise the function values in *M* from polynomial degree q-1 to q."""
+    cdef unsigned int j = p-q-1
+    cdef unsigned int k = mu - q -1
+    M[j] = M[j] + M[j + 1] * (knots[k + q + 1] - evalT) / (knots[k + q + 1] - knots[k + 1])
+    for j in range(p - q , p-1):
+        k = mu - p + j  # 'i'-index in global knot vector (ref Hughes book pg.21)
+        M[j] = M[j] * (evalT - knots[k]) / (knots[k + q] - knots[k])
+        M[j] = M[j] + M[j + 1] * (knots[k + q + 1] - evalT) / (knots[k + q + 1] - knots[k + 1])
+    j = p  - 1
+    k = mu - 1
+    M[j] = M[j] * (evalT - knots[k]) / (knots[k + q] - knots[k])
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+cdef void derivative_steps(np.float_t[:] knots, unsigned int p, unsigned int mu,
+                           unsigned int q0, real* M) noexcept nogil:
+    """Differentiate the degree q0-1 function values in *M*, once for each of
+    the levels q0, ..., p-1."""
+    cdef unsigned int q, j, k
+    for q in range(q0, p):
+        for j in range(p - q - 1, p):
+            k = mu - p + j  # 'i'-index in global knot vector (ref Hughes book pg.21)
+            if j != p-q-1:
+                M[j] = M[j] * q / (knots[k + q] - knots[k])
+            if j != p-1:
+                M[j] = M[j] - M[j + 1] * q / (knots[k + q + 1] - knots[k + 1])
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef void evaluate_range(np.float_t[:] knots, unsigned int p, np.float_t[:] t, int periodic,
+                         np.float_t tol, unsigned int d, bint from_right, bint jet, bint sweep,
+                         real[:,:,:] values, np.intp_t[:] spans,
+                         unsigned int first, unsigned int last) noexcept nogil:
+    """Evaluate the points first, ..., last-1. The function values are
+    computed in place in *values*, which must be zero-initialized. If *jet* is
+    true, derivative number r is stored in values[r], otherwise derivative
+    number *d* is stored in values[0]."""
+    cdef unsigned int n_knots = knots.shape[0]
+    cdef unsigned int lo      = 0
+    cdef unsigned int i, j, q, r, level
+    cdef np.float_t evalT
+    cdef real* M
+    cdef real* D
+    cdef int mu
+
+    if sweep and first < last:
+        lo = my_bisect_left(knots, t[first], n_knots)
+    for i in range(first, last):
+        evalT = t[i]
+        if sweep:
+            lo = sweep_left(knots, evalT, lo)
+        else:
+            lo = my_bisect_left(knots, evalT, n_knots)
+        mu = find_span(knots, p, periodic, tol, from_right, &evalT, lo)
+        if mu < 0:
+            continue
+        spans[i] = mu - p
+
+        M = &values[0, i, 0]
+        M[p-1] = 1  # the last entry is a dummy-zero which is never used
+        if not jet:
+            for q in range(1, p-d):
+                basis_level(knots, p, mu, evalT, q, M)
+            derivative_steps(knots, p, mu, p-d, M)
+            continue
+
+        for level in range(p):
+            if level > 0:
+                basis_level(knots, p, mu, evalT, level, M)
+
+            # derivative number r branches off at this level
+            r = p - 1 - level
+            if r == 0 or r > d:
+                continue
+            D = &values[r, i, 0]
+            for j in range(p):
+                D[j] = M[j]
+            derivative_steps(knots, p, mu, level+1, D)
+
+
+cdef void evaluate_all(np.float_t[:] knots, unsigned int p, np.float_t[:] t, int periodic,
+                       np.float_t tol, unsigned int d, bint from_right, bint jet,
+                       real[:,:,:] values, np.intp_t[:] spans, int threads) noexcept nogil:
+    """Split the evaluation points in contiguous chunks, one per thread. Each
+    chunk keeps its own sweep position."""
+    cdef unsigned int m = t.shape[0]
+    cdef bint sweep = is_sorted(t)
+    cdef int n_chunks = max(1, min(threads, <int> m))
+    cdef int c
+    if n_chunks == 1:
+        evaluate_range(knots, p, t, periodic, tol, d, from_right, jet, sweep, values, spans, 0, m)
+        return
+    for c in prange(n_chunks, num_threads=n_chunks, schedule='static'):
+        evaluate_range(knots, p, t, periodic, tol, d, from_right, jet, sweep, values, spans,
+                       <unsigned int> (<long> m * c // n_chunks),
+                       <unsigned int> (<long> m * (c+1) // n_chunks))
+
+
+cdef evaluate_values(np.float_t[:] knots, unsigned int p, np.float_t[:] t, int periodic,
+                     np.float_t tol, unsigned int d, bint from_right, bint jet, int threads,
+                     unsigned int levels, dtype):
+    """Allocate the output arrays in the requested precision, and run
+    :func:`evaluate_all` on them."""
+    cdef unsigned int m = t.shape[0]
+    cdef float[:,:,:] values32
+    cdef double[:,:,:] values64
+
+    values_out = np.zeros((levels, m, p), dtype=dtype)
+    spans_out  = np.zeros(m, dtype=np.intp)
+    cdef np.intp_t[:] spans = spans_out
+
+    if values_out.dtype == np.float32:
+        values32 = values_out
+        with nogil:
+            evaluate_all(knots, p, t, periodic, tol, d, from_right, jet, values32, spans, threads)
+    elif values_out.dtype == np.float64:
+        values64 = values_out
+        with nogil:
+            evaluate_all(knots, p, t, periodic, tol, d, from_right, jet, values64, spans, threads)
+    else:
+        raise ValueError('dtype must be float32 or float64')
+    return values_out, spans_out
+
+
+def evaluate_local(np.ndarray[np.float_t, ndim=1] knots_in,
+                   unsigned int p,
+                   np.ndarray[np.float_t, ndim=1] eval_t_in,
+                   int periodic,
+                   np.float_t tol,
+                   unsigned int d=0,
+                   bint from_right=True,
+                   int threads=1,
+                   dtype=np.float64):
+    """  Evaluate the nonzero basis functions in a given set of points.
+
+    In each point, at most *p* consecutive basis functions are nonzero. Only
+    these are computed and stored, together with the index of the first one.
+
+    Evaluation points within *tol* of a knot are snapped to it. If the points
+    are non-decreasing, their knot spans are found in a single sweep through
+    the knot vector rather than by one binary search per point.
+
+    The computation runs without the GIL, and is split over *threads* OpenMP
+    threads if the extension is compiled with OpenMP support.
+
+    The function values are stored with the given *dtype*, which is either
+    float32 or float64. Knot span lookup is always done in double precision.
+
+    :param knots_in:       Knot vector
+    :param p:              Parametrization order (polyonomial degree + 1)
+    :param eval_t_in:      The parametric coordinate(s) in which to evaluate
+    :param periodic:       Periodicity of basis
+    :param tol:            Knot tolerance for detecting end-point-evaluations
+    :param d:              Number of derivatives to compute
+    :param from_right:     True if evaluation should be done in the limit from above
+    :param threads:        Number of threads to use
+    :param dtype:          Floating point type of the function values
+    :return: An *m* × *p* array of function values, and an array of length
+        *m* of the (unwrapped) index of the first nonzero function in each point
+    """
+
+    values, spans = evaluate_values(knots_in, p, eval_t_in, periodic, tol, d, from_right, False,
+                                    threads, 1, dtype)
+    return values[0], spans
+
+
+def evaluate_jet(np.ndarray[np.float_t, ndim=1] knots_in,
+                 unsigned int p,
+                 np.ndarray[np.float_t, ndim=1] eval_t_in,
+                 int periodic,
+                 np.float_t tol,
+                 unsigned int d=1,
+                 bint from_right=True,
+                 int threads=1,
+                 dtype=np.float64):
+    """  Evaluate the nonzero basis functions and all their derivatives up to a
+    given order in a given set of points.
+
+    The knot span is located once per point, and the Cox-de Boor triangle is
+    built once. Derivative number *k* is branched off the triangle at level
+    *p-k-1*. Snapping, span lookup, threading and precision are as in
+    :func:`evaluate_local`.
+
+    :param knots_in:       Knot vector
+    :param p:              Parametrization order (polyonomial degree + 1)
+    :param eval_t_in:      The parametric coordinate(s) in which to evaluate
+    :param periodic:       Periodicity of basis
+    :param tol:            Knot tolerance for detecting end-point-evaluations
+    :param d:              Highest number of derivatives to compute
+    :param from_right:     True if evaluation should be done in the limit from above
+    :param threads:        Number of threads to use
+    :param dtype:          Floating point type of the function values
+    :return: A (*d+1*) × *m* × *p* array of function values (derivatives 0
+        through *d*), and an array of length *m* of the (unwrapped) index of
+        the first nonzero function in each point
+    """
+
+    return evaluate_values(knots_in, p, eval_t_in, periodic, tol, d, from_right, True,
+                           threads, d+1, dtype)
+
+
 def evaluate(np.ndarray[np.float_t, ndim=1] knots_in,
              unsigned int p,
              np.ndarray[np.float_t, ndim=1] eval_t_in,
              int periodic,
              np.float_t tol,
              unsigned int d=0,
-             bint from_right=True):
+             bint from_right=True,
+             int threads=1,
+             dtype=np.float64):
     """  Evaluate all basis functions in a given set of points.
 
     :param knots_in:       Knot vector
@@ -46,82 +340,222 @@ def evaluate(np.ndarray[np.float_t, ndim=1] knots_in,
     :param tol:            Knot tolerance for detecting end-point-evaluations
     :param d:              Number of derivatives to compute
     :param from_right:     True if evaluation should be done in the limit from above
+    :param threads:        Number of threads to use
+    :param dtype:          Floating point type of the function values
     :return: Two tuples of all arguments to the scipy sparse csr_matrix
     """
+    cdef unsigned int n = len(knots_in) - p - (periodic+1)  # number of basis functions (with periodicity)
+    cdef unsigned int m = len(eval_t_in)
+    values, spans = evaluate_local(knots_in, p, eval_t_in, periodic, tol, d, from_right, threads, dtype)
+    data    = values.ravel()
+    indices = ((spans[:,None] + np.arange(p)) % n).astype(np.int32).ravel()
+    indptr  = np.arange(0, m*p+1, p, dtype=np.int32)
+    return (data, indices, indptr), (m,n)
 
-    # wrap everything into c-type datastructures for optimized performance
-    cdef np.float_t[:] knots = knots_in
-    cdef unsigned int n_all  = len(knots) - p  # number of basis functions (without periodicity)
-    cdef unsigned int n      = len(knots) - p - (periodic+1)  # number of basis functions (with periodicity)
-    cdef unsigned int m      = len(eval_t_in)
-    cdef np.float_t start    = knots[p-1]
-    cdef np.float_t end      = knots[n_all]
-    cdef np.float_t evalT
-    cdef unsigned int mu     = 0
 
-    cdef np.float_t[:] t    = eval_t_in.copy()
-    cdef np.float_t[:] data = np.zeros(m*p, dtype=float)
-    cdef np.int32_t[:] indices  = np.zeros(m*p, dtype=np.int32)
-    cdef np.int32_t[:] indptr   = np.arange(0,m*p+1,p, dtype=np.int32)
-    cdef np.float_t[:] M        = np.zeros(p, dtype=float)  # temp storage to keep all the function evaluations
-    cdef unsigned int k,q,j,i
-    cdef bint right
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+cdef void scattered_range(real[:,:] values, np.intp_t[:,:] spans, np.intp_t[:] orders,
+                          np.intp_t[:] offsets, np.intp_t[:] shape, np.intp_t[:] strides,
+                          real[:,:] cps, real[:,:] out, unsigned int first, unsigned int last) noexcept nogil:
+    """Contract the points first, ..., last-1 with their own block of
+    control points."""
+    cdef int D = orders.shape[0]
+    cdef unsigned int F = cps.shape[1]
+    cdef np.intp_t block = 1
+    cdef np.intp_t b, r, a, idx
+    cdef unsigned int i, f
+    cdef int k
+    cdef real w
+    for k in range(D):
+        block = block * orders[k]
+    for i in range(first, last):
+        for b in range(block):
+            # decode the local multi-index of b into a weight and a control point
+            r = b
+            w = 1
+            idx = 0
+            for k in range(D-1, -1, -1):
+                a = r % orders[k]
+                r = r // orders[k]
+                w = w * values[i, offsets[k] + a]
+                idx = idx + ((spans[i, k] + a) % shape[k]) * strides[k]
+            if w == 0:
+                continue
+            for f in range(F):
+                out[i, f] += w * cps[idx, f]
 
-    if periodic >= 0:
-        # Wrap periodic evaluation into domain
-        for i in range(len(t)):
-            if t[i] < start or t[i] > end:
-                t[i] = (t[i] - start) % (end - start) + start
-            if abs(t[i] - start) < tol and not from_right:
-                t[i] = end
-    for i in range(len(t)):
-        right = from_right
-        evalT = t[i]
-        # Special-case the endpoint, so the user doesn't need to
-        if abs(t[i] - end) < tol:
-            right = False
-        # Skip non-periodic evaluation points outside the domain
-        if t[i] < start or t[i] > end or (abs(t[i]-start) < tol and not right):
-            continue
 
-        # mu = index of last non-zero basis function
-        if right:
-            mu = my_bisect_right(knots, evalT, n_all+p)
+cdef void scattered_all(real[:,:] values, np.intp_t[:,:] spans, np.intp_t[:] orders,
+                        np.intp_t[:] offsets, np.intp_t[:] shape, np.intp_t[:] strides,
+                        real[:,:] cps, real[:,:] out, int threads) noexcept nogil:
+    """Split the points in contiguous chunks, one per thread."""
+    cdef unsigned int m = values.shape[0]
+    cdef int n_chunks = max(1, min(threads, <int> m))
+    cdef int c
+    if n_chunks == 1:
+        scattered_range(values, spans, orders, offsets, shape, strides, cps, out, 0, m)
+        return
+    for c in prange(n_chunks, num_threads=n_chunks, schedule='static'):
+        scattered_range(values, spans, orders, offsets, shape, strides, cps, out,
+                        <unsigned int> (<long> m * c // n_chunks),
+                        <unsigned int> (<long> m * (c+1) // n_chunks))
+
+
+def evaluate_scattered(values_in, spans_in, orders_in, shape_in, cps_in, int threads=1):
+    """  Evaluate a tensor product spline in scattered points, given the
+    nonzero basis functions of every direction in each point.
+
+    For each point, only the *p1* × *p2* × ... block of control points with
+    nonzero functions is visited, and contracted with the products of the
+    function values. The cost is *O(m p^d)* instead of touching all control
+    points.
+
+    :param values_in:      An *m* × (*p1* + *p2* + ...) array of the nonzero
+                           function values of each direction, side by side
+    :param spans_in:       An *m* × *d* array of the index of the first
+                           nonzero function in each direction (modulo the
+                           number of functions)
+    :param orders_in:      The order of each direction
+    :param shape_in:       The number of functions in each direction
+    :param cps_in:         The control points, an (*n1* · *n2* · ...) × *F*
+                           array in row-major order. Must have the same
+                           floating point type as *values_in*
+    :param threads:        Number of threads to use
+    :return: An *m* × *F* array
+    """
+    orders_arr = np.array(orders_in, dtype=np.intp)
+    shape_arr  = np.array(shape_in, dtype=np.intp)
+    cdef np.intp_t[:,:] spans  = np.ascontiguousarray(spans_in, dtype=np.intp)
+    cdef np.intp_t[:] orders   = orders_arr
+    cdef np.intp_t[:] shape    = shape_arr
+    cdef np.intp_t[:] offsets  = np.cumsum(orders_arr) - orders_arr
+    cdef np.intp_t[:] strides  = np.cumprod(np.append(shape_arr[1:], 1)[::-1])[::-1].copy()
+    cdef float[:,:] values32, cps32, out32
+    cdef double[:,:] values64, cps64, out64
+
+    out_arr = np.zeros((len(values_in), cps_in.shape[1]), dtype=values_in.dtype)
+    if out_arr.dtype == np.float32:
+        values32, cps32, out32 = values_in, cps_in, out_arr
+        with nogil:
+            scattered_all(values32, spans, orders, offsets, shape, strides, cps32, out32, threads)
+    elif out_arr.dtype == np.float64:
+        values64, cps64, out64 = values_in, cps_in, out_arr
+        with nogil:
+            scattered_all(values64, spans, orders, offsets, shape, strides, cps64, out64, threads)
+    else:
+        raise ValueError('dtype must be float32 or float64')
+    return out_arr
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef void banded_range(real[:,::1] values, np.intp_t[::1] spans, real[:,:,::1] cps,
+                       real[:,:,::1] out, unsigned int first, unsigned int last,
+                       np.intp_t row_first, np.intp_t row_last) noexcept nogil:
+    """Compute the rows row_first, ..., row_last-1 of the outer slices
+    first, ..., last-1."""
+    cdef np.intp_t m = values.shape[0]
+    cdef np.intp_t p = values.shape[1]
+    cdef np.intp_t n = cps.shape[1]
+    cdef np.intp_t F = cps.shape[2]
+    cdef np.intp_t i, j, f, idx
+    cdef unsigned int o
+    cdef bint assigned
+    cdef real w
+    cdef real* row
+    cdef real* src
+    cdef real* src_slice
+    cdef real* out_slice
+    for o in range(first, last):
+        src_slice = &cps[o, 0, 0]
+        out_slice = &out[o, 0, 0]
+        for i in range(row_first, row_last):
+            row = out_slice + i * F
+            assigned = False
+            for j in range(p):
+                w = values[i, j]
+                if w == 0:
+                    continue
+                idx = spans[i] + j
+                if idx >= n:
+                    idx = idx - n
+                src = src_slice + idx * F
+                if assigned:
+                    for f in range(F):
+                        row[f] += w * src[f]
+                else:
+                    for f in range(F):
+                        row[f] = w * src[f]
+                    assigned = True
+            if not assigned:
+                for f in range(F):
+                    row[f] = 0
+
+
+cdef void banded_all(real[:,::1] values, np.intp_t[::1] spans, real[:,:,::1] cps,
+                     real[:,:,::1] out, int threads) noexcept nogil:
+    """Split the outer slices in contiguous chunks, one per thread, or the
+    rows if there are fewer slices than threads."""
+    cdef unsigned int L = cps.shape[0]
+    cdef np.intp_t m = values.shape[0]
+    cdef int n_chunks
+    cdef int c
+    if L >= <unsigned int> threads:
+        n_chunks = max(1, threads)
+    else:
+        n_chunks = max(1, min(threads, <int> m))
+    if n_chunks == 1:
+        banded_range(values, spans, cps, out, 0, L, 0, m)
+        return
+    for c in prange(n_chunks, num_threads=n_chunks, schedule='static'):
+        if L >= <unsigned int> n_chunks:
+            banded_range(values, spans, cps, out,
+                         <unsigned int> (<long> L * c // n_chunks),
+                         <unsigned int> (<long> L * (c+1) // n_chunks), 0, m)
         else:
-            mu = my_bisect_left(knots, evalT, n_all+p)
-        mu = min(mu, n_all)
+            banded_range(values, spans, cps, out, 0, L,
+                         m * c // n_chunks, m * (c+1) // n_chunks)
 
-        for k in range(p-1):
-            M[k] = 0
-        M[p-1] = 1  # the last entry is a dummy-zero which is never used
-        for q in range(1, p-d):
-            j = p-q-1
-            k = mu - q -1
-            M[j] = M[j] + M[j + 1] * (knots[k + q + 1] - evalT) / (knots[k + q + 1] - knots[k + 1])
-            for j in range(p - q , p-1):
-                k = mu - p + j  # 'i'-index in global knot vector (ref Hughes book pg.21)
-                M[j] = M[j] * (evalT - knots[k]) / (knots[k + q] - knots[k])
-                M[j] = M[j] + M[j + 1] * (knots[k + q + 1] - evalT) / (knots[k + q + 1] - knots[k + 1])
-            j = p  - 1
-            k = mu - 1
-            M[j] = M[j] * (evalT - knots[k]) / (knots[k + q] - knots[k])
-
-        for q in range(p-d, p):
-            for j in range(p - q - 1, p):
-                k = mu - p + j  # 'i'-index in global knot vector (ref Hughes book pg.21)
-                if j != p-q-1:
-                    M[j] = M[j] * q / (knots[k + q] - knots[k])
-                if j != p-1:
-                    M[j] = M[j] - M[j + 1] * q / (knots[k + q + 1] - knots[k + 1])
-
-
-        for j,k in enumerate(range(i*p, (i+1)*p)):
-            data[k]    = M[j]
-            indices[k] = (mu-p+j) % n
-    return (data, indices, indptr), (m,n)
+
+def contract_banded(values_in, spans_in, cps_in, int threads=1):
+    """  Contract the middle axis of an array with a banded matrix, given by
+    the nonzero entries of each row.
+
+    Row *i* of the matrix has the entries *values_in[i]* in the columns
+    *spans_in[i]*, *spans_in[i]* + 1, ... (modulo the number of columns). The
+    cost is *O(L m p F)* and no transposed copies of the array are made.
+
+    :param values_in: An *m* × *p* array of the nonzero matrix entries
+    :param spans_in:  The column of the first nonzero entry of each row
+    :param cps_in:    An *L* × *n* × *F* array. Must have the same floating
+                      point type as *values_in*
+    :param threads:   Number of threads to use
+    :return: An *L* × *m* × *F* array
+    """
+    cdef np.intp_t[::1] spans = np.ascontiguousarray(spans_in % cps_in.shape[1], dtype=np.intp)
+    cdef float[:,::1] values32
+    cdef float[:,:,::1] cps32, out32
+    cdef double[:,::1] values64
+    cdef double[:,:,::1] cps64, out64
+
+    out_arr = np.empty((cps_in.shape[0], len(values_in), cps_in.shape[2]), dtype=values_in.dtype)
+    if out_arr.dtype == np.float32:
+        values32, cps32, out32 = values_in, cps_in, out_arr
+        with nogil:
+            banded_all(values32, spans, cps32, out32, threads)
+    elif out_arr.dtype == np.float64:
+        values64, cps64, out64 = values_in, cps_in, out_arr
+        with nogil:
+            banded_all(values64, spans, cps64, out64, threads)
+    else:
+        raise ValueError('dtype must be float32 or float64')
+    return out_arr
 
 
 @cython.boundscheck(False) # turn off bounds-checking for entire function
+@cython.wraparound(False)
 def snap(np.ndarray[np.float_t, ndim=1] knots_in,
          np.ndarray[np.float_t, ndim=1] eval_t_in,
          np.float_t tolerance):
@@ -134,14 +568,184 @@ def snap(np.ndarray[np.float_t, ndim=1] knots_in,
     :param tolerance_in: Knot tolerance for detecting end-point-evaluations
     """
     # wrap everything into c-type datastructures for optimized performance
-    cdef unsigned int i,j
+    cdef unsigned int i = 0
+    cdef unsigned int j
     cdef unsigned int  n     = len(knots_in)
     cdef np.float_t[:] t     = eval_t_in
     cdef np.float_t[:] knots = knots_in
+    cdef bint sweep          = is_sorted(t)
     for j in range(len(t)):
-        i = my_bisect_left(knots, t[j], n)
+        if sweep:
+            i = sweep_left(knots, t[j], i)
+        else:
+            i = my_bisect_left(knots, t[j], n)
         if i < n and abs(knots[i]-t[j]) < tolerance:
             t[j] = knots[i]
         elif i > 0 and abs(knots[i-1]-t[j]) < tolerance:
             t[j] = knots[i-1]
 
+
+@cython.boundscheck(False) # turn off bounds-checking for entire function
+@cython.wraparound(False)
+def knot_insertion(np.ndarray[np.float_t, ndim=1] old_knots_in,
+                   np.ndarray[np.float_t, ndim=1] new_knots_in,
+                   unsigned int p,
+                   unsigned int first,
+                   unsigned int count,
+                   np.float_t tol):
+    """  Compute the knot insertion coefficients for refining one knot vector
+    into another (the Oslo algorithm).
+
+    Row *i* expresses the new basis function starting at new knot *first+i*
+    in terms of the old basis functions. Its at most *p* nonzero coefficients
+    are the discrete B-splines, found by running the Cox-de Boor triangle
+    with the new knots *first+i+1*, ..., *first+i+p-1* as arguments at the
+    successive levels.
+
+    :param old_knots_in:   Old knot vector
+    :param new_knots_in:   New knot vector, containing all the old knots
+    :param p:              Parametrization order (polyonomial degree + 1)
+    :param first:          Index of the first new basis function to compute
+    :param count:          Number of new basis functions to compute
+    :param tol:            Knot tolerance for matching new knots to old ones
+    :return: A *count* × *p* array of coefficients, and an array of length
+        *count* of the index of the first old function each row refers to
+    """
+    cdef np.float_t[:] knots     = old_knots_in
+    cdef np.float_t[:] new_knots = new_knots_in
+    cdef unsigned int n_knots    = len(old_knots_in)
+    cdef unsigned int last_mu
+    cdef unsigned int i, q, mu, lo
+    cdef np.float_t x
+
+    values_out = np.zeros((count, p), dtype=float)
+    spans_out  = np.zeros(count, dtype=np.intp)
+    cdef np.float_t[:,:] values = values_out
+    cdef np.intp_t[:] spans     = spans_out
+    cdef np.float_t* M
+
+    with nogil:
+        # the last knot span of positive length
+        last_mu = my_bisect_left(knots, knots[n_knots-1], n_knots)
+        for i in range(count):
+            # the knot span starting at the first knot of the new function
+            x  = new_knots[first+i]
+            lo = my_bisect_left(knots, x, n_knots)
+            if lo < n_knots and fabs(knots[lo] - x) < tol:
+                x = knots[lo]
+            mu = min(my_bisect_right(knots, x, n_knots), last_mu)
+            M = &values[i, 0]
+            M[p-1] = 1
+            for q in range(1, p):
+                basis_level(knots, p, mu, new_knots[first+i+q], q, M)
+            spans[i] = mu - p
+    return values_out, spans_out
+
+
+@cython.boundscheck(False) # turn off bounds-checking for entire function
+@cython.wraparound(False)
+@cython.cdivision(True)
+def raise_order(np.ndarray[np.float_t, ndim=2] P_in,
+                np.ndarray[np.float_t, ndim=1] knots_in,
+                np.ndarray[np.float_t, ndim=1] new_knots_in,
+                unsigned int k,
+                unsigned int m,
+                np.ndarray[np.intp_t, ndim=1] z_in):
+    """  Degree elevation of splines on an open knot vector, by the method in
+    "Efficient Degree Elevation and Knot Insertion for B-spline Curves using
+    Derivatives" by Qi-Xing Huang, Shi-Min Hu and Ralph R Martin.
+
+    All columns of *P_in* (the fibres) are elevated together, and the inner
+    loops run over these. Only two derivative levels are kept in memory at a
+    time.
+
+    :param P_in:           Coefficients, one row per basis function
+    :param knots_in:       Knot vector
+    :param new_knots_in:   Knot vector of the elevated basis
+    :param k:              Parametrization order (polyonomial degree + 1)
+    :param m:              Number of degree elevations
+    :param z_in:           Knot multiplicities, for each unique knot
+    :return: Coefficients in the elevated basis, one row per basis function
+    """
+    cdef np.float_t[:,:] P   = P_in
+    cdef np.float_t[:] T     = knots_in
+    cdef np.float_t[:] Tb    = new_knots_in
+    cdef np.intp_t[:] z      = z_in
+    cdef unsigned int n1     = P_in.shape[0]            # number of old functions
+    cdef unsigned int F      = P_in.shape[1]            # number of fibres
+    cdef unsigned int nb1    = len(new_knots_in) - k - m  # number of new functions
+    cdef unsigned int S      = len(z_in) - 1            # number of knot spans
+    cdef unsigned int i, l, j, p, f, r, idx
+    cdef np.float_t c
+
+    # beta[p]: the old function which is the first one nonzero on span p
+    beta_in = np.zeros(S, dtype=np.intp)
+    beta_in[1:] = np.cumsum(z_in[1:S])
+    l_arr = np.arange(1, k)
+    alpha_in = np.ones(k)
+    alpha_in[1:] = np.cumprod((k - l_arr) / (k + m - l_arr))
+    cdef np.intp_t[:] beta    = beta_in
+    cdef np.float_t[:] alpha  = alpha_in
+
+    lower_in = np.array(P_in)
+    upper_in = np.zeros((n1, F))
+    boundary_in = np.zeros((S, k, F))
+    cdef np.float_t[:,:] lower      = lower_in
+    cdef np.float_t[:,:] upper      = upper_in
+    cdef np.float_t[:,:,:] boundary = boundary_in
+    cdef np.float_t[:,:] tmp
+
+    with nogil:
+        # Step 1: Find the derivative coefficients Pt_i^l, and keep those of
+        # the first function on each knot span
+        for l in range(k):
+            if l > 0:
+                tmp = upper
+                upper = lower
+                lower = tmp
+                for i in range(n1):
+                    if i + l < n1 and T[i+l] < T[i+k]:
+                        c = 1.0 / (T[i+k] - T[i+l])
+                        for f in range(F):
+                            lower[i,f] = (upper[i+1,f] - upper[i,f]) * c
+                    else:
+                        for f in range(F):
+                            lower[i,f] = 0
+            for p in range(S):
+                if beta[p] < n1:
+                    for f in range(F):
+                        boundary[p,l,f] = alpha[l] * lower[beta[p],f]
+
+    upper_in = np.zeros((nb1, F))
+    lower_in = np.zeros((nb1, F))
+    upper = upper_in
+    lower = lower_in
+
+    with nogil:
+        # Steps 3 and 4: Set the boundary values of Qt_i^j, and find the rest
+        # by integrating from the highest derivative down
+        for j in range(k-1, -1, -1):
+            if j < k-1:
+                tmp = upper
+                upper = lower
+                lower = tmp
+                for i in range(nb1):
+                    for f in range(F):
+                        lower[i,f] = 0
+            for p in range(S):
+                if j >= k - z[p]:
+                    idx = beta[p] + p*m
+                    for f in range(F):
+                        lower[idx,f] = boundary[p,j,f]
+                    if j == k-1:
+                        for r in range(1, m+1):
+                            for f in range(F):
+                                lower[idx+r,f] = boundary[p,j,f]
+            if j == k-1:
+                continue
+            for i in range(nb1-1):
+                if Tb[i+k+m] > Tb[i+j+1]:
+                    c = Tb[i+k+m] - Tb[i+j+1]
+                    for f in range(F):
+                        lower[i+1,f] = lower[i,f] + c * upper[i,f]
+    return np.asarray(lower)
@@ -0,0 +1,364 @@
+# -*- coding: utf-8 -*-
+
+"""Bounding volume hierarchies over the elements of spline objects."""
+
+import numpy as np
+
+from . import state
+
+__all__ = ['BoundingVolumeHierarchy']
+
+
+def _morton(centers, bits):
+    """Morton (Z-order) codes of points in the unit cube."""
+    cells = np.clip((centers * (1 << bits)).astype(np.int64), 0, (1 << bits) - 1)
+    dim = centers.shape[1]
+    codes = np.zeros(len(centers), dtype=np.int64)
+    for b in range(bits):
+        for i in range(dim):
+            codes |= ((cells[:, i] >> b) & 1) << (b * dim + i)
+    return codes
+
+
+class BoundingVolumeHierarchy(object):
+    """BoundingVolumeHierarchy()
+
+    A tree of axis-aligned bounding boxes over the (Bezier) elements of one or
+    more spline objects, for spatial queries on many points at once.
+
+    The elements are ordered along a space-filling curve and grouped in
+    leaves of a few elements each, and the leaves are paired level by level
+    up to the root. All queries descend the tree for all query points at
+    once, and return the pairs of query points and elements which are not
+    ruled out by the boxes. The *refining* queries
+    (:func:`closest_point`, :func:`contains` and :func:`intersect_rays`)
+    then run Newton iteration on the candidate elements only.
+
+    Elements are numbered patch by patch, and in row-major order within each
+    patch. Build a hierarchy with :func:`splipy.SplineObject.bvh` or
+    :func:`splipy.SplineModel.bvh`, which keep it until the object changes.
+    """
+
+    def __init__(self, objects, leaf_size=4):
+        """  Construct a hierarchy over the elements of the given objects.
+
+        :param [SplineObject] objects: Objects with the same physical dimension
+        :param int leaf_size: Number of elements in each leaf
+        """
+        self.objects = list(objects)
+        self.dimension = self.objects[0].dimension
+        if any(obj.dimension != self.dimension for obj in self.objects):
+            raise ValueError('Objects must have the same dimension')
+
+        # element boxes, and the parametric box of each element. The first
+        # Bezier control point (a corner) lies on the object, and serves as an
+        # anchor.
+        boxes, anchors, patches, lower, upper = [], [], [], [], []
+        for i, obj in enumerate(self.objects):
+            boxes.append(obj.element_bounds())
+            cps = obj.element_controlpoints()
+            cps = cps.reshape(-1, int(np.prod(cps.shape[obj.pardim:-1])), cps.shape[-1])[:, 0]
+            if obj.rational:
+                cps = cps[..., :-1] / cps[..., -1:]
+            anchors.append(cps)
+            patches.append(np.full(len(cps), i))
+
+            knots = [np.array(b.knot_spans()) for b in obj.bases]
+            grid = np.meshgrid(*(k[:-1] for k in knots), indexing='ij')
+            lower.append(np.stack([g.ravel() for g in grid], axis=1))
+            grid = np.meshgrid(*(k[1:] for k in knots), indexing='ij')
+            upper.append(np.stack([g.ravel() for g in grid], axis=1))
+
+        self.boxes = np.concatenate(boxes)
+        self.anchors = np.concatenate(anchors)
+        self.patches = np.concatenate(patches)
+        self.offsets = np.cumsum([0] + [len(p) for p in patches])
+        self._param_lower = lower
+        self._param_upper = upper
+
+        # order the elements along a space-filling curve
+        centers = self.boxes.mean(axis=2)
+        low, high = centers.min(axis=0), centers.max(axis=0)
+        scaled = (centers - low) / np.where(high > low, high - low, 1)
+        self.order = np.argsort(_morton(scaled, min(21, 63 // self.dimension)), kind='stable')
+        self.leaf_size = leaf_size
+
+        # leaf boxes, and then every level of the tree up to the root
+        sorted_boxes = self.boxes[self.order]
+        starts = np.arange(0, len(sorted_boxes), leaf_size)
+        levels = [(np.minimum.reduceat(sorted_boxes[..., 0], starts),
+                   np.maximum.reduceat(sorted_boxes[..., 1], starts),
+                   self.anchors[self.order[starts]])]
+        while len(levels[0][0]) > 1:
+            lo, hi, anchors = levels[0]
+            starts = np.arange(0, len(lo), 2)
+            levels.insert(0, (np.minimum.reduceat(lo, starts), np.maximum.reduceat(hi, starts), anchors[starts]))
+        self.levels = levels
+
+    def __len__(self):
+        return len(self.boxes)
+
+    def _traverse(self, n, test):
+        """Descend the tree for *n* queries. The function *test(q, lower, upper,
+        anchors)* is called for arrays of query indices, boxes and points on the
+        objects within the boxes, and selects the pairs to keep. Returns pairs
+        of query and element indices."""
+        queries = np.arange(n)
+        nodes = np.zeros(n, dtype=int)
+        lo, hi, anchors = self.levels[0]
+        keep = test(queries, lo[nodes], hi[nodes], anchors[nodes])
+        queries, nodes = queries[keep], nodes[keep]
+
+        for lo, hi, anchors in self.levels[1:]:
+            queries = np.repeat(queries, 2)
+            nodes = (2 * nodes[:, None] + np.arange(2)).ravel()
+            valid = nodes < len(lo)
+            queries, nodes = queries[valid], nodes[valid]
+            keep = test(queries, lo[nodes], hi[nodes], anchors[nodes])
+            queries, nodes = queries[keep], nodes[keep]
+
+        # finally the elements in each leaf
+        queries = np.repeat(queries, self.leaf_size)
+        slots = (self.leaf_size * nodes[:, None] + np.arange(self.leaf_size)).ravel()
+        valid = slots < len(self.order)
+        queries, elements = queries[valid], self.order[slots[valid]]
+        keep = test(queries, self.boxes[elements, :, 0], self.boxes[elements, :, 1], self.anchors[elements])
+        return queries[keep], elements[keep]
+
+    def element(self, index):
+        """  Locate elements of the hierarchy.
+
+        :param index: Element number(s)
+        :type index: int or [int]
+        :return: The patch number, and the lower and upper parametric corners
+            of each element
+        :rtype: (numpy.array, numpy.array, numpy.array)
+        """
+        index = np.asarray(index)
+        patches = self.patches[index]
+        local = index - self.offsets[patches]
+        pardim = max(obj.pardim for obj in self.objects)
+        lower = np.zeros(index.shape + (pardim,))
+        upper = np.zeros(index.shape + (pardim,))
+        for i, obj in enumerate(self.objects):
+            mask = patches == i
+            lower[mask, :obj.pardim] = self._param_lower[i][local[mask]]
+            upper[mask, :obj.pardim] = self._param_upper[i][local[mask]]
+        return patches, lower, upper
+
+    def query(self, points, tol=0.0):
+        """  Find the elements whose boxes contain the given points.
+
+        :param numpy.array points: An *n* × *dim* array of points
+        :param float tol: Amount to grow the boxes by
+        :return: Pairs of point and element indices
+        :rtype: (numpy.array, numpy.array)
+        """
+        points = np.reshape(np.asarray(points, dtype=float), (-1, self.dimension))
+
+        def test(q, lo, hi, anchors):
+            x = points[q]
+            return np.all((lo - tol <= x) & (x <= hi + tol), axis=1)
+
+        return self._traverse(len(points), test)
+
+    def query_nearest(self, points):
+        """  Find the elements which may contain the points on the objects
+        closest to the given points. An element is a candidate unless its box
+        is farther away than some known point on the objects.
+
+        :param numpy.array points: An *n* × *dim* array of points
+        :return: Pairs of point and element indices
+        :rtype: (numpy.array, numpy.array)
+        """
+        points = np.reshape(np.asarray(points, dtype=float), (-1, self.dimension))
+        bound = np.full(len(points), np.inf)
+
+        def test(q, lo, hi, anchors):
+            x = points[q]
+            near = np.sum((x - np.clip(x, lo, hi))**2, axis=1)
+            np.minimum.at(bound, q, np.sum((x - anchors)**2, axis=1))
+            return near <= bound[q]
+
+        return self._traverse(len(points), test)
+
+    def query_rays(self, origins, directions):
+        """  Find the elements whose boxes are hit by the given rays.
+
+        :param numpy.array origins: An *n* × *dim* array of ray origins
+        :param numpy.array directions: An *n* × *dim* array of ray directions
+        :return: Pairs of ray and element indices, and the distance (in units
+            of the direction) along the ray to where it enters each box
+        :rtype: (numpy.array, numpy.array, numpy.array)
+        """
+        origins = np.reshape(np.asarray(origins, dtype=float), (-1, self.dimension))
+        directions = np.reshape(np.asarray(directions, dtype=float), (-1, self.dimension))
+        with np.errstate(divide='ignore'):
+            inverse = 1 / directions
+
+        def entry(q, lo, hi):
+            with np.errstate(invalid='ignore'):
+                t0 = (lo - origins[q]) * inverse[q]
+                t1 = (hi - origins[q]) * inverse[q]
+            # rays parallel to a slab are inside it, or miss it entirely
+            parallel = directions[q] == 0
+            inside = (lo <= origins[q]) & (origins[q] <= hi)
+            t0 = np.where(parallel, np.where(inside, -np.inf, np.inf), t0)
+            t1 = np.where(parallel, np.where(inside, np.inf, -np.inf), t1)
+            return np.max(np.minimum(t0, t1), axis=1), np.min(np.maximum(t0, t1), axis=1)
+
+        def test(q, lo, hi, anchors):
+            near, far = entry(q, lo, hi)
+            return (near <= far) & (far >= 0)
+
+        rays, elements = self._traverse(len(origins), test)
+        near = entry(rays, self.boxes[elements, :, 0], self.boxes[elements, :, 1])[0]
+        return rays, elements, np.maximum(near, 0)
+
+    def closest_point(self, points, **kwargs):
+        """  Find the closest points on the objects to the given points.
+
+        Among the candidate elements of :func:`query_nearest`, the one with the
+        nearest anchor in each patch is refined by
+        :func:`splipy.SplineObject.invert`, starting from the center of the
+        element. The Newton iteration is free to leave the element, so each
+        point is only refined once per nearby patch.
+
+        :param numpy.array points: An *n* × *dim* array of points
+        :param kwargs: Passed on to :func:`splipy.SplineObject.invert`
+        :return: The patch number, parametric values and distance of the
+            closest point to each of the points
+        :rtype: (numpy.array, numpy.array, numpy.array)
+        """
+        points = np.reshape(np.asarray(points, dtype=float), (-1, self.dimension))
+        queries, elements = self.query_nearest(points)
+
+        def best(groups, distance):
+            order = np.lexsort((distance, groups))
+            return order[np.flatnonzero(np.diff(groups[order], prepend=-1))]
+
+        anchor = np.sum((points[queries] - self.anchors[elements])**2, axis=1)
+        first = best(queries * len(self.objects) + self.patches[elements], anchor)
+        queries, elements = queries[first], elements[first]
+        patches, params, distance = self._refine(points, queries, elements, **kwargs)
+
+        # keep the best patch for each point
+        first = best(queries, distance)
+        return patches[first], params[first], distance[first]
+
+    def contains(self, points, tol=None):
+        """  Test whether the given points are inside the objects. The objects
+        must fill space, i.e. have the same parametric and physical dimension.
+
+        :param numpy.array points: An *n* × *dim* array of points
+        :param float tol: Largest distance to the objects of points that are
+            considered inside. Defaults to
+            :data:`splipy.state.controlpoint_absolute_tolerance`.
+        :return: Whether each point is inside, the patch number and the
+            parametric values (undefined for points outside)
+        :rtype: (numpy.array, numpy.array, numpy.array)
+        """
+        if any(obj.pardim != self.dimension for obj in self.objects):
+            raise ValueError('Objects do not fill space')
+        if tol is None:
+            tol = state.controlpoint_absolute_tolerance
+
+        points = np.reshape(np.asarray(points, dtype=float), (-1, self.dimension))
+        queries, elements = self.query(points, tol)
+        patches, params, distance = self._refine(points, queries, elements)
+
+        inside = np.zeros(len(points), dtype=bool)
+        patch = np.zeros(len(points), dtype=int)
+        result = np.zeros((len(points), self.dimension))
+        hit = distance <= tol
+        inside[queries[hit]] = True
+        patch[queries[hit]] = patches[hit]
+        result[queries[hit]] = params[hit]
+        return inside, patch, result
+
+    def _refine(self, points, queries, elements, **kwargs):
+        """Invert the points *queries* on the *elements*, starting from their
+        centers, and return the patch numbers, parametric values and
+        distances."""
+        patches, lower, upper = self.element(elements)
+        params = (lower + upper) / 2
+        distance = np.zeros(len(queries))
+        for i, obj in enumerate(self.objects):
+            mask = np.flatnonzero(patches == i)
+            if not mask.size:
+                continue
+            u = obj.invert(points[queries[mask]], initial_guess=params[mask, :obj.pardim], **kwargs)
+            params[mask, :obj.pardim] = u
+            x = obj.evaluate(*u.T, tensor=False)
+            distance[mask] = np.linalg.norm(x - points[queries[mask]], axis=1)
+        return patches, params, distance
+
+    def intersect_rays(self, origins, directions, tol=None, maxiter=50):
+        """  Find the first intersection of the given rays with the objects,
+        which must be surfaces in 3D (or curves in 2D).
+
+        Newton iteration solves *X(u) = o + t d* on the candidate elements of
+        :func:`query_rays`, starting from the center of each element.
+
+        :param numpy.array origins: An *n* × *dim* array of ray origins
+        :param numpy.array directions: An *n* × *dim* array of ray directions
+        :param float tol: Convergence tolerance. Defaults to
+            :data:`splipy.state.controlpoint_absolute_tolerance`.
+        :param int maxiter: Maximal number of Newton iterations
+        :return: Whether each ray hits, the patch number, the parametric values
+            and the distance *t* along the ray (in units of the direction) of
+            the first hit. Values for rays that miss are undefined.
+        :rtype: (numpy.array, numpy.array, numpy.array, numpy.array)
+        """
+        if any(obj.pardim != self.dimension - 1 for obj in self.objects):
+            raise ValueError('Ray intersections need objects of codimension one')
+        if tol is None:
+            tol = state.controlpoint_absolute_tolerance
+
+        origins = np.reshape(np.asarray(origins, dtype=float), (-1, self.dimension))
+        directions = np.reshape(np.asarray(directions, dtype=float), (-1, self.dimension))
+        rays, elements, near = self.query_rays(origins, directions)
+        patches, lower, upper = self.element(elements)
+        params = (lower + upper) / 2
+        distance = np.full(len(rays), np.inf)
+
+        for i, obj in enumerate(self.objects):
+            mask = np.flatnonzero(patches == i)
+            if not mask.size:
+                continue
+            # each candidate only looks for hits on its own element
+            start, end = lower[mask, :obj.pardim], upper[mask, :obj.pardim]
+            o, d = origins[rays[mask]], directions[rays[mask]]
+            u = params[mask, :obj.pardim]
+            t = near[mask].copy()
+            first = [tuple(int(i == j) for j in range(obj.pardim)) for i in range(obj.pardim)]
+            active = np.arange(len(mask))
+            for _ in range(maxiter):
+                if not active.size:
+                    break
+                jet = obj.jet(*u[active].T, d=1, tensor=False)
+                r = jet[(0,) * obj.pardim] - o[active] - t[active, None] * d[active]
+                J = np.concatenate([np.stack([jet[k] for k in first], axis=2), -d[active, :, None]], axis=2)
+                # regularize rays tangent to the surface
+                H = np.einsum('mdi,mdj->mij', J, J)
+                H += (1e-12 * np.trace(H, axis1=1, axis2=2) + 1e-300)[:, None, None] * np.eye(obj.pardim + 1)
+                step = -np.linalg.solve(H, np.einsum('mdi,md->mi', J, r)[..., None])[..., 0]
+                u[active] = np.clip(u[active] + step[:, :-1], start[active], end[active])
+                t[active] += step[:, -1]
+                active = active[np.linalg.norm(step, axis=1) > tol]
+
+            x = obj.evaluate(*u.T, tensor=False)
+            hit = (np.linalg.norm(x - o - t[:, None] * d, axis=1) <= tol) & (t >= 0)
+            params[mask, :obj.pardim] = u
+            distance[mask] = np.where(hit, t, np.inf)
+
+        # keep the nearest hit for each ray
+        result = np.full(len(origins), np.inf)
+        np.minimum.at(result, rays, distance)
+        best = np.flatnonzero((distance == result[rays]) & np.isfinite(distance))
+        best = best[np.unique(rays[best], return_index=True)[1]]
+        patch = np.zeros(len(origins), dtype=int)
+        u = np.zeros((len(origins), params.shape[1]))
+        patch[rays[best]] = patches[best]
+        u[rays[best]] = params[best]
+        return np.isfinite(result), patch, u, result
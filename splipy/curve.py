@@ -1,12 +1,13 @@
 # -*- coding: utf-8 -*-
 
 from itertools import chain
-from bisect import bisect_left, bisect_right
 
 import numpy as np
 import scipy.sparse.linalg as splinalg
+from scipy.interpolate import PchipInterpolator
 
 from .basis import BSplineBasis
+from . import state
 from .splineobject import SplineObject
 from .utils import ensure_listlike, is_singleton
 
@@ -34,7 +35,7 @@ class Curve(SplineObject):
         """
         super(Curve, self).__init__([basis], controlpoints, rational, **kwargs)
 
-    def evaluate(self, *params):
+    def evaluate(self, *params, **kwargs):
         """  Evaluate the object at given parametric values.
 
         This function returns an *n1* × *n2* × ... × *dim* array, where *ni* is
@@ -46,25 +47,32 @@ class Curve(SplineObject):
 
         :param u,v,...: Parametric coordinates in which to evaluate
         :type u,v,...: float or [float]
+        :param dtype: Floating point type of the computation and the result,
+            float32 or float64
+        :param int workers: Number of threads to evaluate on. Use *None* for
+            one per available core.
         :return: Geometry coordinates
         :rtype: numpy.array
         """
         squeeze = is_singleton(params[0])
         params = [ensure_listlike(p) for p in params]
+        dtype = kwargs.get('dtype', float)
+
+        workers = kwargs.pop('workers', 1)
+        if workers != 1 and not squeeze:
+            return self._evaluate_blocks(self.evaluate, params, workers, kwargs)
 
         self._validate_domain(*params)
 
         # Evaluate the derivatives of the corresponding bases at the corresponding points
         # and build the result array
-        N = self.bases[0].evaluate(params[0], sparse=True)
-        result = N @ self.controlpoints
+        N = self.bases[0].evaluate_local(params[0], dtype=dtype)
+        result = N.dot(self.controlpoints.astype(dtype, copy=False))
 
         # For rational objects, we divide out the weights, which are stored in the
         # last coordinate
         if self.rational:
-            for i in range(self.dimension):
-                result[..., i] /= result[..., -1]
-            result = np.delete(result, self.dimension, -1)
+            result = result[..., :-1] / result[..., -1:]
 
         # Squeeze the singleton dimensions if we only have one point
         if squeeze:
@@ -72,7 +80,7 @@ class Curve(SplineObject):
 
         return result
 
-    def derivative(self, t, d=1, above=True, tensor=True):
+    def derivative(self, t, d=1, above=True, tensor=True, dtype=float, workers=1):
         """  Evaluate the derivative of the curve at the given parametric values.
 
         This function returns an *n* × *dim* array, where *n* is the number of
@@ -86,43 +94,16 @@ class Curve(SplineObject):
         :param int d: Number of derivatives to compute
         :param bool above: Evaluation in the limit from above
         :param bool tensor: Not used in this method
+        :param dtype: Floating point type of the computation and the result,
+            float32 or float64
+        :param int workers: Number of threads to evaluate on. Use *None* for
+            one per available core.
         :return: Derivative array
         :rtype: numpy.array
         """
         if not is_singleton(d):
             d = d[0]
-        if not self.rational or d < 2 or d > 3:
-            return super(Curve, self).derivative(t, d=d, above=above, tensor=tensor)
-
-        t = ensure_listlike(t)
-        result = np.zeros((len(t), self.dimension))
-
-        d2 = np.array(self.bases[0].evaluate(t, 2, above) @ self.controlpoints)
-        d1 = np.array(self.bases[0].evaluate(t, 1, above) @ self.controlpoints)
-        d0 = np.array(self.bases[0].evaluate(t) @ self.controlpoints)
-        W  = d0[:, -1]  # W(t)
-        W1 = d1[:, -1]  # W'(t)
-        W2 = d2[:, -1]  # W''(t)
-        if d == 2:
-            for i in range(self.dimension):
-                result[:, i] = (d2[:, i] * W * W - 2 * W1 *
-                               (d1[:, i] * W - d0[:, i] * W1) - d0[:, i] * W2 * W) / W / W / W
-        if d == 3:
-            d3 = np.array(self.bases[0].evaluate(t, 3, above) @ self.controlpoints)
-            W3 = d3[:,-1]    # W'''(t)
-            W6 = W*W*W*W*W*W # W^6
-            for i in range(self.dimension):
-                H  =  d1[:,i]*W                           - d0[:,i]*W1
-                H1 =  d2[:,i]*W                           - d0[:,i]*W2
-                H2 =  d3[:,i]*W + d2[:,i]*W1 - d1[:,i]*W2 - d0[:,i]*W3
-                G  =  H1*W - 2*H*W1
-                G1 =  H2*W - 2*H*W2 - H1*W1
-                result[:, i] = (G1*W - 3*G*W1) /W/W/W/W
-
-        if result.shape[0] == 1:  # in case of single value input t, return vector instead of matrix
-            result = np.array(result[0, :]).reshape(self.dimension)
-
-        return result
+        return super(Curve, self).derivative(t, d=d, above=above, tensor=tensor, dtype=dtype, workers=workers)
 
     def binormal(self, t, above=True):
         """  Evaluate the normalized binormal of the curve at the given parametric value(s).
@@ -144,8 +125,9 @@ class Curve(SplineObject):
             raise ValueError('Binormals require dimension = 3')
 
         # compute derivative
-        dx    = self.derivative(t, d=1, above=above)
-        ddx   = self.derivative(t, d=2, above=above)
+        jet   = self.jet(t, d=2, above=above)
+        dx    = jet[(1,)]
+        ddx   = jet[(2,)]
 
         # in case of vanishing acceleration, colinear velocity and acceleration,
         # such as linear curves we guess an appropriate binbormal (multiple choice available)
@@ -212,8 +194,9 @@ class Curve(SplineObject):
         :rtype: numpy.array
         """
         # compute derivative
-        v = self.derivative(t, d=1, above=above)
-        a = self.derivative(t, d=2, above=above)
+        jet = self.jet(t, d=2, above=above)
+        v = jet[(1,)]
+        a = jet[(2,)]
         w = np.cross(v,a)
 
         if len(v.shape) == 1: # single evaluation point
@@ -254,9 +237,10 @@ class Curve(SplineObject):
             raise ValueError('dimension must be 2 or 3')
 
         # compute derivative
-        v  = self.derivative(t, d=1, above=above)
-        a  = self.derivative(t, d=2, above=above)
-        da = self.derivative(t, d=3, above=above)
+        jet = self.jet(t, d=3, above=above)
+        v  = jet[(1,)]
+        a  = jet[(2,)]
+        da = jet[(3,)]
         w = np.cross(v,a)
 
         if len(v.shape) == 1: # single evaluation point
@@ -276,23 +260,7 @@ class Curve(SplineObject):
         """
         if amount < 0:
             raise ValueError('Raise order requires a non-negative parameter')
-        elif amount == 0:
-            return
-
-        # create the new basis
-        newBasis = self.bases[0].raise_order(amount)
-
-        # set up an interpolation problem. This is in projective space, so no problems for rational cases
-        interpolation_pts_t = newBasis.greville()  # parametric interpolation points (t)
-        N_old = self.bases[0].evaluate(interpolation_pts_t)
-        N_new = newBasis.evaluate(interpolation_pts_t, sparse=True)
-        interpolation_pts_x = N_old @ self.controlpoints  # projective interpolation points (x,y,z,w)
-
-        # solve the interpolation problem
-        self.controlpoints = np.array(splinalg.spsolve(N_new, interpolation_pts_x))
-        self.bases = [newBasis]
-
-        return self
+        return super(Curve, self).raise_order(amount)
 
     def append(self, curve):
         """  Extend the curve by merging another curve to the end of it.
@@ -357,33 +325,159 @@ class Curve(SplineObject):
     def get_kinks(self):
         """  Get the parametric coordinates at all points which have C0-
         continuity"""
-        return [k for k in self.knots(0) if self.continuity(k)<1]
+        knots = np.array(self.knots(0))
+        return knots[self.continuity(knots) < 1].tolist()
 
-    def length(self, t0=None, t1=None):
+    def length(self, t0=None, t1=None, tol=None, full_output=False):
         """ Computes the euclidian length of the curve in geometric space
 
         .. math:: \\int_{t_0}^{t_1}\\sqrt{x(t)^2 + y(t)^2 + z(t)^2} dt
 
+        The whole length is computed by Gauss quadrature on every knot span,
+        or adaptively if a tolerance is given (see
+        :func:`splipy.SplineObject.integrate`). Partial lengths are looked up
+        with :func:`arclength`.
+
+        :param float t0: Start of the interval
+        :param float t1: End of the interval
+        :param float tol: Absolute tolerance
+        :param bool full_output: Also return the estimated error and the number
+            of evaluations (whole length only)
+        :return: The length, and optionally the error and the number of
+            evaluations
+        :rtype: float or tuple
         """
-        (x,w) = np.polynomial.legendre.leggauss(self.order(0)+1)
-        knots = self.knots(0)
-        # keep only integration boundaries within given start (t0) and stop (t1) interval
-        if t0 is not None:
-            i = bisect_left(knots, t0)
-            knots = np.insert(knots, i, t0)
-            knots = knots[i:]
-        if t1 is not None:
-            i = bisect_right(knots, t1)
-            knots = knots[:i]
-            knots = np.insert(knots, i, t1)
-
-        t = np.array([ (x+1)/2*(t1-t0)+t0 for t0,t1 in zip(knots[:-1], knots[1:]) ])
-        w = np.array([     w/2*(t1-t0)    for t0,t1 in zip(knots[:-1], knots[1:]) ])
-        t = np.ndarray.flatten(t)
-        w = np.ndarray.flatten(w)
-        dx = self.derivative(t)
-        detJ = np.sqrt(np.sum(dx**2, axis=1))
-        return np.dot(detJ, w)
+        if t0 is None and t1 is None:
+            return self.integrate(lambda t, dx: np.linalg.norm(dx, axis=1), derivatives=1,
+                                  tol=tol, full_output=full_output)
+        if full_output:
+            raise ValueError('full_output is only available for the whole length')
+
+        t0 = self.start(0) if t0 is None else t0
+        t1 = self.end(0) if t1 is None else t1
+        return float(self.arclength(t1, tol) - self.arclength(t0, tol))
+
+    def arclength(self, t, tol=None):
+        """  Computes the arc length of the curve from the start of the
+        parametric domain to the given parametric values.
+
+        The length is looked up in a table of cumulative lengths, which is
+        computed once (until the curve is modified) by adaptive Gauss
+        quadrature, and completed by Gauss quadrature from the nearest table
+        entry. All values are computed at once.
+
+        :param t: Parametric value(s)
+        :type t: float or [float]
+        :param float tol: Absolute accuracy of the table. Defaults to
+            :data:`splipy.state.controlpoint_absolute_tolerance`.
+        :return: Arc length(s)
+        :rtype: float or numpy.array
+        """
+        squeeze = is_singleton(t)
+        t = np.clip(np.array(ensure_listlike(t), dtype=float), self.start(0), self.end(0))
+        table = self._arclength_table(tol)
+        i = np.clip(np.searchsorted(table[0], t, side='right') - 1, 0, len(table[0]) - 2)
+        result = table[1][i] + self._gauss_length(table[0][i], t)
+        return result[0] if squeeze else result
+
+    def param_at_length(self, s, tol=None, maxiter=50):
+        """  Computes the parametric values at which the curve has the given arc
+        lengths from the start of the parametric domain. This is the inverse of
+        :func:`arclength`, so sampling with equidistant *s* gives points evenly
+        spaced along the curve.
+
+        .. code:: python
+
+           t = crv.param_at_length(np.linspace(0, crv.length(), 50))
+           x = crv(t)
+
+        Each value starts from a monotone interpolant of the arc length table,
+        and is then refined by Newton iteration, safeguarded by bisection.
+
+        :param s: Arc length(s), clamped to the length of the curve
+        :type s: float or [float]
+        :param float tol: Absolute accuracy of the arc length. Defaults to
+            :data:`splipy.state.controlpoint_absolute_tolerance`.
+        :param int maxiter: Maximal number of iterations
+        :return: Parametric value(s)
+        :rtype: float or numpy.array
+        """
+        if tol is None:
+            tol = state.controlpoint_absolute_tolerance
+        squeeze = is_singleton(s)
+        knots, lengths, inverse = self._arclength_table(tol)
+        s = np.clip(np.array(ensure_listlike(s), dtype=float), 0, lengths[-1])
+
+        # bracket each value by the table, and start from the interpolant
+        i = np.clip(np.searchsorted(lengths, s, side='right') - 1, 0, len(knots) - 2)
+        lower, upper = knots[i].copy(), knots[i+1].copy()
+        t = np.clip(inverse(s), lower, upper)
+
+        active = np.arange(len(s))
+        for _ in range(maxiter):
+            error = lengths[i[active]] + self._gauss_length(knots[i[active]], t[active]) - s[active]
+            done = np.abs(error) <= tol
+            active, error = active[~done], error[~done]
+            if len(active) == 0:
+                break
+            upper[active] = np.where(error > 0, t[active], upper[active])
+            lower[active] = np.where(error < 0, t[active], lower[active])
+            speed = np.linalg.norm(np.reshape(self.derivative(t[active]), (len(active), -1)), axis=1)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                step = t[active] - error / speed
+            bisect = ~((step > lower[active]) & (step < upper[active]))
+            t[active] = np.where(bisect, (lower[active] + upper[active]) / 2, step)
+
+        return t[0] if squeeze else t
+
+    def _gauss_length(self, t0, t1):
+        """The arc lengths between the parametric values *t0* and *t1*, which
+        are assumed to lie on the same polynomial piece."""
+        x, w = np.polynomial.legendre.leggauss(self.order(0) + 1)
+        h = (t1 - t0) / 2
+        t = ((t0 + h)[:, None] + h[:, None] * x).ravel()
+        dx = np.reshape(self.derivative(t), (len(t0), len(x), -1))
+        return np.linalg.norm(dx, axis=2).dot(w) * h
+
+    def _arclength_table(self, tol=None):
+        """Get the table of parametric values and cumulative arc lengths, and
+        a monotone interpolant of the inverse. Knot spans are bisected until
+        Gauss quadrature on each half agrees with the whole to within *tol*."""
+        if tol is None:
+            tol = state.controlpoint_absolute_tolerance
+        return self._cached(('arclength', tol), lambda: self._compute_arclength_table(tol))
+
+    def _compute_arclength_table(self, tol, maxlevels=30):
+        knots = np.array(self.knots(0), dtype=float)
+        left, right = knots[:-1], knots[1:]
+        done_left, done_right, done_length = [], [], []
+        for level in range(maxlevels):
+            middle = (left + right) / 2
+            whole = self._gauss_length(left, right)
+            halves = self._gauss_length(np.concatenate([left, middle]), np.concatenate([middle, right]))
+            halves = halves[:len(left)] + halves[len(left):]
+            done = (np.abs(whole - halves) <= tol / len(knots)) | (level == maxlevels - 1)
+            done_left.append(left[done])
+            done_right.append(right[done])
+            done_length.append(halves[done])
+            left, right = np.concatenate([left[~done], middle[~done]]), np.concatenate([middle[~done], right[~done]])
+            if len(left) == 0:
+                break
+
+        left = np.concatenate(done_left)
+        order = np.argsort(left)
+        knots = np.append(left[order], np.concatenate(done_right)[order][-1])
+        lengths = np.concatenate([[0], np.cumsum(np.concatenate(done_length)[order])])
+
+        # the inverse is interpolated through the distinct lengths only
+        keep = np.concatenate([[True], np.diff(lengths) > 0])
+        if np.count_nonzero(keep) > 1:
+            inverse = PchipInterpolator(lengths[keep], knots[keep])
+        else:
+            inverse = lambda s: np.full(np.shape(s), knots[0])
+        for array in (knots, lengths):
+            array.flags.writeable = False
+        return knots, lengths, inverse
 
     def rebuild(self, p, n):
         """  Creates an approximation to this curve by resampling it using a
@@ -440,18 +534,13 @@ class Curve(SplineObject):
             print('|| e ||_L2  = ', np.sqrt(np.sum(err2)))
             print('|| e ||_max = ', maxerr)
         """
-        knots = self.knots(0)
-        (x,w) = np.polynomial.legendre.leggauss(self.order(0)+1)
-        err2    = []
-        err_inf = 0.0
-        for t0,t1 in zip(knots[:-1], knots[1:]): # for all knot spans
-            tg  = (x+1)/2*(t1-t0)+t0 # evaluation points
-            wg  =   w  /2*(t1-t0)    # integration weights
-            error = self(tg) - target(tg)    # [x-xh, y-yh, z-zh]
-            error = np.sum(error**2, axis=1) # |x-xh|^2
-            err2.append(np.dot(error, wg))   # integrate over domain
-            err_inf = max(np.max(np.sqrt(error)), err_inf)
-        return (err2, err_inf)
+        err_inf = [0.0]
+        def squared_error(t, x):
+            error = np.sum((x - np.reshape(target(t[:,0]), x.shape))**2, axis=1)  # |x-xh|^2
+            err_inf[0] = max(err_inf[0], float(np.max(error)))
+            return error
+        err2 = self.integrate(squared_error, elementwise=True)  # integrate over each knot span
+        return (list(err2), float(np.sqrt(err_inf[0])))
 
     def __repr__(self):
         return str(self.bases[0]) + '\n' + str(self.controlpoints)
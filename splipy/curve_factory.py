@@ -503,7 +503,6 @@ def manipulate(crv, f, normalized=False, vectorized=False):
 
     b = crv.bases[0]
     t = np.array(b.greville())
-    n = len(crv)
 
     if vectorized:
         x = crv(t)
@@ -516,7 +515,7 @@ def manipulate(crv, f, normalized=False, vectorized=False):
             elif arg_names[j] == 't':
                 argv[j] = t
             elif arg_names[j] == 'v':
-                c0 = np.array([i for i in range(n) if b.continuity(t[i]) == 0])
+                c0 = np.flatnonzero(b.continuity(t) == 0)
                 v = crv.derivative(t, 1)
                 if len(c0)>0:
                     v[c0,:] = (v[c0,:] + crv.derivative(t[c0], 1, above=False)) / 2.0
@@ -524,7 +523,7 @@ def manipulate(crv, f, normalized=False, vectorized=False):
                     v[:] = [vel / norm(vel) for vel in v]
                 argv[j] = v
             elif arg_names[j] == 'a':
-                c1 = np.array([i for i in range(n) if b.continuity(t[i]) < 2])
+                c1 = np.flatnonzero(b.continuity(t) < 2)
                 a = crv.derivative(t, 2)
                 if len(c1)>0:
                     a[c1,:] = (a[c1,:] + crv.derivative(t[c1], 2, above=False)) / 2.0
@@ -74,6 +74,12 @@ class DiscontBoxMesh(object):
         ], dtype=object)
 
     def cell_at(self, x, guess=None):
+        # Accept a correct guess without searching
+        if guess is not None:
+            i, j, k = guess
+            if self.hull[i,j,k] is not None and self.hull[i,j,k].find_simplex(x) >= 0:
+                return i, j, k
+
         # First, find the 'tower' containing x
         check = -1
         last_i = last_j = 0
@@ -109,7 +115,8 @@ class DiscontBoxMesh(object):
         check = -1
         if guess is not None:
             _, _, k = guess
-            check = self.hull[i,j,k].find_simplex(x)
+            if self.hull[i,j,k] is not None:
+                check = self.hull[i,j,k].find_simplex(x)
             # if check > -1: print('correct cell!')
         if check == -1:
             for (i,j) in numb_hits:
@@ -313,16 +320,17 @@ class GRDECL(MasterIO):
 
         volume.reverse(direction=2)
 
-        # Point-to-cell mapping
-        # TODO: Optimize more
+        # Point-to-cell mapping. The cells of the continuous mesh, found by
+        # inverting all points at once, are used as guesses.
         eps = 1e-2
         u = [np.linspace(eps, 1-eps, n) for n in ntexture]
         points = volume(*u).reshape(-1, 3)
         cellids = np.zeros(points.shape[:-1], dtype=int)
-        cell = None
+        guesses = np.floor(self.get_c0_mesh().invert(points) * self.n).astype(int)
+        guesses = np.clip(guesses, 0, self.n - 1)
         nx, ny, nz = self.n
-        for ptid, point in enumerate(tqdm(points, desc='Inverse mapping')):
-            i, j, k = cell = self.raw.cell_at(point) # , guess=cell)
+        for ptid, (point, guess) in enumerate(zip(tqdm(points, desc='Inverse mapping'), guesses)):
+            i, j, k = self.raw.cell_at(point, guess=guess)
             cellid = i*ny*nz + j*nz + k
             cellids[ptid] = cellid
 
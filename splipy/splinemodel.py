@@ -7,7 +7,8 @@ from typing import Callable, Dict, List, Tuple, Any, Optional
 
 import numpy as np
 
-from .splineobject import SplineObject
+from .splineobject import SplineObject, _mass_properties
+from .bvh import BoundingVolumeHierarchy
 from .utils import check_section, sections, section_from_index, section_to_index, uniquify, is_right_hand
 from .utils import bisect
 from . import state
@@ -923,6 +924,40 @@ class SplineModel(object):
                     )
                 raise err
 
+    def bvh(self, leaf_size=4):
+        """  Get a bounding volume hierarchy over the elements of all patches of
+        the highest parametric dimension, numbered as returned by
+        :func:`splipy.splinemodel.ObjectCatalogue.top_nodes`. It is built on
+        demand, and kept until the patches change.
+
+        :param int leaf_size: Number of elements in each leaf
+        :return: Bounding volume hierarchy
+        :rtype: splipy.bvh.BoundingVolumeHierarchy
+        """
+        objs = [node.obj for node in self.catalogue.top_nodes()]
+        key = (leaf_size,) + tuple((id(obj), obj._state_key()) for obj in objs)
+        if getattr(self, '_bvh', None) is None or self._bvh[0] != key:
+            self._bvh = (key, BoundingVolumeHierarchy(objs, leaf_size))
+        return self._bvh[1]
+
+    def mass_properties(self, density=None, points=None):
+        """  Compute the mass, center of mass and inertia tensor of the union of
+        all patches of the highest parametric dimension (see
+        :func:`splipy.SplineObject.mass_properties`).
+
+        :param density: Constant density, or a function taking an *n* × *dim*
+            array of physical points and returning *n* values. Defaults to one.
+        :type density: float or function
+        :param points: Number of quadrature points per element, in each
+            direction
+        :type points: int or [int]
+        :return: The mass, the first moments, the center of mass and the
+            inertia tensor
+        :rtype: :class:`splipy.splineobject.MassProperties`
+        """
+        moments = [node.obj._mass_moments(density, points) for node in self.catalogue.top_nodes()]
+        return _mass_properties(*(sum(m[i] for m in moments) for i in range(3)))
+
     def generate_cp_numbers(self):
         index = 0
         for node in self.catalogue.top_nodes():
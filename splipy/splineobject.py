@@ -1,19 +1,34 @@
 # -*- coding: utf-8 -*-
 
 import numpy as np
+import scipy.sparse as sp
+import scipy.sparse.linalg as splinalg
+from scipy.spatial import cKDTree
 import copy
+import os
+from concurrent.futures import ThreadPoolExecutor
 from operator import attrgetter, methodcaller
-from itertools import chain, product
+from itertools import chain, count, product
+from collections import namedtuple
 from bisect import bisect_left
+from math import comb
 
-from .basis import BSplineBasis
+from .basis import BSplineBasis, LocalBasis
+from .bvh import BoundingVolumeHierarchy
+from . import basis_eval, state
 from .utils import (
     reshape, rotation_matrix, is_singleton, ensure_listlike,
     check_direction, ensure_flatlist, check_section, sections,
     raise_order_1D
 )
 
-__all__ = ['SplineObject']
+__all__ = ['SplineObject', 'MassProperties']
+
+# versions of the defining attributes of spline objects, unique across objects
+_versions = count(1)
+
+
+MassProperties = namedtuple('MassProperties', ['mass', 'moments', 'center', 'inertia'])
 
 
 def transpose_fix(pardim, direction):
@@ -22,18 +37,425 @@ def transpose_fix(pardim, direction):
     return tuple(ret)
 
 
+def _contract_tensor(N, cps, idx):
+    """Contract axis *idx* of *cps* with the basis *N*. The new axis is placed
+    first (same convention as :func:`numpy.tensordot`)."""
+    if isinstance(N, LocalBasis):
+        return np.moveaxis(N.dot(cps, axis=idx), idx, 0)
+    return np.tensordot(N, cps, axes=(1, idx))
+
+
+def _contract_scattered(N, cps, first=False):
+    """Contract the first axis (if *first*), or the second axis pointwise with
+    the first axis, of *cps* with the basis *N*."""
+    if first:
+        if isinstance(N, LocalBasis):
+            return N.dot(cps)
+        return np.einsum('ij,j...->i...', N, cps)
+    if isinstance(N, LocalBasis):
+        # Only the nonzero functions of each point are gathered: the
+        # i'th point picks out its own p entries along the next axis
+        pts = np.arange(cps.shape[0])
+        indices = N.indices
+        values = N.values.reshape(N.values.shape + (1,) * (cps.ndim - 2))
+        result = values[:, 0] * cps[pts, indices[:, 0]]
+        for j in range(1, indices.shape[1]):
+            result += values[:, j] * cps[pts, indices[:, j]]
+        return result
+    return np.einsum('ij,ij...->i...', N, cps)
+
+
+def _interpolate_raised(cps, basis, new_basis, axis):
+    """Express the coefficients *cps* along *axis* in the higher order
+    *new_basis*, by interpolating in its Greville points. The interpolation
+    matrix is banded, and one sparse factorization serves all fibres."""
+    pts = new_basis.greville()
+    rhs = np.moveaxis(basis.evaluate_local(pts).dot(cps, axis=axis), axis, 0)
+    lu = splinalg.splu(new_basis.evaluate(pts, sparse=True).tocsc())
+    result = lu.solve(rhs.reshape(rhs.shape[0], -1)).reshape(rhs.shape)
+    return np.moveaxis(result, 0, axis)
+
+
+def _elevation_operator(basis, new_basis):
+    """The operator taking coefficients in *basis* to the same function in
+    the higher order *new_basis*, which must have the same elements, as a
+    :class:`splipy.LocalBasis`.
+
+    The elevation is done on the Bezier form of each element, where it is
+    a convex combination, and each new coefficient is recovered from the
+    middle element of its support. It then depends on the *p* old
+    coefficients of that element only."""
+    C, spans = basis.bezier_extraction()
+    new_C, new_spans = new_basis.bezier_extraction()
+    p, q = basis.order, new_basis.order
+    if len(C) != len(new_C):
+        raise ValueError('The bases must have the same elements')
+
+    # elevation of the Bernstein coefficients from order p to q
+    elevate = np.array([[comb(p-1, b) * comb(q-p, a-b) / comb(q-1, a) if 0 <= a-b <= q-p else 0.0
+                         for b in range(p)] for a in range(q)])
+    local = np.linalg.solve(new_C.transpose(0, 2, 1), elevate @ C.transpose(0, 2, 1))
+
+    # the candidates for every new function, ordered by element
+    n = new_basis.num_functions()
+    rows = ((new_spans[:, None] + np.arange(q)) % n).ravel()
+    order = np.lexsort((np.arange(len(rows)), rows))
+    counts = np.bincount(rows, minlength=n)
+    pick = order[np.cumsum(counts) - counts + counts // 2]
+    return LocalBasis(local.reshape(-1, p)[pick], spans[pick // q], basis.num_functions())
+
+
+def _evaluate_scattered(bases, cps):
+    """Contract all directions at once in scattered points, visiting only
+    the block of control points with nonzero functions in each point."""
+    pardim = len(bases)
+    shape = cps.shape[:pardim]
+    dtype = np.result_type(cps, *(N.values for N in bases))
+    values = np.ascontiguousarray(np.hstack([N.values for N in bases]), dtype=dtype)
+    spans = np.stack([N.spans for N in bases], axis=1)
+    orders = [N.values.shape[1] for N in bases]
+    flat = np.ascontiguousarray(cps.reshape(np.prod(shape, dtype=int), -1), dtype=dtype)
+    result = basis_eval.evaluate_scattered(values, spans, orders, shape, flat)
+    return result.reshape((len(values),) + cps.shape[pardim:])
+
+
+def _split_points(params, step, tensor, axis=0):
+    """Split the evaluation parameters in blocks of *step* points along
+    direction *axis* (on tensor grids), or of *step* scattered points."""
+    n = len(params[axis])
+    for start in range(0, n, step):
+        index = slice(start, min(start + step, n))
+        if tensor:
+            yield index, params[:axis] + [params[axis][index]] + params[axis+1:]
+        else:
+            yield index, [p[index] for p in params]
+
+
+def _hull(cps, width):
+    """The centre of the bounding box of the projected control points of a
+    rational object (with *width* values per point), their largest distance
+    from it, and the smallest weight. See :func:`_deviation`."""
+    cps = np.reshape(cps, (-1, width))
+    points = cps[:, :-1] / cps[:, -1:]
+    centre = (points.min(axis=0) + points.max(axis=0)) / 2
+    radius = float(np.max(np.linalg.norm(points - centre, axis=1)))
+    return centre, radius, float(cps[:, -1].min())
+
+
+def _deviation(cps, approx, rational, width, hull=None):
+    """A bound on the distance between two splines on the same basis, from
+    corresponding rows of their control points *cps* and *approx*, with
+    *width* values per point. For polynomial splines this is the largest
+    distance between the rows.
+
+    For rational splines, with homogeneous points *P* relative to a centre
+    *c* and weights *w*, it is
+
+    .. math:: \\max_i \\left(|\\Delta P_i| + r |\\Delta w_i|\\right) / \\min_i w_i
+
+    where *r* bounds the distance from *c* to the approximation, and the
+    smallest weight is that of the first spline. Rows which are not given are
+    the same in both, so *hull* gives the centre, radius and smallest weight
+    of the whole first spline (see :func:`_hull`). It defaults to those of
+    *cps*."""
+    cps = np.reshape(cps, (-1, width))
+    approx = np.reshape(approx, (-1, width))
+    if len(cps) == 0:
+        return 0.0
+    if not rational:
+        return float(np.max(np.linalg.norm(cps - approx, axis=1)))
+
+    centre, radius, weight = _hull(cps, width) if hull is None else hull
+    if weight <= 0 or np.any(approx[:, -1] <= 0):
+        return np.inf
+    points = approx[:, :-1] / approx[:, -1:]
+    radius = max(radius, float(np.max(np.linalg.norm(points - centre, axis=1))))
+    diff = cps - approx
+    moved = np.linalg.norm(diff[:, :-1] - np.outer(diff[:, -1], centre), axis=1)
+    return float(np.max(moved + radius * np.abs(diff[:, -1]))) / weight
+
+
+def _local_removal(knots, order, knot, cps, rational, width, hull=None):
+    """Least squares removal of one occurrence of *knot* from the open knot
+    vector *knots*, with control points *cps* (an *n* × *rest* array).
+
+    Inserting the knot again (Boehm's algorithm) maps *order* coarse control
+    points to *order* + 1 fine ones, and leaves all others unchanged, so only
+    those take part in the fit. Returns the index of the removed knot, the
+    first of the fine rows, the insertion operator *A* from the coarse rows to
+    the fine ones, the coarse rows, and the deviation of the fit (see
+    :func:`_deviation`)."""
+    index = np.searchsorted(knots, knot + state.knot_tolerance, side='right') - 1
+    first = index - order
+    t = knots[index]
+
+    # the coarse knots are the fine ones with the one at *index* left out
+    A = np.zeros((order + 1, order))
+    A[0, 0] = A[order, order-1] = 1
+    i = np.arange(1, order)
+    left, right = knots[first + i], knots[index + i]
+    alpha = (t - left) / (right - left)
+    A[i, i] = alpha
+    A[i, i-1] = 1 - alpha
+
+    rows = cps[first:first + order + 1]
+    x = np.linalg.lstsq(A, rows, rcond=None)[0]
+    return index, first, A, x, _deviation(rows, A.dot(x), rational, width, hull)
+
+
+def _apply_operators(operators, cps, workers=1):
+    """Apply the :class:`splipy.LocalBasis` operators (or *None*, for no
+    change) along the leading axes of *cps*, by sum factorisation: one
+    direction at a time, visiting only the nonzero entries of each operator.
+
+    Each direction is contracted in place of the middle axis of an
+    (outer, n, inner) view, so no transposed copies are made. The
+    directions which grow the array the least go first, and among equals the
+    last direction, where the inner axis is short, while the array is
+    smallest. The outer slices (or the rows, if there are few slices) are
+    split between *workers* threads (*None* for one per core)."""
+    threads = workers or os.cpu_count() or 1
+    dtype = np.result_type(cps, *(op.values for op in operators if op is not None))
+    axes = [i for i, op in enumerate(operators) if op is not None]
+    axes.sort(key=lambda i: (operators[i].shape[0] / operators[i].shape[1], -i))
+    for axis in axes:
+        op = operators[axis]
+        shape = cps.shape
+        outer = int(np.prod(shape[:axis], dtype=int))
+        source = np.ascontiguousarray(cps, dtype=dtype).reshape(outer, shape[axis], -1)
+        values = np.ascontiguousarray(op.values, dtype=dtype)
+        result = basis_eval.contract_banded(values, op.spans, source, threads)
+        cps = result.reshape(shape[:axis] + (op.shape[0],) + shape[axis+1:])
+    return cps
+
+
+def _bezier_subdivision(order, pieces):
+    """Operators taking the Bezier coefficients of a polynomial of the given
+    order on [0,1] to its coefficients on each of *pieces* equal subintervals
+    (a *pieces* × *order* × *order* array)."""
+    xi = (1 - np.cos(np.pi * (2 * np.arange(order) + 1) / (2 * order))) / 2
+    bernstein = BSplineBasis(order)
+    B = bernstein.evaluate_local(xi, cache=False).values
+    sub = (np.arange(pieces)[:, None] + xi) / pieces
+    Bsub = bernstein.evaluate_local(sub.ravel(), cache=False).values.reshape(pieces, order, order)
+    return np.linalg.solve(B, Bsub)
+
+
+def _evaluate_bezier(cps, tables, lengths, keys):
+    """Evaluate the derivatives *keys* of Bezier elements, with control points
+    *cps* (an *E* × *p1* × ... × *pk* × *dim* array), on a tensor grid of
+    reference points. The Bernstein polynomials and their derivatives in those
+    points are given by *tables*, one jet per direction, and the derivatives
+    are scaled to the parametric side *lengths* of the elements."""
+    result = {}
+    for key in keys:
+        x = cps
+        for i, k in enumerate(key):
+            x = np.moveaxis(np.tensordot(tables[i][k].values, x, axes=(1, 1 + i)), 0, 1 + i)
+            if k > 0:
+                x = x / np.reshape(lengths[:, i]**k, (-1,) + (1,) * (x.ndim - 1))
+        result[key] = x
+    return result
+
+
+def _subdivide_bezier(cps, operators, direction):
+    """Split Bezier elements, with control points *cps* (an *E* × *p1* × ...
+    × *pk* × *dim* array), in the given direction with the operators of
+    :func:`_bezier_subdivision`. The pieces of each element are consecutive
+    in the result."""
+    cps = np.einsum('e...b,jab->ej...a', np.moveaxis(cps, 1 + direction, -1), operators)
+    cps = np.moveaxis(cps, -1, 2 + direction)
+    return cps.reshape((-1,) + cps.shape[2:])
+
+
+def _mass_properties(mass, moments, second):
+    """Assemble :class:`MassProperties` from the mass, the first moments and
+    the second moments about the origin."""
+    center = moments / mass
+    second = (second + second.T) / 2 - mass * np.outer(center, center)
+    inertia = np.trace(second) * np.identity(len(center)) - second
+    return MassProperties(mass, moments, center, inertia)
+
+
 def evaluate(bases, cps, tensor=True):
     if tensor:
         idx = len(bases) - 1
         for N in bases[::-1]:
-            cps = np.tensordot(N, cps, axes=(1, idx))
+            cps = _contract_tensor(N, cps, idx)
+    elif all(isinstance(N, LocalBasis) for N in bases):
+        cps = _evaluate_scattered(bases, cps)
     else:
-        cps = np.einsum('ij,j...->i...', bases[0], cps)
+        cps = _contract_scattered(bases[0], cps, first=True)
         for N in bases[1:]:
-            cps = np.einsum('ij,ij...->i...', N, cps)
+            cps = _contract_scattered(N, cps)
     return cps
 
 
+def evaluate_jet(jets, cps, keys, tensor=True):
+    """Evaluate several derivatives in one go. *jets* holds, for each
+    direction, the list of basis derivatives by order, and *keys* is a
+    collection of multi-indices (one derivative order per direction).
+    Intermediate contractions shared between derivatives are only done once.
+
+    :return: Mapping from multi-index to evaluated array
+    :rtype: dict
+    """
+    pardim = len(jets)
+    partial = {(): cps}
+    if tensor:
+        for i in range(pardim-1, -1, -1):
+            wanted = {tuple(k[i:]) for k in keys}
+            partial = {k: _contract_tensor(jets[i][k[0]], partial[k[1:]], pardim-1) for k in wanted}
+    elif all(isinstance(N, LocalBasis) for jet in jets for N in jet):
+        partial = {tuple(k): _evaluate_scattered([jet[ki] for jet, ki in zip(jets, k)], cps) for k in keys}
+    else:
+        for i in range(pardim):
+            wanted = {tuple(k[:i+1]) for k in keys}
+            partial = {k: _contract_scattered(jets[i][k[-1]], partial[k[:-1]], first=(i == 0))
+                       for k in wanted}
+    return partial
+
+
+def rational_jet(homogeneous, keys):
+    """Convert derivatives of the homogeneous (weighted) coordinates to
+    derivatives of the rational object. With *A* the weighted coordinates and
+    *W* the weight, the derivative of multi-index *k* is given by the
+    generalized Leibniz rule
+
+    .. math:: C^{(k)} = \\frac{1}{W} \\left( A^{(k)} - \\sum_{0 < j \\leq k}
+        \\binom{k}{j} W^{(j)} C^{(k-j)} \\right)
+
+    *keys* must be closed under taking lower-order derivatives.
+
+    :return: Mapping from multi-index to derivative
+    :rtype: dict
+    """
+    keys = sorted(keys, key=sum)
+    zero = keys[0]
+    W = homogeneous[zero][..., -1:]
+    result = {}
+    for k in keys:
+        x = homogeneous[k][..., :-1].copy()
+        for j in product(*(range(ki+1) for ki in k)):
+            if j == zero:
+                continue
+            coeff = np.prod([comb(ki, ji) for ki, ji in zip(k, j)])
+            x -= coeff * homogeneous[j][..., -1:] * result[tuple(ki - ji for ki, ji in zip(k, j))]
+        result[k] = x / W
+    return result
+
+
+class Evaluator(object):
+    """Evaluator()
+
+    Evaluates spline objects with a common basis on a fixed set of parametric
+    points. The basis functions are evaluated once, when the evaluator is
+    created by :func:`splipy.SplineObject.evaluator`, after which evaluating
+    for a given set of control points is a pure contraction.
+
+    .. code:: python
+
+       ev = curve.evaluator(t)
+       for frame in frames:
+           x = ev(frame.controlpoints)
+    """
+
+    def __init__(self, jets, keys, tensor, rational, squeeze):
+        """  Construct an evaluator. This should not be called directly, use
+        :func:`splipy.SplineObject.evaluator` instead.
+
+        :param jets: For each direction, the local bases by derivative order
+        :param keys: The derivative multi-indices to evaluate
+        :param bool tensor: Whether the points form a tensor product grid
+        :param bool rational: Whether the control points have a weight
+        :param bool squeeze: Whether to return vectors for a single point
+        """
+        self.jets = jets
+        self.keys = keys
+        self.tensor = tensor
+        self.rational = rational
+        self.squeeze = squeeze
+
+        # rational objects need the lower order derivatives of the weight as well
+        if rational:
+            self._required = sorted(set(chain.from_iterable(
+                product(*(range(ki+1) for ki in k)) for k in keys)), key=sum)
+        else:
+            self._required = list(keys)
+
+    @property
+    def shape(self):
+        """The shape of the grid of control points (without the coordinate axis)."""
+        return tuple(jet[0].n for jet in self.jets)
+
+    def __call__(self, controlpoints):
+        """  Evaluate for the given control points.
+
+        :param numpy.array controlpoints: Control points (including the
+            weights, for rational objects), reshapeable to
+            *n1* × *n2* × ... × *dim*
+        :return: The result, or a dictionary mapping derivative multi-indices
+            to results if more than one derivative was requested
+        :rtype: numpy.array or dict
+        """
+        dtype = self.jets[0][0].values.dtype
+        cps = np.asarray(controlpoints, dtype=dtype).reshape(self.shape + (-1,))
+
+        result = evaluate_jet(self.jets, cps, self._required, self.tensor)
+        if self.rational:
+            result = rational_jet(result, self._required)
+
+        if self.squeeze:
+            result = {k: result[k].reshape(-1) for k in self.keys}
+        if len(self.keys) == 1:
+            return result[self.keys[0]]
+        return {k: result[k] for k in self.keys}
+
+    def operator(self, d=None):
+        """  Get the linear operator mapping control points to evaluated values,
+        as a sparse matrix. Its columns correspond to the control points (in
+        the row-major order of :attr:`splipy.SplineObject.controlpoints`), and
+        its rows to the evaluation points (in the row-major order of the
+        result). For rational objects this maps weighted coordinates to
+        weighted coordinates.
+
+        .. code:: python
+
+           # Least squares fit of a curve to the points x
+           ev = curve.evaluator(t)
+           A = ev.operator()
+           curve.controlpoints = scipy.sparse.linalg.lsqr(A, x)[0]
+
+        :param (int) d: The derivative multi-index, if more than one was
+            requested
+        :return: Evaluation matrix
+        :rtype: scipy.sparse.csr_matrix
+        """
+        if d is None:
+            if len(self.keys) != 1:
+                raise ValueError('Derivative must be given when more than one was requested')
+            d = self.keys[0]
+        d = tuple(ensure_listlike(d, len(self.jets)))
+        if d not in self.keys:
+            raise ValueError('Derivative {} was not requested'.format(d))
+
+        Ns = [jet[k] for jet, k in zip(self.jets, d)]
+        if self.tensor:
+            result = Ns[0].tosparse()
+            for N in Ns[1:]:
+                result = sp.kron(result, N.tosparse(), format='csr')
+            return result
+
+        # Pointwise (row-by-row) Kronecker product of the local bases
+        m = Ns[0].values.shape[0]
+        values, indices = np.ones((m, 1)), np.zeros((m, 1), dtype=int)
+        for N in Ns:
+            values = (values[:, :, None] * N.values[:, None, :]).reshape(m, -1)
+            indices = (indices[:, :, None] * N.n + N.indices[:, None, :]).reshape(m, -1)
+        indptr = np.arange(0, values.size + 1, values.shape[1])
+        return sp.csr_matrix((values.ravel(), indices.ravel(), indptr), (m, int(np.prod(self.shape))))
+
+
 class SplineObject(object):
     """  Master class for spline objects with arbitrary dimensions.
 
@@ -44,6 +466,8 @@ class SplineObject(object):
     object, while infix operators (e.g. ``+``) create new objects.
     """
 
+    _version = 0
+
     def __init__(self, bases=None, controlpoints=None, rational=False, raw=False):
         """  Construct a spline object with the given bases and control points.
 
@@ -90,9 +514,9 @@ class SplineObject(object):
         :raises ValueError: If the parameters are outside the domain
         """
         for b, p in zip(self.bases, params):
-            b.snap(p)
-            if b.periodic < 0:
-                if min(p) < b.start() or b.end() < max(p):
+            if b.periodic < 0 and len(p) > 0:
+                # points within the knot tolerance of the ends are snapped on evaluation
+                if np.min(p) <= b.start() - state.knot_tolerance or b.end() + state.knot_tolerance <= np.max(p):
                     raise ValueError('Evaluation outside parametric domain')
 
     def evaluate(self, *params, **kwargs):
@@ -114,6 +538,11 @@ class SplineObject(object):
         :type u,v,...: float or [float]
         :param tensor: Whether to evaluate on a tensor product grid
         :type tensor: bool
+        :param dtype: Floating point type of the computation and the result,
+            float32 or float64. Single precision is sufficient for
+            visualization, and halves the memory traffic.
+        :param int workers: Number of threads to evaluate on. Use *None* for
+            one per available core.
         :return: Geometry coordinates
         :rtype: numpy.array
         """
@@ -121,22 +550,25 @@ class SplineObject(object):
         params = [ensure_listlike(p) for p in params]
 
         tensor = kwargs.get('tensor', True)
+        dtype = kwargs.get('dtype', float)
         if not tensor and len({len(p) for p in params}) != 1:
             raise ValueError('Parameters must have same length')
 
+        workers = kwargs.pop('workers', 1)
+        if workers != 1 and not squeeze:
+            return self._evaluate_blocks(self.evaluate, params, workers, kwargs)
+
         self._validate_domain(*params)
 
         # Evaluate the corresponding bases at the corresponding points
         # and build the result array
-        Ns = [b.evaluate(p) for b, p in zip(self.bases, params)]
-        result = evaluate(Ns, self.controlpoints, tensor)
+        Ns = [b.evaluate_local(p, dtype=dtype) for b, p in zip(self.bases, params)]
+        result = evaluate(Ns, self.controlpoints.astype(dtype, copy=False), tensor)
 
         # For rational objects, we divide out the weights, which are stored in the
         # last coordinate
         if self.rational:
-            for i in range(self.dimension):
-                result[..., i] /= result[..., -1]
-            result = np.delete(result, self.dimension, -1)
+            result = result[..., :-1] / result[..., -1:]
 
         # Squeeze the singleton dimensions if we only have one point
         if squeeze:
@@ -185,6 +617,10 @@ class SplineObject(object):
         :param (bool) above: Evaluation in the limit from above
         :param tensor: Whether to evaluate on a tensor product grid
         :type tensor: bool
+        :param dtype: Floating point type of the computation and the result,
+            float32 or float64
+        :param int workers: Number of threads to evaluate on. Use *None* for
+            one per available core.
         :return: Derivatives
         :rtype: numpy.array
         """
@@ -198,32 +634,31 @@ class SplineObject(object):
         above = ensure_listlike(above, self.pardim)
 
         tensor = kwargs.get('tensor', True)
+        dtype = kwargs.get('dtype', float)
 
         if not tensor and len({len(p) for p in params}) != 1:
             raise ValueError('Parameters must have same length')
 
+        workers = kwargs.pop('workers', 1)
+        if workers != 1 and not squeeze:
+            return self._evaluate_blocks(self.derivative, params, workers, kwargs)
+
         self._validate_domain(*params)
 
         # Evaluate the derivatives of the corresponding bases at the corresponding points
-        # and build the result array
-        dNs = [b.evaluate(p, d, from_right) for b, p, d, from_right in zip(self.bases, params, derivs, above)]
-        result = evaluate(dNs, self.controlpoints, tensor)
-
-        # For rational curves, we need to use the quotient rule
-        # (n/W)' = (n' W - n W') / W^2 = n'/W - nW'/W^2
-        # * n'(i) = result[..., i]
-        # * W'(i) = result[..., -1]
-        # We evaluate in the regular way to compute n and W.
+        # and build the result array.
+        controlpoints = self.controlpoints.astype(dtype, copy=False)
         if self.rational:
-            if sum(derivs) > 1:
-                raise RuntimeError('Rational derivative not implemented for order %i' % sum(derivs))
-            Ns = [b.evaluate(p) for b, p in zip(self.bases, params)]
-            non_derivative = evaluate(Ns, self.controlpoints, tensor)
-            W = non_derivative[..., -1]  # W
-            Wd = result[..., -1]         # W'
-            for i in range(self.dimension):
-                result[..., i] = result[..., i] / W - non_derivative[..., i] * Wd / W / W
-            result = np.delete(result, self.dimension, -1)
+            # Rational objects need all lower order derivatives of the homogeneous
+            # coordinates as well, which are computed in the same basis pass
+            jets = [b.evaluate_jet(p, d, from_right, dtype=dtype)
+                    for b, p, d, from_right in zip(self.bases, params, derivs, above)]
+            keys = list(product(*(range(d+1) for d in derivs)))
+            result = rational_jet(evaluate_jet(jets, controlpoints, keys, tensor), keys)[tuple(derivs)]
+        else:
+            dNs = [b.evaluate_local(p, d, from_right, dtype=dtype)
+                   for b, p, d, from_right in zip(self.bases, params, derivs, above)]
+            result = evaluate(dNs, controlpoints, tensor)
 
         # Squeeze the singleton dimensions if we only have one point
         if squeeze:
@@ -231,6 +666,740 @@ class SplineObject(object):
 
         return result
 
+    def jet(self, *params, **kwargs):
+        """  Evaluate the object and all its derivatives up to a given order at
+        the given parametric values.
+
+        This is equivalent to calling :func:`splipy.SplineObject.evaluate` and
+        :func:`splipy.SplineObject.derivative` once for every derivative, but
+        the basis functions are only evaluated once per direction, and
+        contractions that several derivatives have in common are shared.
+
+        If *d* is an integer, all derivatives of total order at most *d* are
+        computed. If it is a tuple, all derivatives up to the given order in
+        each direction are computed.
+
+        The return value is a dictionary mapping multi-indices (tuples with
+        one derivative order per direction) to arrays of the same shape as
+        returned by :func:`splipy.SplineObject.derivative`.
+
+        .. code:: python
+
+           # Position, velocity and acceleration of a curve
+           jet = curve.jet(t, d=2)
+           x, v, a = jet[(0,)], jet[(1,)], jet[(2,)]
+
+           # Position and tangents of a surface
+           jet = surface.jet(u, v, d=1)
+           du, dv = jet[(1,0)], jet[(0,1)]
+
+        :param u,v,...: Parametric coordinates in which to evaluate
+        :type u,v,...: float or [float]
+        :param d: Highest order of derivatives to compute
+        :type d: int or (int)
+        :param (bool) above: Evaluation in the limit from above
+        :param tensor: Whether to evaluate on a tensor product grid
+        :type tensor: bool
+        :return: Position and derivatives
+        :rtype: dict
+        """
+        squeeze = all(is_singleton(p) for p in params)
+        params = [ensure_listlike(p) for p in params]
+
+        d = kwargs.get('d', 1)
+        if is_singleton(d):
+            orders = [d] * self.pardim
+            keys = [k for k in product(*(range(o+1) for o in orders)) if sum(k) <= d]
+        else:
+            orders = ensure_listlike(d, self.pardim)
+            keys = list(product(*(range(o+1) for o in orders)))
+
+        above = kwargs.get('above', [True] * self.pardim)
+        above = ensure_listlike(above, self.pardim)
+
+        tensor = kwargs.get('tensor', True)
+
+        if not tensor and len({len(p) for p in params}) != 1:
+            raise ValueError('Parameters must have same length')
+
+        self._validate_domain(*params)
+
+        jets = [b.evaluate_jet(p, o, from_right) for b, p, o, from_right in zip(self.bases, params, orders, above)]
+        result = evaluate_jet(jets, self.controlpoints, keys, tensor)
+
+        if self.rational:
+            result = rational_jet(result, keys)
+
+        # Squeeze the singleton dimensions if we only have one point
+        if squeeze:
+            result = {k: x.reshape(self.dimension) for k, x in result.items()}
+
+        return result
+
+    def evaluator(self, *params, **kwargs):
+        """  Prepare evaluation of the object on a fixed set of parametric
+        values, for repeated use while the control points change.
+
+        The basis functions are evaluated once, and the returned
+        :class:`splipy.splineobject.Evaluator` maps control points to values
+        (as returned by :func:`splipy.SplineObject.evaluate` and
+        :func:`splipy.SplineObject.derivative`) without repeating that work. It
+        can also produce the evaluation matrix, e.g. for least squares fitting.
+
+        .. code:: python
+
+           ev = surface.evaluator(u, v, derivatives=[(0,0), (1,0), (0,1)])
+           result = ev(surface.controlpoints)
+           du = result[(1,0)]
+
+        :param u,v,...: Parametric coordinates in which to evaluate
+        :type u,v,...: float or [float]
+        :param derivatives: The derivative, or list of derivatives, to compute.
+            Defaults to the position only.
+        :type derivatives: (int) or [(int)]
+        :param (bool) above: Evaluation in the limit from above
+        :param tensor: Whether to evaluate on a tensor product grid
+        :type tensor: bool
+        :param dtype: Floating point type of the computation and the result,
+            float32 or float64
+        :return: Evaluator
+        :rtype: splipy.splineobject.Evaluator
+        """
+        squeeze = all(is_singleton(p) for p in params)
+        params = [ensure_listlike(p) for p in params]
+
+        derivatives = kwargs.get('derivatives', 0)
+        if is_singleton(derivatives) or (self.pardim > 1 and is_singleton(derivatives[0])):
+            derivatives = [derivatives]
+        keys = [tuple(ensure_listlike(d, self.pardim)) for d in derivatives]
+        orders = [max(k[i] for k in keys) for i in range(self.pardim)]
+
+        above = kwargs.get('above', [True] * self.pardim)
+        above = ensure_listlike(above, self.pardim)
+
+        tensor = kwargs.get('tensor', True)
+        dtype = kwargs.get('dtype', float)
+        if not tensor and len({len(p) for p in params}) != 1:
+            raise ValueError('Parameters must have same length')
+
+        self._validate_domain(*params)
+
+        jets = [b.evaluate_jet(p, o, from_right, dtype=dtype)
+                for b, p, o, from_right in zip(self.bases, params, orders, above)]
+        return Evaluator(jets, keys, tensor, self.rational, squeeze)
+
+    def element_controlpoints(self):
+        """  Get the control points of the Bezier representation of each element
+        (see :func:`splipy.BSplineBasis.bezier_extraction`).
+
+        The result is an *E1* × ... × *Ek* × *p1* × ... × *pk* × *dim* array,
+        where *Ei* is the number of elements and *pi* the order in direction
+        *i*. Like :attr:`controlpoints`, it includes the weights of rational
+        objects. Each element lies in the convex hull of its (projected)
+        control points.
+
+        :return: Element control points
+        :rtype: numpy.array
+        """
+        shape = tuple(len(b.knot_spans()) - 1 for b in self.bases)
+        cps = self._element_controlpoints(np.arange(int(np.prod(shape))))
+        return cps.reshape(shape + cps.shape[1:])
+
+    def _element_controlpoints(self, elements):
+        """The Bezier control points of the given (flat) element indices, as an
+        *n* × *p1* × ... × *pk* × *dim* array."""
+        pardim = self.pardim
+        extraction = [b.bezier_extraction() for b in self.bases]
+        index = np.unravel_index(elements, tuple(len(spans) for _, spans in extraction))
+
+        # gather the p1 × ... × pk block of control points of every element
+        blocks = []
+        for i, (b, (_, spans), e) in enumerate(zip(self.bases, extraction, index)):
+            indices = (spans[e, None] + np.arange(b.order)) % b.num_functions()
+            blocks.append(indices.reshape((len(e),) + (1,) * i + (-1,) + (1,) * (pardim - i - 1)))
+        cps = self.controlpoints[tuple(blocks)]
+
+        # and contract each function axis with the operators of its element
+        for i, ((operators, _), e) in enumerate(zip(extraction, index)):
+            x = np.moveaxis(cps, 1 + i, -1)
+            x = x @ operators[e].reshape((len(e),) + (1,) * (x.ndim - 3) + operators.shape[1:])
+            cps = np.moveaxis(x, -1, 1 + i)
+        return cps
+
+    def element_bounds(self, refine=0):
+        """  Get axis-aligned bounding boxes of all the elements of the object.
+
+        The boxes are computed from the (projected) Bezier control points of
+        each element (see :func:`element_controlpoints`), and so they enclose
+        the object. With *refine* > 0, every element is first split into
+        *refine* + 1 equal parts in each parametric direction, giving tighter
+        boxes. The result is computed once, and kept until the bases or the
+        control points change (see :func:`__setitem__`).
+
+        The elements are ordered as in :func:`evaluate_elements`, with the
+        first direction running slowest.
+
+        :param int refine: Number of times to split each element
+        :return: Lower and upper bounds, an *E* × *dim* × 2 array where *E*
+            is the total number of elements
+        :rtype: numpy.array
+        """
+        return self._cached(('element_bounds', refine), lambda: self._element_bounds(refine))
+
+    def _element_bounds(self, refine):
+        pardim = self.pardim
+        cps = self.element_controlpoints()
+        cps = cps.reshape((-1,) + cps.shape[pardim:])
+        elements = len(cps)
+
+        # subdivide the Bezier elements one direction at a time, keeping the
+        # pieces of each element consecutive
+        if refine > 0:
+            for i, b in enumerate(self.bases):
+                cps = _subdivide_bezier(cps, _bezier_subdivision(b.order, refine + 1), i)
+
+        if self.rational:
+            cps = cps[..., :-1] / cps[..., -1:]
+        cps = cps.reshape(elements, -1, self.dimension)
+        result = np.stack([cps.min(axis=1), cps.max(axis=1)], axis=2)
+        result.flags.writeable = False
+        return result
+
+    def bvh(self, leaf_size=4):
+        """  Get a bounding volume hierarchy over the elements of the object, for
+        spatial queries such as closest points, point location and ray
+        intersections. It is built on demand, and kept until the bases or the
+        control points change (see :func:`__setitem__`).
+
+        .. code:: python
+
+           patch, u, dist = surface.bvh().closest_point(x)
+
+        :param int leaf_size: Number of elements in each leaf
+        :return: Bounding volume hierarchy
+        :rtype: splipy.bvh.BoundingVolumeHierarchy
+        """
+        return self._cached(('bvh', leaf_size), lambda: BoundingVolumeHierarchy([self], leaf_size))
+
+    def __setattr__(self, name, value):
+        # any change to the defining attributes invalidates derived data
+        if name in ('bases', 'controlpoints', 'rational'):
+            self.__dict__['_version'] = next(_versions)
+        super().__setattr__(name, value)
+
+    def _state_key(self):
+        """A key which changes whenever the bases are modified, or the control
+        points are reassigned or modified through the methods of the object.
+        The control points are not inspected, so this is cheap to check."""
+        return (tuple(b._cache_key() for b in self.bases), self._version)
+
+    def _cached(self, name, compute):
+        """Get a value derived from the bases and control points, which is only
+        computed again if either of them have changed since the last call."""
+        key = self._state_key()
+        cache = self.__dict__.setdefault('_derived', {})
+        if name not in cache or cache[name][0] != key:
+            cache[name] = (key, compute())
+        return cache[name][1]
+
+    def evaluate_elements(self, *points, **kwargs):
+        """  Evaluate the object, or one of its derivatives, in the same
+        reference points on every element.
+
+        The points are given in reference coordinates [0,1] on each element,
+        and form a tensor product grid within each element. The basis
+        functions are computed from one table of Bernstein polynomials, and
+        the Bezier extraction operators of the bases (see
+        :func:`splipy.BSplineBasis.bezier_extraction`), so no knot spans are
+        searched. This is the natural evaluation for quadrature.
+
+        The result is an *E1* × ... × *Ek* × *m1* × ... × *mk* × *dim*
+        array, where *Ei* is the number of elements in direction *i*, and
+        *mi* is the number of reference points in direction *i*. Points on
+        element boundaries are evaluated in the limit from inside the element.
+
+        .. code:: python
+
+           # Gauss points on every element
+           x, w = np.polynomial.legendre.leggauss(3)
+           dx = curve.evaluate_elements((x+1)/2, d=1)
+
+        :param u,v,...: Reference coordinates in which to evaluate
+        :type u,v,...: float or [float]
+        :param (int) d: Order of derivative to compute
+        :return: Geometry coordinates, or derivatives
+        :rtype: numpy.array
+        """
+        points = [np.array(ensure_listlike(x), dtype=float) for x in points]
+        derivs = kwargs.get('d', 0)
+        derivs = tuple(ensure_listlike(derivs, self.pardim))
+        if self.rational:
+            keys = list(product(*(range(d+1) for d in derivs)))
+        else:
+            keys = [derivs]
+
+        # one table of Bernstein polynomials per direction serves all elements
+        pardim = self.pardim
+        cps = self.element_controlpoints()
+        shape = cps.shape[:pardim]
+        cps = cps.reshape((-1,) + cps.shape[pardim:])
+        tables = [BSplineBasis(b.order).evaluate_jet(x, d, cache=False) for b, x, d in zip(self.bases, points, derivs)]
+        lengths = self._element_lengths(np.arange(len(cps)))
+        result = _evaluate_bezier(cps, tables, lengths, keys)
+
+        result = rational_jet(result, keys)[derivs] if self.rational else result[derivs]
+        return result.reshape(shape + result.shape[1:])
+
+    def _element_lengths(self, elements):
+        """The parametric side lengths of the given (flat) element indices, as
+        an *n* × *pardim* array."""
+        lengths = [np.diff(b.knot_spans()) for b in self.bases]
+        index = np.unravel_index(elements, tuple(len(h) for h in lengths))
+        return np.stack([h[i] for h, i in zip(lengths, index)], axis=1)
+
+    def integrate(self, fn, derivatives=0, points=None, elementwise=False, tol=None, maxlevels=8,
+                  full_output=False):
+        """  Integrate a function of the object over the parametric domain, by
+        Gauss quadrature on every element (see
+        :func:`splipy.BSplineBasis.quadrature`).
+
+        The function is called with an *n* × *pardim* array of parametric
+        coordinates, followed by the values of each of the requested
+        derivatives in the same points, as *n* × *dim* arrays. It returns
+        *n* values, or an array with *n* rows, to be integrated. The object is
+        evaluated on the tensor grid of quadrature points, in slabs of
+        elements along the first direction of about
+        :data:`splipy.state.block_size` (but at least one element thick), so
+        the function may be called several times.
+
+        With a tolerance, the integration is adaptive. The error on each
+        element is estimated by comparing the rule with the rule of one point
+        less in each direction, and elements which fail are bisected
+        in every direction until the estimate is below their share of the
+        tolerance (in proportion to their parametric size), or until
+        *maxlevels* subdivisions.
+
+        .. code:: python
+
+           # the area of a surface
+           def jacobian(u, du, dv):
+               return np.linalg.norm(np.cross(du, dv), axis=1)
+           area = surface.integrate(jacobian, derivatives=[(1,0), (0,1)])
+
+        :param function fn: The integrand
+        :param derivatives: The derivative, or list of derivatives, passed to
+            the integrand. Defaults to the position only.
+        :type derivatives: (int) or [(int)]
+        :param points: Number of quadrature points per element, in each
+            direction. Defaults to one more than the order.
+        :type points: int or [int]
+        :param bool elementwise: Return the integral over each element (in
+            the order of :func:`element_bounds`) instead of the sum
+        :param float tol: Absolute tolerance for adaptive integration
+        :param int maxlevels: Maximal number of subdivisions of an element
+        :param bool full_output: Also return the estimated error (None unless
+            adaptive) and the number of points the integrand was evaluated in
+        :return: The integral, and optionally the error and the number of
+            evaluations
+        :rtype: float or numpy.array, or tuple
+        """
+        pardim = self.pardim
+        if is_singleton(derivatives) or (pardim > 1 and is_singleton(derivatives[0])):
+            derivatives = [derivatives]
+        requested = [tuple(ensure_listlike(d, pardim)) for d in derivatives]
+        orders = [max(k[i] for k in requested) for i in range(pardim)]
+        if self.rational:
+            keys = list(product(*(range(d+1) for d in orders)))
+        else:
+            keys = list(set(requested))
+        if points is None:
+            points = [b.order + 1 for b in self.bases]
+        points = ensure_listlike(points, pardim)
+
+        size = int(np.prod(points))
+
+        if tol is not None:
+            def evaluate_cells(cps, lengths, params, tables):
+                values = _evaluate_bezier(cps, tables, lengths, keys)
+                if self.rational:
+                    values = rational_jet(values, keys)
+                values = [values[k].reshape(-1, self.dimension) for k in requested]
+                f = np.asarray(fn(params, *values))
+                return f.reshape((len(cps), -1) + f.shape[1:])
+
+            step = max(1, state.block_size // (8 * size * (len(keys) + 2) * self.controlpoints.shape[-1]))
+            result, error, evaluations = self._integrate_adaptive(
+                evaluate_cells, points, orders, step, tol, maxlevels, elementwise)
+            return (result, error, evaluations) if full_output else result
+
+        # evaluate on the tensor grid of quadrature points, in slabs of
+        # elements along the first direction, and sum over each element
+        quadrature = [b.quadrature(n) for b, n in zip(self.bases, points)]
+        jets = [b.evaluate_jet(t.ravel(), d) for b, (t, _), d in zip(self.bases, quadrature, orders)]
+        shape = tuple(len(t) for t, _ in quadrature)
+        slab = int(np.prod([len(t.ravel()) for t, _ in quadrature[1:]])) * points[0]
+        step = max(1, state.block_size // (8 * slab * (len(keys) + 2) * self.controlpoints.shape[-1]))
+        results = []
+        total = 0
+        for start in range(0, shape[0], step):
+            stop = min(start + step, shape[0])
+            rows = slice(start * points[0], stop * points[0])
+            values = {}
+            for key in keys:
+                N = jets[0][key[0]]
+                operators = [LocalBasis(N.values[rows], N.spans[rows], N.n)]
+                operators += [jet[k] for jet, k in zip(jets[1:], key[1:])]
+                values[key] = _apply_operators(operators, self.controlpoints)
+            if self.rational:
+                values = rational_jet(values, keys)
+
+            grid = [quadrature[0][0][start:stop].ravel()] + [t.ravel() for t, _ in quadrature[1:]]
+            params = np.stack([g.ravel() for g in np.meshgrid(*grid, indexing='ij')], axis=1)
+            weights = quadrature[0][1][start:stop].ravel()
+            for _, w in quadrature[1:]:
+                weights = np.multiply.outer(weights, w.ravel())
+            f = np.asarray(fn(params, *(values[k].reshape(-1, self.dimension) for k in requested)))
+            f = f.reshape(weights.shape + f.shape[1:]) * weights.reshape(weights.shape + (1,) * (f.ndim - 1))
+
+            # the grid axes are (element, point) pairs
+            cells = (stop - start,) + shape[1:]
+            f = f.reshape(tuple(chain(*zip(cells, points))) + f.shape[pardim:])
+            integral = f.sum(axis=tuple(range(1, 2*pardim, 2)))
+            if elementwise:
+                results.append(integral.reshape((-1,) + integral.shape[pardim:]))
+            else:
+                total = total + integral.reshape((-1,) + integral.shape[pardim:]).sum(axis=0)
+
+        result = np.concatenate(results) if elementwise else total
+        return (result, None, int(np.prod(shape)) * size) if full_output else result
+
+    def _integrate_adaptive(self, evaluate_cells, points, orders, step, tol, maxlevels, elementwise):
+        """Adaptive quadrature over cells, given by their Bezier control points,
+        lower parametric corners and side lengths. The error on each cell is
+        estimated by the Gauss rule with one point less in each direction,
+        and only the cells which fail are subdivided. The cells are processed
+        depth first, in chunks of *step*, so only a few chunks of control
+        points exist at a time."""
+        pardim = self.pardim
+        rules = []
+        for n in (points, [max(n - 1, 1) for n in points]):
+            x, w = zip(*(np.polynomial.legendre.leggauss(k) for k in n))
+            reference = np.meshgrid(*((xi + 1) / 2 for xi in x), indexing='ij')
+            weights = np.ones(())
+            for wi in w:
+                weights = np.multiply.outer(weights, wi / 2)
+            tables = [BSplineBasis(b.order).evaluate_jet((xi + 1) / 2, d, cache=False)
+                      for b, xi, d in zip(self.bases, x, orders)]
+            rules.append((np.stack([r.ravel() for r in reference], axis=1), weights.ravel(), tables))
+        split = [_bezier_subdivision(b.order, 2) for b in self.bases]
+        corners = np.array(list(product(range(2), repeat=pardim)))
+        children = len(corners)
+
+        knots = [np.array(b.knot_spans()) for b in self.bases]
+        shape = tuple(len(k) - 1 for k in knots)
+        count = int(np.prod(shape))
+        domain = np.prod([k[-1] - k[0] for k in knots])
+
+        origins, integrals = [], []
+        error = 0.0
+        evaluations = 0
+        for start in range(0, count, step):
+            elements = np.arange(start, min(start + step, count))
+            index = np.unravel_index(elements, shape)
+            lower = np.stack([k[i] for k, i in zip(knots, index)], axis=1)
+            stack = [(self._element_controlpoints(elements), lower, self._element_lengths(elements), elements, 0)]
+            while stack:
+                cps, lower, lengths, origin, level = stack.pop()
+                if len(cps) > step:
+                    stack.append((cps[step:], lower[step:], lengths[step:], origin[step:], level))
+                    cps, lower, lengths, origin = cps[:step], lower[:step], lengths[:step], origin[:step]
+
+                measure = np.prod(lengths, axis=1)
+                results = []
+                for reference, weights, tables in rules:
+                    params = (lower[:, None, :] + lengths[:, None, :] * reference).reshape(-1, pardim)
+                    f = evaluate_cells(cps, lengths, params, tables)
+                    evaluations += f.shape[0] * f.shape[1]
+                    results.append(np.einsum('ej...,j,e->e...', f, weights, measure))
+                integral, coarse = results
+                estimate = np.abs(integral - coarse).reshape(len(cps), -1).max(axis=1)
+
+                # accept the cells within their share of the tolerance, and
+                # carry on with the children of the others
+                done = estimate <= tol * measure / domain
+                if level == maxlevels:
+                    done[:] = True
+                error += estimate[done].sum()
+                origins.append(origin[done])
+                integrals.append(integral[done])
+                if not done.all():
+                    cps = cps[~done]
+                    for i, operators in enumerate(split):
+                        cps = _subdivide_bezier(cps, operators, i)
+                    lower = (lower[~done, None, :] + corners * lengths[~done, None, :] / 2).reshape(-1, pardim)
+                    lengths = np.repeat(lengths[~done] / 2, children, axis=0)
+                    stack.append((cps, lower, lengths, np.repeat(origin[~done], children), level + 1))
+
+        integrals = np.concatenate(integrals)
+        if elementwise:
+            result = np.zeros((count,) + integrals.shape[1:])
+            np.add.at(result, np.concatenate(origins), integrals)
+        else:
+            result = integrals.sum(axis=0)
+        return result, error, evaluations
+
+    def mass_properties(self, density=None, points=None):
+        """  Compute the mass, center of mass and inertia tensor of the object in
+        physical space, in one pass of Gauss quadrature (see
+        :func:`integrate`). The measure is length, area or volume, depending
+        on the parametric dimension, and is weighted by the density.
+
+        The inertia tensor is taken about the center of mass,
+
+        .. math:: I = \\int \\rho \\left( |\\boldsymbol{r}|^2 \\mathbb{I} -
+            \\boldsymbol{r} \\boldsymbol{r}^T \\right) \\; dV, \\quad
+            \\boldsymbol{r} = \\boldsymbol{x} - \\boldsymbol{c}
+
+        .. code:: python
+
+           props = volume.mass_properties(density=lambda x: 1 + x[:,2])
+           print(props.mass, props.center)
+
+        :param density: Constant density, or a function taking an *n* × *dim*
+            array of physical points and returning *n* values. Defaults to one.
+        :type density: float or function
+        :param points: Number of quadrature points per element, in each
+            direction
+        :type points: int or [int]
+        :return: The mass, the first moments, the center of mass and the
+            inertia tensor
+        :rtype: :class:`splipy.splineobject.MassProperties`
+        """
+        return _mass_properties(*self._mass_moments(density, points))
+
+    def _mass_moments(self, density, points):
+        """The mass, first moments and second moments about the origin."""
+        pardim, dim = self.pardim, self.dimension
+        if pardim > dim:
+            raise ValueError('Parametric dimension exceeds physical dimension')
+
+        def moments(u, x, *dx):
+            J = np.stack(dx, axis=-1)
+            if pardim == dim:
+                weight = np.abs(np.linalg.det(J))
+            else:
+                weight = np.sqrt(np.linalg.det(np.einsum('nij,nik->njk', J, J)))
+            if callable(density):
+                weight = weight * density(x)
+            elif density is not None:
+                weight = weight * density
+            second = weight[:, None, None] * x[:, :, None] * x[:, None, :]
+            return np.concatenate([weight[:, None], weight[:, None] * x, second.reshape(len(x), -1)], axis=1)
+
+        derivatives = [(0,) * pardim] + [tuple(int(k) for k in row) for row in np.identity(pardim, dtype=int)]
+        result = self.integrate(moments, derivatives=derivatives, points=points)
+        return result[0], result[1:dim+1], result[dim+1:].reshape(dim, dim)
+
+    def invert(self, points, **kwargs):
+        """  Find the parametric values of the points on the object closest to
+        the given physical points.
+
+        Newton iteration is done for all the points at once. Unless an initial
+        guess is given, each point starts at the closest of a set of sample
+        points, a few per element in each direction. Parameter values are
+        clamped to the domain, or wrapped around it in periodic directions.
+
+        .. code:: python
+
+           u = surface.invert(x)
+           np.allclose(surface(u[:,0], u[:,1], tensor=False), x)
+
+        :param numpy.array points: An *n* × *dim* array of physical points, or a
+            single point
+        :param numpy.array initial_guess: An *n* × *pardim* array of starting
+            parametric values
+        :param float tol: Convergence tolerance for the parametric values.
+            Defaults to :data:`splipy.state.knot_tolerance`.
+        :param int maxiter: Maximal number of Newton iterations
+        :return: An *n* × *pardim* array of parametric values, or a single
+            vector for a single point
+        :rtype: numpy.array
+        """
+        points = np.asarray(points, dtype=float)
+        squeeze = points.ndim == 1
+        x = points.reshape(-1, self.dimension)
+        tol = kwargs.get('tol', state.knot_tolerance)
+        maxiter = kwargs.get('maxiter', 50)
+
+        start = np.array(self.start(), dtype=float)
+        end = np.array(self.end(), dtype=float)
+        periodic = np.array([b.periodic > -1 for b in self.bases])
+
+        def clamp(u):
+            return np.where(periodic, (u - start) % (end - start) + start, np.clip(u, start, end))
+
+        guess = kwargs.get('initial_guess', None)
+        if guess is None:
+            u = self._invert_seed(x)
+        else:
+            u = clamp(np.array(np.broadcast_to(guess, (len(x), self.pardim)), dtype=float))
+
+        # if the parametric and physical dimensions agree, the Gauss-Newton
+        # step is the Newton step for solving X(u) = x, without the second
+        # derivatives
+        pardim = self.pardim
+        square = self.dimension == pardim
+        first = [tuple(int(i == j) for j in range(pardim)) for i in range(pardim)]
+        active = np.arange(len(x))
+        for _ in range(maxiter):
+            if not active.size:
+                break
+
+            # Newton step for the minimum of |X(u) - x|^2 / 2
+            ua = u[active]
+            jet = self.jet(*ua.T, d=1 if square else 2, tensor=False)
+            r = jet[(0,) * pardim] - x[active]
+            J = np.stack([jet[k] for k in first], axis=2)
+            g = np.einsum('mdi,md->mi', J, r)
+            JJ = np.einsum('mdi,mdj->mij', J, J)
+            H = JJ.copy()
+            if not square:
+                for i, j in product(range(pardim), repeat=2):
+                    key = tuple(np.add(first[i], first[j]))
+                    H[:, i, j] += np.einsum('md,md->m', jet[key], r)
+
+                # fall back to Gauss-Newton where the Hessian is not positive
+                # definite
+                indefinite = np.linalg.eigvalsh(H)[:, 0] <= 0
+                H[indefinite] = JJ[indefinite]
+
+            # regularize (nearly) singular Jacobians
+            H += (1e-12 * np.trace(H, axis1=1, axis2=2) + 1e-300)[:, None, None] * np.eye(pardim)
+            step = -np.linalg.solve(H, g[..., None])[..., 0]
+
+            # halve the steps which do not decrease the distance
+            dist = np.sum(r**2, axis=1)
+            new = clamp(ua + step)
+            check = np.arange(len(new))
+            for _ in range(8):
+                trial = self.evaluate(*new[check].T, tensor=False) - x[active[check]]
+                check = check[np.sum(trial**2, axis=1) > dist[check]]
+                if not check.size:
+                    break
+                step[check] /= 2
+                new[check] = clamp(ua[check] + step[check])
+            change = np.abs(new - ua)
+            change = np.where(periodic, np.minimum(change, end - start - change), change)
+            u[active] = new
+            active = active[np.any(change > tol, axis=1)]
+
+        if squeeze:
+            return u[0]
+        return u
+
+    def _invert_seed(self, x):
+        """For each of the points *x*, the closest of a tensor grid of sample
+        points, as many per element as the order of the basis in each
+        direction. The samples avoid the element boundaries, where
+        parametrizations are often degenerate. On large objects, the grid is
+        thinned to a few samples per query point, with fewer samples per
+        element, and then only in evenly spread elements."""
+        cap = max(1 << 12, 8 * len(x))
+        per_direction = int(np.ceil(cap ** (1.0 / self.pardim)))
+        params = []
+        for b in self.bases:
+            knots = np.array(b.knot_spans())
+            elements = len(knots) - 1
+            count = min(b.order, max(per_direction // elements, 1))
+            if elements > per_direction:
+                chosen = np.unique(np.linspace(0, elements - 1, per_direction).round().astype(int))
+            else:
+                chosen = np.arange(elements)
+            xi = (np.arange(count) + .5) / count
+            params.append((knots[chosen, None] + np.diff(knots)[chosen, None] * xi).ravel())
+        samples = self.evaluate(*params).reshape(-1, self.dimension)
+        index = cKDTree(samples).query(x)[1]
+        grid = np.meshgrid(*params, indexing='ij')
+        return np.stack([g.ravel()[index] for g in grid], axis=1)
+
+    def _evaluate_blocks(self, function, params, workers, kwargs):
+        """Call *function* on blocks of the parameters on a pool of *workers*
+        threads, and assemble the results. The blocks are sized by
+        :data:`splipy.state.block_size`, but there is at least one per worker.
+
+        Tensor grids are split along the last direction. It is contracted
+        first, so no block repeats the work of another."""
+        workers = workers or os.cpu_count() or 1
+        if workers == 1:
+            return function(*params, **kwargs)
+
+        tensor = kwargs.get('tensor', True)
+        params = [np.array(p, dtype=float) for p in params]
+        axis = len(params) - 1 if tensor else 0
+
+        n = len(params[axis])
+        per_row = int(np.prod([len(p) for p in params])) // max(n, 1) if tensor else 1
+        row_bytes = per_row * (self.dimension + self.rational) * np.dtype(kwargs.get('dtype', float)).itemsize
+        step = max(1, min(state.block_size // max(row_bytes, 1), -(-n // workers)))
+
+        blocks = [args for _, args in _split_points(params, step, tensor, axis)]
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(lambda args: function(*args, **kwargs), blocks))
+        return np.concatenate(results, axis=axis)
+
+    def evaluate_chunks(self, *params, **kwargs):
+        """  Evaluate the object, or one of its derivatives, in blocks of
+        bounded size.
+
+        This is a generator, which yields pairs *(index, block)*, where *block*
+        is the result of :func:`splipy.SplineObject.evaluate` (or of
+        :func:`splipy.SplineObject.derivative`, if *d* is given) for the
+        points selected by *index*, a slice along the first axis of the full
+        result. On a tensor product grid the points are split along the first
+        parameter direction. The peak memory use is proportional to
+        *chunk_size*, rather than to the total number of points.
+
+        If *out* is given, each block is also written to it, and the yielded
+        blocks are views into *out*. Using a :class:`numpy.memmap` streams the
+        result straight to disk.
+
+        .. code:: python
+
+           out = np.lib.format.open_memmap('x.npy', mode='w+', dtype=float,
+                                           shape=(len(u), len(v), len(w), 3))
+           for _ in vol.evaluate_chunks(u, v, w, out=out):
+               pass
+
+        :param u,v,...: Parametric coordinates in which to evaluate
+        :type u,v,...: float or [float]
+        :param int chunk_size: The (approximate) number of points in each block
+        :param numpy.array out: Array to store the full result in
+        :param (int) d: Order of derivative to compute
+        :param (bool) above: Evaluation in the limit from above
+        :param tensor: Whether to evaluate on a tensor product grid
+        :type tensor: bool
+        :param dtype: Floating point type of the computation and the result,
+            float32 or float64
+        :return: Generator of index and result block pairs
+        """
+        chunk_size = kwargs.pop('chunk_size', 65536)
+        out = kwargs.pop('out', None)
+        tensor = kwargs.get('tensor', True)
+        params = [np.array(ensure_listlike(p), dtype=float) for p in params]
+        if not tensor and len({len(p) for p in params}) != 1:
+            raise ValueError('Parameters must have same length')
+
+        function = self.derivative if 'd' in kwargs else self.evaluate
+        per_row = int(np.prod([len(p) for p in params[1:]])) if tensor else 1
+        step = max(1, chunk_size // max(per_row, 1))
+
+        for index, args in _split_points(params, step, tensor):
+            block = function(*args, **kwargs)
+            if out is not None:
+                out[index] = block
+                block = out[index]
+            yield index, block
+
     def get_derivative_spline(self, direction=None):
         """  Compute the controlpoints associated with the derivative spline object
 
@@ -318,6 +1487,8 @@ class SplineObject(object):
         :param (bool) above: Evaluation in the limit from above
         :param tensor: Whether to evaluate on a tensor product grid
         :type tensor: bool
+        :param int workers: Number of threads to evaluate on. Use *None* for
+            one per available core.
         :return: Tangents
         :rtype: tuple<numpy.array>
         """
@@ -328,6 +1499,7 @@ class SplineObject(object):
         above = ensure_listlike(above, self.pardim)
 
         tensor = kwargs.get('tensor', True)
+        workers = kwargs.get('workers', 1)
 
         if self.pardim == 1: # curves
             direction = 0
@@ -337,7 +1509,7 @@ class SplineObject(object):
             for i in range(self.pardim):
                 derivative[i] = 1
                 # compute velocity in this direction
-                v = self.derivative(*params, d=derivative, above=above, tensor=tensor)
+                v = self.derivative(*params, d=derivative, above=above, tensor=tensor, workers=workers)
                 # normalize
                 if len(v.shape)==1:
                     speed = np.linalg.norm(v)
@@ -352,7 +1524,7 @@ class SplineObject(object):
         i = check_direction(direction, self.pardim)
         derivative[i] = 1
         # compute velocity in this direction
-        v = self.derivative(*params, d=derivative, above=above, tensor=tensor)
+        v = self.derivative(*params, d=derivative, above=above, tensor=tensor, workers=workers)
         # normalize
         if len(v.shape)==1:
             speed = np.linalg.norm(v)
@@ -431,9 +1603,7 @@ class SplineObject(object):
     def raise_order(self, *raises, direction=None):
         """  Raise the polynomial order of the object. If only one
         argument is given, the order is raised equally over all
-        directions, unless the `direction` argument is also given. The
-        explicit version is only implemented on open knot vectors. The
-        function raise_order_implicit is used otherwise.
+        directions, unless the `direction` argument is also given.
 
         :param int u,v,...: Number of times to raise the order in a given
             direction.
@@ -451,25 +1621,24 @@ class SplineObject(object):
         if all(r == 0 for r in raises):
             return self
 
-        if any(b.continuity(b.knots[0]) < b.order or b.periodic > -1 for b in self.bases):
-            self.raise_order_implicit(*raises)
-            return self
-
         new_bases = [b.raise_order(r) for b, r in zip(self.bases, raises)]
 
-        d_p = self.pardim
-
         controlpoints = self.controlpoints
-        for i in range(0,d_p):
-            dimensions = np.array(controlpoints.shape)
-            indices = np.array(range(0,d_p+1))
-            indices[i],indices[d_p] = d_p,i
-            controlpoints = np.transpose(controlpoints,indices)
-            controlpoints = np.reshape(controlpoints,(np.prod(dimensions[indices[:-1]]),dimensions[i]))
-            controlpoints = raise_order_1D(controlpoints.shape[1]-1,self.order(i),
-                                           self.bases[i].knots,controlpoints,raises[i],self.bases[i].periodic)
-            controlpoints = np.reshape(controlpoints,np.append(dimensions[indices[:-1]],controlpoints.shape[1]))
-            controlpoints = np.transpose(controlpoints,indices)
+        for i, (b, r) in enumerate(zip(self.bases, raises)):
+            if r == 0:
+                continue
+            multiplicities = b.knot_info().multiplicities
+            if b.periodic > -1 or (multiplicities[0] >= b.order and multiplicities[-1] >= b.order):
+                # elevate the Bezier elements, which is stable for high orders
+                operators = [None] * self.pardim
+                operators[i] = _elevation_operator(b, new_bases[i])
+                controlpoints = _apply_operators(operators, controlpoints)
+                continue
+            # non-open knot vectors: explicit elevation of all fibres at once
+            cps = np.moveaxis(controlpoints, i, -1)
+            shape = cps.shape
+            cps = raise_order_1D(shape[-1]-1, b.order, b.knots, cps.reshape(-1, shape[-1]), r, b.periodic)
+            controlpoints = np.moveaxis(cps.reshape(shape[:-1] + (cps.shape[-1],)), -1, i)
 
         self.controlpoints = controlpoints
         self.bases = new_bases
@@ -479,6 +1648,8 @@ class SplineObject(object):
         """  Raise the polynomial order of the object. If only one argument is
         given, the order is raised equally over all directions.
 
+        This interpolates the object in the Greville points of the new basis.
+
         :param int u,v,...: Number of times to raise the order in a given
             direction.
         :return: self
@@ -486,20 +1657,11 @@ class SplineObject(object):
 
         new_bases = [b.raise_order(r) for b, r in zip(self.bases, raises)]
 
-        # Set up an interpolation problem
         # This works in projective space, so no special handling for rational objects
-        interpolation_pts = [b.greville() for b in new_bases]
-        N_old = [b(pts) for b, pts in zip(self.bases, interpolation_pts)]
-        N_new = [b(pts) for b, pts in zip(new_bases, interpolation_pts)]
-
-        # Calculate the projective interpolation points
         result = self.controlpoints
-        for n in N_old[::-1]:
-            result = np.tensordot(n, result, axes=(1, self.pardim-1))
-
-        # Solve the interpolation problem
-        for n in N_new[::-1]:
-            result = np.tensordot(np.linalg.inv(n), result, axes=(1, self.pardim-1))
+        for i, (b, new_b, r) in enumerate(zip(self.bases, new_bases, raises)):
+            if r > 0:
+                result = _interpolate_raised(result, b, new_b, i)
 
         self.controlpoints = result
         self.bases = new_bases
@@ -663,18 +1825,14 @@ class SplineObject(object):
         :raises ValueError: For invalid direction
         :return: self
         """
-        shape  = self.controlpoints.shape
-
         # for single-value input, wrap it into a list
         knot = ensure_listlike(knot)
 
         direction = check_direction(direction, self.pardim)
 
-        C = np.identity(shape[direction])
-        for k in knot:
-            C = self.bases[direction].insert_knot(k) @ C
-        self.controlpoints = np.tensordot(C, self.controlpoints, axes=(1, direction))
-        self.controlpoints = self.controlpoints.transpose(transpose_fix(self.pardim, direction))
+        operators = [None] * self.pardim
+        operators[direction] = self.bases[direction].insert_knots(knot)
+        self.controlpoints = _apply_operators(operators, self.controlpoints)
 
         return self
 
@@ -695,11 +1853,18 @@ class SplineObject(object):
            # Refine all directions by given factors
            obj.refine(nu, nv, ...)
 
+        The insertion operators of all directions are built first, and then
+        applied to the control points in a single pass (see
+        :func:`splipy.BSplineBasis.insert_knots`).
+
         :param int nu,nv,...: Number of new knots to insert into each span
         :param int direction: Direction to refine in
+        :param int workers: Number of threads to use. Use *None* for one per
+            available core.
         :return: self
         """
         direction = kwargs.get('direction', None)
+        workers = kwargs.get('workers', 1)
 
         if len(ns) == 1 and direction is not None:
             directions = [check_direction(direction, self.pardim)]
@@ -709,15 +1874,181 @@ class SplineObject(object):
         if len(ns) == 1:
             ns = [ns[0]] * self.pardim
 
+        operators = [None] * self.pardim
         for n, d in zip(ns, directions):
-            knots = self.knots(direction=d)  # excluding multiple knots
-            new_knots = []
-            for (k0, k1) in zip(knots[:-1], knots[1:]):
-                new_knots.extend(np.linspace(k0, k1, n+2)[1:-1])
-            self.insert_knot(new_knots, d)
+            knots = np.array(self.knots(direction=d))  # excluding multiple knots
+            fractions = np.linspace(0, 1, n+2)[1:-1]
+            new_knots = knots[:-1, None] + np.diff(knots)[:, None] * fractions
+            operators[d] = self.bases[d].insert_knots(new_knots.ravel())
+        self.controlpoints = _apply_operators(operators, self.controlpoints, workers)
 
         return self
 
+    def remove_knots(self, tol=None, direction=None):
+        """  Remove knots from the object, while the maximal deviation from the
+        original geometry stays within a tolerance. This is the reverse of
+        :func:`insert_knot`. With the default tolerance, only knots which do
+        not change the geometry (e.g. those inserted by :func:`refine`) are
+        removed.
+
+        Removing a knot changes only the control points which inserting it
+        again would, and those are replaced by a least squares fit. The
+        deviation is bounded by the distance between the control points of
+        the two objects on the finer basis (for rational objects, the
+        distance in homogeneous coordinates, with the change of weight
+        counted and scaled by the smallest weight), and the bounds of all
+        removals are summed. Each knot is scored once, and again only when a
+        neighbouring knot is removed. Knots are removed cheapest first,
+        several at a time when they are far enough apart. Periodic directions
+        are left unchanged.
+
+        .. code:: python
+
+           error = surface.remove_knots(1e-4)
+
+        :param float tol: Tolerance on the maximal deviation. Defaults to
+            :data:`splipy.state.controlpoint_absolute_tolerance`.
+        :param int direction: Direction to remove knots from. Defaults to all.
+        :return: The bound on the deviation which was achieved
+        :rtype: float
+        """
+        if tol is None:
+            tol = state.controlpoint_absolute_tolerance
+        if direction is None:
+            directions = range(self.pardim)
+        else:
+            directions = [check_direction(direction, self.pardim)]
+        directions = [d for d in directions if self.bases[d].periodic < 0]
+        width = self.controlpoints.shape[-1]
+
+        error = 0.0
+        costs = {d: {} for d in directions}
+        hull = None
+        while True:
+            # the rational bound depends on the whole object, so all scores
+            # are stale when its hull changes
+            if self.rational:
+                new_hull = _hull(self.controlpoints, width)
+                if hull is None or not all(np.array_equal(a, b) for a, b in zip(hull, new_hull)):
+                    costs = {d: {} for d in directions}
+                hull = new_hull
+
+            # the cost of removing each interior knot once
+            candidates = []
+            for d in directions:
+                basis = self.bases[d]
+                cps = None
+                for knot in basis.knot_spans()[1:-1]:
+                    if knot not in costs[d]:
+                        if cps is None:
+                            cps = np.moveaxis(self.controlpoints, d, 0).reshape(basis.num_functions(), -1)
+                        costs[d][knot] = _local_removal(basis.knots, basis.order, knot, cps,
+                                                        self.rational, width, hull)[-1]
+                    if error + costs[d][knot] <= tol:
+                        candidates.append((costs[d][knot], d, knot))
+            if not candidates:
+                return error
+
+            # remove knots in the direction of the cheapest one, as many as
+            # possible whose fits do not share control points
+            candidates.sort(key=lambda c: c[0])
+            d = candidates[0][1]
+            basis = self.bases[d]
+            knots, order = basis.knots, basis.order
+            cps = np.moveaxis(self.controlpoints, d, 0)
+            shape = cps.shape
+            cps = cps.reshape(shape[0], -1)
+            used = np.zeros(len(cps), dtype=bool)
+            removals = []
+            for _, dd, knot in candidates:
+                first = np.searchsorted(knots, knot + state.knot_tolerance, side='right') - 1 - order
+                if dd == d and not used[first:first + order + 1].any():
+                    used[first:first + order + 1] = True
+                    removals.append(_local_removal(knots, order, knot, cps, self.rational, width, hull)[:-1])
+
+            # the fits change disjoint rows, so together they deviate by the
+            # largest of their deviations
+            while True:
+                rows = np.concatenate([np.arange(first, first + order + 1) for _, first, _, _ in removals])
+                approx = np.concatenate([A.dot(x) for _, _, A, x in removals])
+                cost = _deviation(cps[rows], approx, self.rational, width, hull)
+                if error + cost <= tol or len(removals) == 1:
+                    break
+                removals = removals[:1]
+
+            error += cost
+            removals.sort(key=lambda r: r[0])
+            pieces, start = [], 0
+            for _, first, _, x in removals:
+                pieces += [cps[start:first], x]
+                start = first + order + 1
+            pieces.append(cps[start:])
+            indices = [index for index, _, _, _ in removals]
+            self.bases[d] = BSplineBasis(order, np.delete(knots, indices))
+            self.controlpoints = np.moveaxis(np.concatenate(pieces).reshape((-1,) + shape[1:]), 0, d)
+
+            # only the neighbours of the removed knots change in this
+            # direction, but every control point may have moved in the others
+            for dd in directions:
+                if dd != d:
+                    costs[dd] = {}
+            scored = np.array(sorted(costs[d]))
+            low = knots[np.maximum(np.array(indices) - order, 0)] - state.knot_tolerance
+            high = knots[np.minimum(np.array(indices) + order, len(knots) - 1)] + state.knot_tolerance
+            stale = np.zeros(len(scored) + 1, dtype=int)
+            np.add.at(stale, np.searchsorted(scored, low), 1)
+            np.add.at(stale, np.searchsorted(scored, high, side='right'), -1)
+            for knot in scored[np.cumsum(stale[:-1]) > 0]:
+                del costs[d][knot]
+
+    def simplify(self, tol, reduce_order=False):
+        """  Reduce the number of control points of the object, while the
+        maximal deviation from the original geometry stays within a tolerance,
+        by removing knots (see :func:`remove_knots`).
+
+        With *reduce_order*, the polynomial order is then lowered in each
+        direction for as long as the rest of the tolerance allows (see
+        :func:`lower_order`), which also catches objects of raised order, and
+        the remaining knots are tried again.
+
+        :param float tol: Tolerance on the maximal deviation
+        :param bool reduce_order: Whether to lower the polynomial order
+        :return: The bound on the deviation which was achieved
+        :rtype: float
+        """
+        width = self.controlpoints.shape[-1]
+        error = self.remove_knots(tol)
+        lowered_any = False
+        for d in range(self.pardim if reduce_order else 0):
+            while self.order(d) > 2:
+                lowers = [0] * self.pardim
+                lowers[d] = 1
+                lowered = self.lower_order(*lowers)
+
+                # compare on the common refinement of the original and the
+                # lowered object raised back to the same order
+                raised = lowered.clone().raise_order(1, direction=d)
+                original = self.clone()
+                for a, b in [(original, raised), (raised, original)]:
+                    own, other = a.bases[d].knot_info(), b.bases[d].knot_info()
+                    for knot, mult in zip(other.knots, other.multiplicities):
+                        have = own.multiplicities[np.abs(own.knots - knot) <= state.knot_tolerance].sum()
+                        if mult > have:
+                            a.insert_knot([knot] * (mult - have), d)
+                if original.shape != raised.shape:
+                    break
+                cost = _deviation(original.controlpoints, raised.controlpoints, self.rational, width)
+                if error + cost > tol:
+                    break
+                error += cost
+                self.bases = lowered.bases
+                self.controlpoints = lowered.controlpoints
+                lowered_any = True
+
+        if lowered_any:
+            error += self.remove_knots(tol - error)
+        return error
+
     def reparam(self, *args, **kwargs):
         """  Redefine the parametric domain. This function accepts two calling
         conventions:
@@ -942,6 +2273,7 @@ class SplineObject(object):
         for i in range(dim):
             if not keep[i]:
                 self.controlpoints[..., i] = 0
+        self._version = next(_versions)
 
         return self
 
@@ -955,13 +2287,8 @@ class SplineObject(object):
         :return: Bounding box
         :rtype: [(float)]
         """
-        dim = self.dimension
-
-        result = []
-        for i in range(dim):
-            result.append((np.min(self.controlpoints[..., i]),
-                           np.max(self.controlpoints[..., i])))
-        return result
+        cps = self.controlpoints.reshape(-1, self.controlpoints.shape[-1])[:, :self.dimension]
+        return list(zip(cps.min(axis=0), cps.max(axis=0)))
 
     def center(self):
         """  Gets the center of the domain
@@ -1001,8 +2328,7 @@ class SplineObject(object):
 
         # project to physical space
         if self.rational:
-            result[:-1] /= result[-1]
-            result = np.delete(result, self.dimension)
+            result = result[:-1] / result[-1]
 
         return result
 
@@ -1112,11 +2438,9 @@ class SplineObject(object):
         splitting_obj = self.clone()
         bases = self.bases
         # insert knots to produce C{-1} at all splitting points
-        for k in knots:
-            continuity = bases[direction].continuity(k)
-            if continuity == np.inf:
-                continuity = p - 1
-            splitting_obj.insert_knot([k] * (continuity + 1), direction)
+        continuity = bases[direction].continuity(knots)
+        continuity = np.where(continuity == np.inf, p - 1, continuity)
+        splitting_obj.insert_knot(np.repeat(knots, continuity.astype(int) + 1), direction)
 
         b = splitting_obj.bases[direction]
         if b.periodic > -1:
@@ -1303,15 +2627,17 @@ class SplineObject(object):
         This function supports the same indexing modes as
         :func:`SplineObject.__getitem__`
 
+        Use this, rather than editing :attr:`controlpoints` in place, to keep
+        derived data such as :func:`bvh` and :func:`element_bounds` up to date.
+
         :param int i: Index or indices
         :param numpy.array cp: New control point(s)
         """
         if isinstance(i, tuple):
             self.controlpoints[i] = cp
-            return
-
-        unraveled = self._unravel_flat_index(i)
-        self.controlpoints[unraveled] = cp
+        else:
+            self.controlpoints[self._unravel_flat_index(i)] = cp
+        self._version = next(_versions)
 
     @property
     def shape(self):
@@ -1434,20 +2760,15 @@ class SplineObject(object):
         b1    = spline1.bases[i]
         b2    = spline2.bases[i]
 
-        inserts = []
-        for k in knot1:
-            c1 = b1.continuity(k)
-            c2 = b2.continuity(k)
-            if c2 > c1:
-                m = min(c2-c1, p-1-c1) # c2=np.inf if knot does not exist
-                inserts.extend([k] * m)
-        spline2.insert_knot(inserts, direction=i)
-
-        inserts = []
-        for k in knot2:
-            c1 = b1.continuity(k)
-            c2 = b2.continuity(k)
-            if c1 > c2:
-                m = min(c1-c2, p-1-c2) # c1=np.inf if knot does not exist
-                inserts.extend([k]*m)
-        spline1.insert_knot(inserts, direction=i)
+        c1 = b1.continuity(knot1)
+        c2 = b2.continuity(knot1)
+        m = np.where(c2 > c1, np.minimum(c2-c1, p-1-c1), 0) # c2=np.inf if knot does not exist
+        inserts2 = np.repeat(knot1, m.astype(int))
+
+        c1 = b1.continuity(knot2)
+        c2 = b2.continuity(knot2)
+        m = np.where(c1 > c2, np.minimum(c1-c2, p-1-c2), 0) # c1=np.inf if knot does not exist
+        inserts1 = np.repeat(knot2, m.astype(int))
+
+        spline2.insert_knot(inserts2, direction=i)
+        spline1.insert_knot(inserts1, direction=i)
@@ -8,6 +8,8 @@ states = ['controlpoint_relative_tolerance',
           'parametric_relative_tolerance',
           'parametric_absolute_tolerance',
           'knot_tolerance',
+          'basis_cache_size',
+          'block_size',
           'unlimited']
 __all__ = states + ['state']
 
@@ -27,6 +29,16 @@ parametric_relative_tolerance = 0.0
 knot_tolerance = 1e-10
 """Absolute tolerance used for matching parametric values (knot vectors)."""
 
+basis_cache_size = 0
+"""Maximal number of basis evaluations kept in the evaluation cache. Zero
+disables caching. See :func:`splipy.BSplineBasis.cache_info`."""
+
+block_size = 1 << 20
+"""Target size in bytes of each block of results in parallel evaluation
+(see the *workers* argument of :func:`splipy.SplineObject.evaluate`). Blocks
+that fit in the processor cache keep the threads from competing for memory
+bandwidth."""
+
 unlimited = 1e4
 """Since splipy insists on finite parametric domains, we define 'unbounded' here"""
 
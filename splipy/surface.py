@@ -5,7 +5,7 @@ from itertools import chain
 
 import numpy as np
 
-from .basis import BSplineBasis
+from .basis import BSplineBasis, LocalBasis
 from .curve import Curve
 from .splineobject import SplineObject, evaluate
 from .utils import is_singleton, ensure_listlike, check_direction, sections
@@ -35,7 +35,7 @@ class Surface(SplineObject):
         """
         super(Surface, self).__init__([basis1, basis2], controlpoints, rational, **kwargs)
 
-    def normal(self, u, v, above=(True,True), tensor=True):
+    def normal(self, u, v, above=(True,True), tensor=True, workers=1):
         """  Evaluate the normal of the surface at given parametric values.
 
         This is equal to the cross-product between tangents. The return value
@@ -57,6 +57,8 @@ class Surface(SplineObject):
         :param (bool) above: Evaluation in the limit from above
         :param tensor: Whether to evaluate on a tensor product grid
         :type tensor: bool
+        :param int workers: Number of threads to evaluate on. Use *None* for
+            one per available core.
         :return: Normal array *X[i,j,k]* of component *xk* evaluated at *(u[i], v[j])*
         :rtype: numpy.array
         :raises RuntimeError: If the physical dimension is not 2 or 3
@@ -74,7 +76,7 @@ class Surface(SplineObject):
                 return np.array([0, 0, 1])
         elif self.dimension == 3:
             # fetch the tangent vectors
-            (du, dv) = self.tangent(u, v, above=above, tensor=tensor)
+            (du, dv) = self.tangent(u, v, above=above, tensor=tensor, workers=workers)
 
             # compute normals
             normals = np.cross(du,dv)
@@ -89,7 +91,7 @@ class Surface(SplineObject):
             raise RuntimeError('Normal evaluation only defined for 2D and 3D geometries')
 
 
-    def derivative(self, u, v, d=(1,1), above=True, tensor=True):
+    def derivative(self, u, v, d=(1,1), above=True, tensor=True, dtype=float, workers=1):
         """  Evaluate the derivative of the surface at the given parametric values.
 
         This function returns an *n* × *m* x *dim* array, where *n* is the number of
@@ -108,117 +110,35 @@ class Surface(SplineObject):
         :param (bool) above: Evaluation in the limit from above
         :param tensor: Whether to evaluate on a tensor product grid
         :type tensor: bool
+        :param dtype: Floating point type of the computation and the result,
+            float32 or float64
+        :param int workers: Number of threads to evaluate on. Use *None* for
+            one per available core.
         :return: Derivative array *X[i,j,k]* of component *xk* evaluated at *(u[i], v[j])*
         :rtype: numpy.array
         """
 
-        squeeze = all(is_singleton(t) for t in [u,v])
-        derivs = ensure_listlike(d, self.pardim)
-        if not self.rational or np.sum(derivs) < 2 or np.sum(derivs) > 3:
-            return super(Surface, self).derivative(u,v, d=derivs, above=above, tensor=tensor)
-
-        u = ensure_listlike(u)
-        v = ensure_listlike(v)
-        result = np.zeros((len(u), len(v), self.dimension))
-        # dNus = [self.bases[0].evaluate(u, d, above) for d in range(derivs[0]+1)]
-        # dNvs = [self.bases[1].evaluate(v, d, above) for d in range(derivs[1]+1)]
-        dNus = [self.bases[0].evaluate(u, d, above) for d in range(np.sum(derivs)+1)]
-        dNvs = [self.bases[1].evaluate(v, d, above) for d in range(np.sum(derivs)+1)]
-
-        d0ud0v = evaluate([dNus[0], dNvs[0]], self.controlpoints, tensor)
-        d1ud0v = evaluate([dNus[1], dNvs[0]], self.controlpoints, tensor)
-        d0ud1v = evaluate([dNus[0], dNvs[1]], self.controlpoints, tensor)
-        d1ud1v = evaluate([dNus[1], dNvs[1]], self.controlpoints, tensor)
-        d2ud0v = evaluate([dNus[2], dNvs[0]], self.controlpoints, tensor)
-        d0ud2v = evaluate([dNus[0], dNvs[2]], self.controlpoints, tensor)
-        W     = d0ud0v[:,:,-1]
-        dWdu  = d1ud0v[:,:,-1]
-        dWdv  = d0ud1v[:,:,-1]
-        d2Wduv= d1ud1v[:,:,-1]
-        d2Wdu = d2ud0v[:,:,-1]
-        d2Wdv = d0ud2v[:,:,-1]
-
-        for i in range(self.dimension):
-            H1   = d1ud0v[:,:,i] * W - d0ud0v[:,:,i] * dWdu
-            H2   = d0ud1v[:,:,i] * W - d0ud0v[:,:,i] * dWdv
-            dH1du= d2ud0v[:,:,i] * W - d0ud0v[:,:,i] * d2Wdu
-            dH1dv= d1ud1v[:,:,i] * W + d1ud0v[:,:,i] * dWdv - d0ud1v[:,:,i] * dWdu - d0ud0v[:,:,i] * d2Wduv
-            dH2du= d1ud1v[:,:,i] * W + d0ud1v[:,:,i] * dWdu - d1ud0v[:,:,i] * dWdv - d0ud0v[:,:,i] * d2Wduv
-            dH2dv= d0ud2v[:,:,i] * W - d0ud0v[:,:,i] * d2Wdv
-            G1   = dH1du*W - 2*H1*dWdu
-            G2   = dH2dv*W - 2*H2*dWdv
-            if derivs == (1,0):
-                result[:,:,i] = H1 / W/W
-            elif derivs == (0,1):
-                result[:,:,i] = H2 / W/W
-            elif derivs == (1,1):
-                result[:,:,i] = (dH1dv*W - 2*H1*dWdv) /W/W/W
-            elif derivs == (2,0):
-                result[:,:,i] = G1 /W/W/W
-            elif derivs == (0,2):
-                result[:,:,i] = G2 /W/W/W
-            if np.sum(derivs) > 2:
-                d2ud1v = evaluate([dNus[2], dNvs[1]], self.controlpoints, tensor)
-                d1ud2v = evaluate([dNus[1], dNvs[2]], self.controlpoints, tensor)
-                d3ud0v = evaluate([dNus[3], dNvs[0]], self.controlpoints, tensor)
-                d0ud3v = evaluate([dNus[0], dNvs[3]], self.controlpoints, tensor)
-                d3Wdu   = d3ud0v[:,:,-1]
-                d3Wdv   = d0ud3v[:,:,-1]
-                d3Wduuv = d2ud1v[:,:,-1]
-                d3Wduvv = d1ud2v[:,:,-1]
-                d2H1du  = d3ud0v[:,:,i]*W + d2ud0v[:,:,i]*dWdu - d1ud0v[:,:,i]*d2Wdu - d0ud0v[:,:,i]*d3Wdu
-                d2H1duv = d2ud1v[:,:,i]*W + d2ud0v[:,:,i]*dWdv - d0ud1v[:,:,i]*d2Wdu - d0ud0v[:,:,i]*d3Wduuv
-                d2H2dv  = d0ud3v[:,:,i]*W + d0ud2v[:,:,i]*dWdv - d0ud1v[:,:,i]*d2Wdv - d0ud0v[:,:,i]*d3Wdv
-                d2H2duv = d1ud2v[:,:,i]*W + d0ud2v[:,:,i]*dWdu - d1ud0v[:,:,i]*d2Wdv - d0ud0v[:,:,i]*d3Wduvv
-                dG1du   = d2H1du *W + dH1du*dWdu - 2*dH1du*dWdu - 2*H1*d2Wdu
-                dG1dv   = d2H1duv*W + dH1du*dWdv - 2*dH1dv*dWdu - 2*H1*d2Wduv
-                dG2du   = d2H2duv*W + dH2dv*dWdu - 2*dH2du*dWdv - 2*H2*d2Wduv
-                dG2dv   = d2H2dv *W + dH2dv*dWdv - 2*dH2dv*dWdv - 2*H2*d2Wdv
-
-                if derivs == (3,0):
-                    result[:,:,i] = (dG1du*W -3*G1*dWdu) /W/W/W/W
-                elif derivs == (0,3):
-                    result[:,:,i] = (dG2dv*W -3*G2*dWdv) /W/W/W/W
-                elif derivs == (2,1):
-                    result[:,:,i] = (dG1dv*W -3*G1*dWdv) /W/W/W/W
-                elif derivs == (1,2):
-                    result[:,:,i] = (dG2du*W -3*G2*dWdu) /W/W/W/W
-
-        # Squeeze the singleton dimensions if we only have one point
-        if squeeze:
-            result = result.reshape(self.dimension)
+        return super(Surface, self).derivative(u, v, d=d, above=above, tensor=tensor, dtype=dtype,
+                                               workers=workers)
 
-        return result
 
+    def area(self, tol=None, full_output=False):
+        """ Computes the area of the surface in geometric space, by Gauss
+        quadrature on every element, or adaptively if a tolerance is given (see
+        :func:`splipy.SplineObject.integrate`).
 
-    def area(self):
-        """ Computes the area of the surface in geometric space """
-        # fetch integration points
-        (x1,w1) = np.polynomial.legendre.leggauss(self.order(0)+1)
-        (x2,w2) = np.polynomial.legendre.leggauss(self.order(1)+1)
-        # map points to parametric coordinates (and update the weights)
-        (knots1,knots2) = self.knots()
-        u  = np.array([ (x1+1)/2*(t1-t0)+t0 for t0,t1 in zip(knots1[:-1], knots1[1:]) ])
-        w1 = np.array([     w1/2*(t1-t0)    for t0,t1 in zip(knots1[:-1], knots1[1:]) ])
-        v  = np.array([ (x2+1)/2*(t1-t0)+t0 for t0,t1 in zip(knots2[:-1], knots2[1:]) ])
-        w2 = np.array([     w2/2*(t1-t0)    for t0,t1 in zip(knots2[:-1], knots2[1:]) ])
-
-        # wrap everything to vectors
-        u = np.ndarray.flatten(u)
-        v = np.ndarray.flatten(v)
-        w1 = np.ndarray.flatten(w1)
-        w2 = np.ndarray.flatten(w2)
-
-        # compute all quantities of interest (i.e. the jacobian)
-        du = self.derivative(u,v, d=(1,0))
-        dv = self.derivative(u,v, d=(0,1))
-        J  = np.cross(du,dv)
-
-        if self.dimension == 3:
-            J = np.sqrt(np.sum(J**2, axis=2))
-        else:
-            J = np.abs(J)
-        return w1.dot(J).dot(w2)
+        :param float tol: Absolute tolerance
+        :param bool full_output: Also return the estimated error and the number
+            of evaluations
+        :return: The area, and optionally the error and the number of
+            evaluations
+        :rtype: float or tuple
+        """
+        def jacobian(u, du, dv):
+            if self.dimension == 3:
+                return np.sqrt(np.sum(np.cross(du,dv)**2, axis=-1))
+            return np.abs(du[:,0]*dv[:,1] - du[:,1]*dv[:,0])
+        return self.integrate(jacobian, derivatives=[(1,0), (0,1)], tol=tol, full_output=full_output)
 
     def edges(self):
         """Return the four edge curves in (parametric) order: umin, umax, vmin, vmax
@@ -241,17 +161,16 @@ class Surface(SplineObject):
         # clone basis since we need to augment this by knot insertion
         b    = self.bases[direction].clone()
 
-        # compute mapping matrix C which is the knotinsertion operator
+        # compute mapping operator C which is the knotinsertion operator
         mult = min(b.continuity(knot), b.order-1)
-        C    = np.identity(self.shape[direction])
-        for i in range(mult):
-            C = b.insert_knot(knot) @ C
+        C    = b.insert_knots([knot] * int(mult))
 
         # at this point we have a C0 basis, find the right interpolating index
         i  = max(bisect_left(b.knots, knot) - 1,0)
 
         # compute the controlpoints and return Curve
-        cp = np.tensordot(C[i,:], self.controlpoints, axes=(0, direction))
+        C  = LocalBasis(C.values[i:i+1], C.spans[i:i+1], C.n)
+        cp = C.dot(self.controlpoints, axis=direction).take(0, axis=direction)
         return Curve(self.bases[1-direction], cp, self.rational)
 
     def rebuild(self, p, n):
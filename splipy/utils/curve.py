@@ -12,15 +12,12 @@ def curve_length_parametrization(pts, normalize=False):
     :return: The parametrization
     :rtype: [float]
     """
-    knots = [0.0]
-    for i in range(1, pts.shape[0]):
-        knots.append(knots[-1] + np.linalg.norm(pts[i,:] - pts[i-1,:]))
+    knots = np.concatenate([[0.0], np.cumsum(np.linalg.norm(np.diff(pts, axis=0), axis=1))])
 
     if normalize:
-        length = knots[-1]
-        knots = [k/length for k in knots]
+        knots /= knots[-1]
 
-    return knots
+    return knots.tolist()
 
 
 def get_curve_points(curve):
@@ -18,6 +18,42 @@ class TestBasis(unittest.TestCase):
         self.assertEqual(b.continuity(1.000000000000002), 1)
         self.assertEqual(b.continuity(0.999999999999998), 1)
 
+        c = b.continuity([0, .3, .4, 1, 1.134, 2])
+        self.assertTrue(np.array_equal(c, [-1, 2, np.inf, 1, 0, -1]))
+
+    def test_knot_info(self):
+        b = BSplineBasis(4, [0, 0, 0, 0, .3, 1, 1, 1.134, 1.134, 1.134, 2, 2, 2, 2])
+        info = b.knot_info()
+        self.assertTrue(np.allclose(info.knots, [0, .3, 1, 1.134, 2]))
+        self.assertTrue(np.array_equal(info.multiplicities, [4, 1, 2, 3, 4]))
+        self.assertTrue(np.array_equal(info.continuity, [-1, 2, 1, 0, -1]))
+        self.assertTrue(np.array_equal(info.elements, [0, 1, 2, 3]))
+        self.assertIs(b.knot_info(), info)
+
+        # modifying the basis invalidates the metadata
+        b.insert_knots([.5])
+        self.assertEqual(len(b.knot_info().elements), 5)
+        b *= 2
+        self.assertAlmostEqual(b.knot_info().knots[-1], 4)
+
+        # so does editing the knot vector in place
+        b = BSplineBasis(3, [0, 0, 0, 1, 2, 2, 2])
+        self.assertEqual(b.knot_spans(), [0, 1, 2])
+        t, _ = b.quadrature()
+        b.bezier_extraction()
+        b.knots[3] = 1.5
+        self.assertEqual(b.knot_spans(), [0, 1.5, 2])
+        self.assertEqual(b.continuity(1.5), 1)
+        self.assertAlmostEqual(b.quadrature()[0][0].max(), t[0].max() * 1.5)
+        self.assertTrue(np.allclose(b.bezier_extraction()[0], BSplineBasis(3, b.knots).bezier_extraction()[0]))
+
+        # periodic bases include the ghost knots
+        b = BSplineBasis(3, [-1, 0, 0, 1, 2, 3, 3, 4], periodic=0)
+        info = b.knot_info()
+        self.assertTrue(np.allclose(info.knots, [-1, 0, 1, 2, 3, 4]))
+        self.assertTrue(np.array_equal(info.elements, [1, 2, 3]))
+        self.assertEqual(b.knot_spans(), [0, 1, 2, 3])
+
     def test_errors(self):
         with self.assertRaises(ValueError):
             BSplineBasis(4, [1, 2, 3])
@@ -87,6 +123,22 @@ class TestBasis(unittest.TestCase):
         with self.assertRaises(ValueError):
             BSplineBasis().raise_order(-1)
 
+    def test_lower_order(self):
+        b  = BSplineBasis(4, [0, 0, 0, 0, 1, 2, 2, 3, 3, 3, 3])
+        b2 = b.lower_order(1)
+        self.assertAlmostEqual(np.linalg.norm(b2.knots - [0, 0, 0, 1, 2, 3, 3, 3]), 0)
+        self.assertEqual(b2.order, 3)
+
+        # test periodic knot vector
+        b = BSplineBasis(5, [-1, 0, 1, 1, 1, 3, 9, 10, 11, 11, 11, 13, 19], periodic=1)
+        b2 = b.raise_order(1).lower_order(1)
+        self.assertAlmostEqual(np.linalg.norm(b2.knots - b.knots), 0)
+        self.assertEqual(b2.order,    5)
+        self.assertEqual(b2.periodic, 1)
+
+        with self.assertRaises(ValueError):
+            BSplineBasis().lower_order(1)
+
     def test_roll(self):
         b = BSplineBasis(3, [-1, 0, 0, 2, 3, 4, 4, 6], periodic=0)
         b.roll(3)
@@ -164,6 +216,61 @@ class TestBasis(unittest.TestCase):
         self.assertAlmostEqual(b.integrate(0,2)[1], 5.0/6)
         self.assertAlmostEqual(b.integrate(0,2)[2], 5.0/6)
 
+        # several intervals at once
+        I = b.integrate([0, 0, .5], [1, 2, 2.5])
+        self.assertEqual(I.shape, (3, 3))
+        self.assertTrue(np.allclose(I[0], [1.0/6, 2.0/3, 1.0/6]))
+        self.assertTrue(np.allclose(I[1], [2.0/6, 5.0/6, 5.0/6]))
+        self.assertTrue(np.allclose(I[2], b.integrate(.5, 2.5)))
+
+    def test_element_integrals(self):
+        b = BSplineBasis(3, [0,0,0,1,2,2,4,4,4])
+        E = b.element_integrals()
+        self.assertEqual(E.shape, (3, b.num_functions()))
+        self.assertTrue(np.allclose(E.toarray(), b.integrate([0, 1, 2], [1, 2, 4])))
+        self.assertTrue(np.allclose(E.toarray().sum(axis=0), b.integrate(0, 4)))
+        self.assertAlmostEqual(np.sum(E.values), 4)
+        self.assertIs(b.element_integrals().values, E.values)
+        b *= 2
+        self.assertAlmostEqual(np.sum(b.element_integrals().values), 8)
+
+    def test_bezier_extraction(self):
+        b = BSplineBasis(4, [0,0,0,0,.3,.3,.5,1,1,1,1])
+        C, spans = b.bezier_extraction()
+        self.assertEqual(C.shape, (3, 4, 4))
+        self.assertEqual(list(spans), [0, 2, 3])
+        self.assertIs(b.bezier_extraction()[0], C)
+        # the extraction operators map Bernstein polynomials to the B-splines
+        xi = np.array([.1, .5, .8])
+        B = BSplineBasis(4).evaluate(xi)
+        for e, (t0, t1) in enumerate([(0, .3), (.3, .5), (.5, 1)]):
+            N = b.evaluate_local(t0 + (t1 - t0) * xi)
+            self.assertTrue(np.allclose(N.values, B.dot(C[e].T)))
+            self.assertTrue(np.all(N.spans == spans[e]))
+        # rows sum to one (partition of unity)
+        b = BSplineBasis(3, [-1,0,0,1,2,3,3,4], periodic=0)
+        C, spans = b.bezier_extraction()
+        self.assertTrue(np.allclose(np.sum(C, axis=1), 1))
+        self.assertEqual(list(spans), [0, 1, 2])
+
+    def test_quadrature(self):
+        b = BSplineBasis(3, [0,0,0,.3,.3,.5,1,1,1])
+        t, w = b.quadrature()
+        self.assertEqual(t.shape, (3, 3))
+        self.assertIs(b.quadrature()[0], t)
+        self.assertTrue(np.allclose(np.sum(w, axis=1), [.3, .2, .5]))
+        self.assertTrue(np.all((t[:,0] > [0, .3, .5]) & (t[:,-1] < [.3, .5, 1])))
+        # exact for degree 2n-1
+        t, w = b.quadrature(2)
+        self.assertAlmostEqual(np.sum(w * t**3), .25)
+        # integrals of the basis functions
+        N = b.evaluate(t.ravel())
+        self.assertTrue(np.allclose(w.ravel().dot(N), b.integrate(0, 1)))
+        # modifying the basis drops the tables
+        b.normalize()
+        b *= 2
+        self.assertTrue(np.allclose(np.sum(b.quadrature()[1]), 2))
+
     def test_matches(self):
         b1 = BSplineBasis(3, [0,0,0,1,2,3,4,4,4])
         b2 = BSplineBasis(3, [1,1,1,2,3,4,5,5,5])
@@ -275,6 +382,160 @@ class TestBasis(unittest.TestCase):
         self.assertAlmostEqual(x[0, 0],  2.0)
         self.assertAlmostEqual(x[0,-1], -2.0)
 
+    def test_evaluate_local(self):
+        b = BSplineBasis(4, [0,0,0,0,1,2,2,3,4,4,4,4])
+        t = np.linspace(0, 4, 13)
+        for d in range(5):
+            N = b.evaluate_local(t, d)
+            self.assertEqual(N.shape, (13, b.num_functions()))
+            self.assertEqual(N.values.shape, (13, 4))
+            self.assertTrue(np.allclose(N.toarray(), b.evaluate_old(t, d)))
+        N = b.evaluate_local(t)
+        self.assertTrue(np.allclose(np.sum(N.values, axis=1), 1))
+
+        # periodic basis: function indices wrap around
+        b = BSplineBasis(3, [-1,0,0,1,2,3,4,4,5], periodic=0)
+        for from_right in (True, False):
+            N = b.evaluate_local(t, from_right=from_right)
+            self.assertTrue(np.all(N.indices < b.num_functions()))
+            self.assertTrue(np.allclose(N.toarray(), b.evaluate_old(t, from_right=from_right)))
+        self.assertTrue(np.allclose(b.evaluate_local(t, 1).toarray(), b.evaluate_old(t, 1)))
+
+        # non-open knot vector: uniform quadratics on the domain [2,3]
+        b = BSplineBasis(3, [0,1,2,3,4,5])
+        N = b.evaluate_local([2, 2.5, 3])
+        self.assertTrue(np.allclose(N.toarray(), [[1/2, 1/2, 0], [1/8, 3/4, 1/8], [0, 1/2, 1/2]]))
+        N = b.evaluate_local(2.5, 1)
+        self.assertTrue(np.allclose(N.toarray(), [[-1/2, 0, 1/2]]))
+        N = b.evaluate_local(3, from_right=False)
+        self.assertTrue(np.allclose(N.toarray(), b.evaluate_old(3, from_right=False)))
+
+    def test_evaluate_sorted(self):
+        # sorted input is swept, unsorted input is bisected: results must agree,
+        # also for points right next to (repeated) knots
+        b = BSplineBasis(4, [0,0,0,0,1,2,2,3,4,4,4,4])
+        t = np.sort(np.concatenate([np.linspace(0, 4, 41), [1-1e-12, 2+1e-12, 2-1e-12, 4+1e-12]]))
+        perm = np.random.permutation(len(t))
+        for d in range(3):
+            for from_right in (True, False):
+                sorted_N = b.evaluate(t, d, from_right)
+                shuffled_N = b.evaluate(t[perm], d, from_right)
+                self.assertTrue(np.allclose(sorted_N[perm], shuffled_N))
+        self.assertTrue(np.allclose(b.evaluate(2+1e-12), b.evaluate(2)))
+        self.assertTrue(np.allclose(b.evaluate(2-1e-12, from_right=False), b.evaluate(2, from_right=False)))
+
+        # snapping does not modify the input
+        t = np.array([1-1e-12, 3])
+        b.evaluate(t)
+        self.assertEqual(t[0], 1-1e-12)
+
+        # periodic basis, with points outside the domain
+        b = BSplineBasis(3, [-1,0,0,1,2,3,4,4,5], periodic=0)
+        t = np.linspace(-3, 7, 31)
+        self.assertTrue(np.allclose(b.evaluate(t), b.evaluate(t[::-1])[::-1]))
+        self.assertTrue(np.allclose(b.evaluate(t), b.evaluate(t % 4)))
+
+    def test_evaluate_threads(self):
+        b = BSplineBasis(4, [0,0,0,0,1,2,2,3,4,4,4,4])
+        t = np.linspace(0, 4, 1001)
+        for threads in (2, 7, None):
+            self.assertTrue(np.allclose(b.evaluate(t, threads=threads), b.evaluate(t)))
+            self.assertTrue(np.allclose(b.evaluate(t[::-1], 1, threads=threads), b.evaluate(t[::-1], 1)))
+            for N, M in zip(b.evaluate_jet(t, 2, threads=threads), b.evaluate_jet(t, 2)):
+                self.assertTrue(np.allclose(N.toarray(), M.toarray()))
+        # more threads than points
+        self.assertTrue(np.allclose(b.evaluate([0.5, 1.5], threads=8), b.evaluate([0.5, 1.5])))
+
+    def test_evaluate_dtype(self):
+        b = BSplineBasis(4, [0,0,0,0,1,2,2,3,4,4,4,4])
+        t = np.linspace(0, 4, 101)
+        N = b.evaluate_local(t, dtype=np.float32)
+        self.assertEqual(N.values.dtype, np.float32)
+        self.assertTrue(np.allclose(N.toarray(), b.evaluate(t), atol=1e-6))
+        self.assertEqual(b.evaluate(t, 1, sparse=True, dtype=np.float32).dtype, np.float32)
+        for N, M in zip(b.evaluate_jet(t, 2, dtype=np.float32), b.evaluate_jet(t, 2)):
+            self.assertEqual(N.values.dtype, np.float32)
+            self.assertTrue(np.allclose(N.toarray(), M.toarray(), atol=1e-5))
+        with self.assertRaises(ValueError):
+            b.evaluate(t, dtype=int)
+
+    def test_evaluate_cache(self):
+        from splipy.state import state
+        b = BSplineBasis(3, [0,0,0,1,2,3,3,3])
+        t = np.linspace(0, 3, 11)
+        BSplineBasis.cache_clear()
+        with state(basis_cache_size=4):
+            N = b.evaluate(t)
+            self.assertTrue(np.allclose(b.evaluate(t), N))
+            self.assertTrue(np.allclose(b.clone().evaluate(t), N))
+            info = BSplineBasis.cache_info()
+            self.assertEqual((info.hits, info.misses, info.currsize), (2, 1, 1))
+
+            # modifying the basis invalidates its cached evaluations
+            b.insert_knot(0.5)
+            self.assertEqual(b.evaluate(t).shape, (11, 6))
+            b += 1
+            self.assertAlmostEqual(b.evaluate(t)[0,0], 0.0)
+            b.reverse()
+            self.assertAlmostEqual(b.evaluate(t)[0,0], 0.0)
+            self.assertEqual(BSplineBasis.cache_info().hits, 2)
+            # and so does editing the knot vector in place
+            b.knots[5] = 3.25
+            N = b.evaluate(t)
+            self.assertEqual(BSplineBasis.cache_info().hits, 2)
+            self.assertTrue(np.allclose(N, BSplineBasis(3, b.knots).evaluate_local(t, cache=False).toarray()))
+            b.knots[5] = 3.5
+
+            # bases with equal knot vectors share entries
+            self.assertTrue(np.allclose(BSplineBasis(3, [1,1,1,2,3,3.5,4,4,4]).evaluate(t), b.evaluate(t)))
+            self.assertEqual(BSplineBasis.cache_info().hits, 4)
+
+            # least recently used entries are discarded
+            for d in range(3):
+                b.evaluate_jet(t, d)
+            self.assertEqual(BSplineBasis.cache_info().currsize, 4)
+        self.assertEqual(BSplineBasis.cache_info().maxsize, 0)
+        b.evaluate(t)
+        self.assertEqual(BSplineBasis.cache_info().hits, 4)
+        BSplineBasis.cache_clear()
+
+    def test_insert_knots(self):
+        t = np.linspace(0, 4, 57)
+        for b, new_knots in [(BSplineBasis(4, [0,0,0,0,1,2,3,4,4,4,4]), [0.5, 1, 1, 2.5, 3, 3]),
+                             (BSplineBasis(3, [0,1,1,2,3,4,4,6]), [1, 1.5, 3.5, 1]),
+                             (BSplineBasis(3, [-1,0,0,1,2,3,4,4,5], periodic=0), [0.5, 3.5, 0, 2, 5.5]),
+                             (BSplineBasis(4, [-2,-1,0,0,1,2,3,3,4,5], periodic=1), [2.5, 0.1, 1, 1])]:
+            N_old = b.evaluate(t)
+            C = b.insert_knots(new_knots)
+            self.assertEqual(C.shape, (b.num_functions(), N_old.shape[1]))
+            self.assertEqual(C.values.shape[1], b.order)
+            self.assertTrue(np.allclose(b.evaluate(t) @ C.toarray(), N_old))
+
+        # single knot insertion returns the dense matrix
+        b = BSplineBasis(3, [0,0,0,1,2,2,2])
+        C = b.insert_knot(0.5)
+        self.assertEqual(C.shape, (5, 4))
+        self.assertTrue(np.allclose(C[1], [0.5, 0.5, 0, 0]))
+        with self.assertRaises(ValueError):
+            b.insert_knots([1, 3])
+
+    def test_evaluate_jet(self):
+        b = BSplineBasis(3, [-1,0,0,1,2,3,4,4,5], periodic=0)
+        t = np.linspace(0, 4, 13)
+        jet = b.evaluate_jet(t, d=4, from_right=False)
+        self.assertEqual(len(jet), 5)
+        for d, N in enumerate(jet):
+            self.assertTrue(np.allclose(N.toarray(), b.evaluate(t, d, from_right=False)))
+
+    def test_local_dot(self):
+        b = BSplineBasis(3, [0,0,0,1,2,3,3,3])
+        t = np.linspace(0, 3, 7)
+        N = b.evaluate_local(t, 1)
+        cps = np.random.rand(4, b.num_functions(), 2)
+        result = N.dot(cps, axis=1)
+        self.assertEqual(result.shape, (4, 7, 2))
+        self.assertTrue(np.allclose(result, np.einsum('ij,kjl->kil', b.evaluate(t, 1), cps)))
+
 
 if __name__ == '__main__':
     unittest.main()
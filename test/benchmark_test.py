@@ -47,6 +47,10 @@ def tangent_evaluate(spline, n):
     u = tuple([np.linspace(u0, u1, n) for u0,u1 in zip(spline.start(), spline.end())])
     x = spline.tangent(*u) # u has 1, 2 or 3 components
 
+def parallel_evaluate(spline, n, workers):
+    u = tuple([np.linspace(u0, u1, n) for u0,u1 in zip(spline.start(), spline.end())])
+    x = spline(*u, workers=workers)
+
 
 
 
@@ -128,3 +132,12 @@ def test_tangent(benchmark):
 def test_tangent_rational(benchmark):
     spline = get_spline('volume', 30, 3, True)
     benchmark(tangent_evaluate, spline, 15)
+
+
+
+
+@pytest.mark.benchmark(group="evaluate-parallel")
+@pytest.mark.parametrize('workers', [1, 2, 4, 8, None])
+def test_eval_workers(benchmark, workers):
+    spline = get_spline('volume', 30, 3)
+    benchmark(parallel_evaluate, spline, 60, workers)
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+
+import numpy as np
+
+import splipy.surface_factory as sf
+import splipy.volume_factory as vf
+from splipy.splinemodel import SplineModel
+
+
+class TestBoundingVolumeHierarchy(unittest.TestCase):
+    def test_query(self):
+        surf = sf.sphere()
+        surf.refine(3)
+        bvh = surf.bvh()
+        self.assertEqual(len(bvh), surf.bases[0].knot_info().elements.size * surf.bases[1].knot_info().elements.size)
+        self.assertIs(surf.bvh(), bvh)
+
+        # every element box contains the surface points of that element
+        u = np.random.rand(200) * surf.end('u')
+        v = np.random.rand(200) * surf.end('v')
+        x = surf(u, v, tensor=False)
+        queries, elements = bvh.query(x)
+        self.assertEqual(set(queries), set(range(200)))
+        patches, lower, upper = bvh.element(elements)
+        inside = np.all((lower <= np.stack([u, v], axis=1)[queries]) &
+                        (np.stack([u, v], axis=1)[queries] <= upper), axis=1)
+        self.assertEqual(set(queries[inside]), set(range(200)))
+
+        # changing the control points rebuilds the hierarchy
+        surf.scale(2)
+        self.assertIsNot(surf.bvh(), bvh)
+        self.assertEqual(len(surf.bvh().query([[0, 0, 0]])[0]), 0)
+        bvh = surf.bvh()
+        surf[0, 0] = surf[0, 0] / 2
+        self.assertIsNot(surf.bvh(), bvh)
+        bvh = surf.bvh()
+        surf.controlpoints = surf.controlpoints.copy()
+        self.assertIsNot(surf.bvh(), bvh)
+
+    def test_closest_point(self):
+        surf = sf.sphere()
+        surf.refine(3)
+        theta = np.random.rand(100) * 2 * np.pi
+        phi = (np.random.rand(100) * .8 + .1) * np.pi
+        r = np.random.rand(100) * 3 + .1
+        x = np.stack([np.sin(phi) * np.cos(theta), np.sin(phi) * np.sin(theta), np.cos(phi)], axis=1)
+        patch, u, dist = surf.bvh().closest_point(r[:, None] * x)
+        self.assertTrue(np.all(patch == 0))
+        self.assertTrue(np.allclose(dist, np.abs(r - 1)))
+        self.assertTrue(np.allclose(surf(u[:,0], u[:,1], tensor=False), x))
+
+    def test_intersect_rays(self):
+        surf = sf.sphere()
+        surf.refine(3)
+        origins = np.array([[3, 0.1, 0.2], [0.1, -4, 0.3], [0, 0, 0], [3, 3, 3]])
+        directions = np.array([[-1, 0, 0], [0, 1, 0], [0.3, 0.4, 0.2], [1, 0, 0]])
+        hit, patch, u, t = surf.bvh().intersect_rays(origins, directions)
+        self.assertEqual(list(hit), [True, True, True, False])
+        x = origins[:3] + t[:3, None] * directions[:3]
+        self.assertTrue(np.allclose(np.linalg.norm(x, axis=1), 1))
+        self.assertTrue(np.allclose(surf(u[:3,0], u[:3,1], tensor=False), x))
+        # the first hit is the nearest one
+        self.assertAlmostEqual(t[0], 3 - np.sqrt(1 - 0.05))
+
+    def test_contains(self):
+        left = vf.cube()
+        left.refine(2)
+        right = vf.cube() + (1, 0, 0)
+        right.refine(2)
+        model = SplineModel(3, 3, [left, right])
+        x = np.random.rand(300, 3) * [3, 1.2, 1.2] - [.5, .1, .1]
+        bvh = model.bvh()
+        self.assertIs(model.bvh(), bvh)
+        inside, patch, u = bvh.contains(x)
+        expected = (x[:,0] >= 0) & (x[:,0] <= 2) & np.all((x[:,1:] >= 0) & (x[:,1:] <= 1), axis=1)
+        self.assertTrue(np.all(inside == expected))
+        for i in np.flatnonzero(inside):
+            self.assertTrue(np.allclose(bvh.objects[patch[i]](*u[i]), x[i]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -119,6 +119,21 @@ class TestCurve(unittest.TestCase):
         # ensure that curve has the right order
         self.assertEqual(crv.order(0), 5)
 
+        # high orders, on open and periodic knot vectors, are exact to roundoff
+        for crv in [Curve(BSplineBasis(3, [0, 0, 0, .3, .4, 1, 1, 1]), controlpoints), cf.circle()]:
+            t = np.linspace(crv.start(0), crv.end(0), 31)
+            evaluation_point1 = crv(t)
+            crv.raise_order(7)
+            self.assertEqual(crv.order(0), 10)
+            self.assertTrue(np.allclose(crv(t), evaluation_point1, rtol=0, atol=1e-13))
+
+        # knot vectors which are open within the knot tolerance
+        crv = Curve(BSplineBasis(3, [0, 0, 1e-13, .4, 1, 1-1e-13, 1]), controlpoints[:4])
+        t = np.linspace(.01, .99, 31)
+        evaluation_point1 = crv(t)
+        crv.raise_order(2)
+        self.assertTrue(np.allclose(crv(t), evaluation_point1, rtol=0, atol=1e-12))
+
         # check integer type for argument
         with self.assertRaises(TypeError):
             crv.raise_order(0.5)
@@ -218,6 +233,16 @@ class TestCurve(unittest.TestCase):
         self.assertAlmostEqual(evaluation_point1[1], evaluation_point2[1])
         self.assertEqual(len(crv.knots(0, with_multiplicities=True)), 15)
 
+        # periodic curves on several threads, where the new control points
+        # wrap around the seam
+        circle = cf.circle()
+        circle.raise_order(1)
+        t = np.linspace(circle.start(0), circle.end(0), 17)
+        evaluation_point1 = circle(t)
+        circle.refine(2, workers=4)
+        self.assertTrue(np.allclose(circle(t), evaluation_point1))
+        self.assertEqual(circle.periodic(0), True)
+
         # test errors and exceptions
         with self.assertRaises(TypeError):
             crv.insert_knot(1, 2, 3)  # too many arguments
@@ -400,6 +425,29 @@ class TestCurve(unittest.TestCase):
         self.assertAlmostEqual(crv.derivative(0.22, 3)[1], 0)
         self.assertAlmostEqual(crv.derivative(0.86, 3)[0], expect_derivative_3(0.86))
 
+    def test_jet(self):
+        # same parametrization as in test_derivative
+        cp = [[0,0,1], [0,0,0], [0,0,0], [.5,0,.5]]
+        crv = Curve(BSplineBasis(4), cp, rational=True)
+        crv.insert_knot([.2, .71])
+        def expect_derivative(x):
+            return 6*(1-x)**2*x**2/(x**3 - 6*x**2 + 6*x - 2)**2
+        def expect_derivative_3(x):
+            return 12*(3*x**8 - 12*x**7 + 10*x**6 + 48*x**5 - 156*x**4 + 176*x**3 - 72*x**2 + 4)/(x**3 - 6*x**2 + 6*x - 2)**4
+
+        jet = crv.jet(0.32, d=3)
+        self.assertEqual(set(jet.keys()), {(0,), (1,), (2,), (3,)})
+        self.assertTrue(np.allclose(jet[(0,)], crv(0.32)))
+        self.assertAlmostEqual(jet[(1,)][0], expect_derivative(0.32))
+        self.assertAlmostEqual(jet[(3,)][0], expect_derivative_3(0.32))
+
+        # vectorized and non-rational
+        t = np.linspace(0, 1, 11)
+        crv = cf.circle(r=2).rebuild(4, 9)
+        jet = crv.jet(t, d=2)
+        for d in range(3):
+            self.assertTrue(np.allclose(jet[(d,)], crv.derivative(t, d=d) if d > 0 else crv(t)))
+
     def test_tangent_and_normal(self):
         crv = cf.circle()
         crv.set_dimension(3)
@@ -464,6 +512,72 @@ class TestCurve(unittest.TestCase):
         self.assertAlmostEqual(crv.length(), 1.0)
         crv = Curve(BSplineBasis(2, [-1,-1,1,2,3,3]), [[0,0,0], [1,0,0], [1,0,3],[1,10,3]])
         self.assertAlmostEqual(crv.length(), 14.0)
+        crv = cf.circle(r=2)
+        length, error, evaluations = crv.length(tol=1e-10, full_output=True)
+        self.assertAlmostEqual(length, 4*pi, places=10)
+        self.assertLess(error, 1e-10)
+        self.assertGreater(evaluations, crv.length(full_output=True)[2])
+
+    def test_arclength(self):
+        crv = cf.circle(r=2)  # rational, and not parametrized by arc length
+        crv.refine(1)
+        def angle(t):
+            x = crv(t)
+            return np.mod(np.arctan2(x[...,1], x[...,0]), 2*pi)
+        t = np.linspace(crv.start(0), crv.end(0), 13)[:-1]
+        self.assertTrue(np.allclose(crv.arclength(t), 2*angle(t)))
+        self.assertAlmostEqual(crv.arclength(crv.end(0)), 4*pi)
+        self.assertAlmostEqual(crv.length(1, 3), 2*(angle(3) - angle(1)))
+
+        # equidistant points along the curve
+        s = np.linspace(0, 4*pi, 17)[:-1]
+        t = crv.param_at_length(s)
+        self.assertTrue(np.allclose(2*angle(t), s))
+        self.assertTrue(np.allclose(crv.arclength(t), s))
+        self.assertAlmostEqual(angle(crv.param_at_length(pi)), pi/2)
+
+        # non-uniform speed, with a kink
+        crv = Curve(BSplineBasis(3, [0,0,0,1,1,2,2,2]), [[0,0], [1,0], [1,0], [1,0], [1,5]])
+        s = np.linspace(0, 6, 25)
+        t = crv.param_at_length(s, tol=1e-10)
+        self.assertTrue(np.allclose(crv.arclength(t), s))
+        self.assertTrue(np.all(np.diff(t) > 0))
+        self.assertAlmostEqual(crv.param_at_length(1), 1)
+
+    def test_remove_knots(self):
+        # knots inserted by refinement are removed without changing the curve
+        crv = Curve(BSplineBasis(4, [0,0,0,0,1,2,2,2,2]), [[0,0], [1,2], [3,1], [4,3], [5,0]])
+        original = crv.clone()
+        crv.refine(3)
+        crv.insert_knot([.5, .5])
+        error = crv.remove_knots()
+        self.assertLess(error, 1e-10)
+        self.assertTrue(np.allclose(crv.knots(0, with_multiplicities=True), original.knots(0, with_multiplicities=True)))
+        self.assertTrue(np.allclose(crv.controlpoints, original.controlpoints))
+
+        # approximate removal stays within the reported bound
+        crv = cf.fit(lambda t: np.array([np.cos(t), np.sin(t)]).T, 0, 2*pi, rtol=1e-7)
+        original = crv.clone()
+        error = crv.remove_knots(1e-4)
+        self.assertLessEqual(error, 1e-4)
+        self.assertLess(len(crv), len(original) * 2 / 3)
+        t = np.linspace(0, 2*pi, 1000)
+        self.assertLessEqual(np.max(np.linalg.norm(crv(t) - original(t), axis=1)), error + 1e-12)
+
+        # the bound holds for rational curves too
+        crv = cf.circle_segment(3*pi/2).refine(3)
+        crv.controlpoints[::2, 1] += .01
+        original = crv.clone()
+        error = crv.remove_knots(.1)
+        self.assertLessEqual(error, .1)
+        self.assertLess(len(crv), len(original))
+        t = np.linspace(0, 3*pi/2, 4001)
+        self.assertLessEqual(np.max(np.linalg.norm(crv(t) - original(t), axis=1)), error + 1e-12)
+
+        # nothing to remove
+        crv = Curve(BSplineBasis(3, [0,0,0,1,2,2,2]), [[0,0], [1,1], [2,0], [3,1]])
+        self.assertEqual(crv.remove_knots(), 0)
+        self.assertEqual(len(crv), 4)
 
     def test_make_periodic(self):
         my_cps = np.array([[0, -1], [1, 0], [0, 1], [-1, 0], [0, -1]], dtype=float)
@@ -42,5 +42,20 @@ class TestGRDECL(unittest.TestCase):
             self.assertEqual(mx_vol.shape, (3,3,4))
             self.assertEqual(dc_vol.shape, (4,4,4))
 
+    @unittest.skipIf(not has_grdecl, "GRDECL module requires OpenCV 2")
+    def test_cell_at_guess(self):
+        with GRDECL(THIS_DIR + '/geometries/EightCells.grdecl') as myfile:
+            myfile.read()
+            mesh = myfile.raw
+            guesses = [(i, j, k) for i in range(2) for j in range(2) for k in range(2)]
+            for x in [[.25, .25, .25], [.75, .25, .75], [.3, .8, .6]]:
+                expected = mesh.cell_at(x)
+                for guess in guesses:
+                    self.assertEqual(mesh.cell_at(x, guess=guess), expected)
+
+            # a degenerate guessed cell falls back to searching
+            mesh.hull[0, 0, 0] = None
+            self.assertEqual(mesh.cell_at([.75, .75, .75], guess=(0, 0, 0)), mesh.cell_at([.75, .75, .75]))
+
 if __name__ == '__main__':
     unittest.main()
@@ -5,8 +5,9 @@ import unittest
 
 import numpy as np
 
-from splipy import Surface, BSplineBasis
+from splipy import Surface, BSplineBasis, state
 import splipy.surface_factory as sf
+from splipy.utils import raise_order_1D
 
 
 class TestSurface(unittest.TestCase):
@@ -229,6 +230,238 @@ class TestSurface(unittest.TestCase):
         self.assertAlmostEqual(surf.derivative(0.22, 0.71, d=(0,3))[0], expect_derivative_3(0.71, 0.22))
         self.assertAlmostEqual(surf.derivative(0.62, 0.71, d=(0,3))[0], expect_derivative_3(0.71, 0.62))
 
+        # arbitrary order derivatives, compared against central differences of the
+        # derivative one order lower
+        surf = sf.sphere(r=2)
+        u = np.linspace(0.1, 0.9, 4) * surf.end('u')
+        v = np.linspace(0.1, 0.9, 4) * surf.end('v')
+        h = 1e-6
+        for d in [(2,2), (4,1), (1,4)]:
+            lower = (d[0]-1, d[1])
+            fd = (surf.derivative(u+h, v, d=lower) - surf.derivative(u-h, v, d=lower)) / 2 / h
+            self.assertTrue(np.allclose(surf.derivative(u, v, d=d), fd, rtol=1e-5, atol=1e-3))
+
+    def test_jet(self):
+        surf = sf.sphere(r=2)  # rational
+        surf.refine(1)
+        u = np.linspace(0.1, 0.9, 5) * surf.end('u')
+        v = np.linspace(0.1, 0.9, 5) * surf.end('v')
+        jet = surf.jet(u, v, d=1)
+        self.assertEqual(set(jet.keys()), {(0,0), (1,0), (0,1)})
+        self.assertTrue(np.allclose(jet[(0,0)], surf(u, v)))
+        self.assertTrue(np.allclose(jet[(1,0)], surf.derivative(u, v, d=(1,0))))
+        self.assertTrue(np.allclose(jet[(0,1)], surf.derivative(u, v, d=(0,1))))
+
+        # second order, compared against finite differences of the first order
+        jet = surf.jet(u, v, d=(2,2))
+        self.assertEqual(len(jet), 9)
+        h = 1e-6
+        fd = (surf.derivative(u+h, v, d=(0,1)) - surf.derivative(u-h, v, d=(0,1))) / 2 / h
+        self.assertTrue(np.allclose(jet[(1,1)], fd, atol=1e-5))
+        fd = (surf.derivative(u, v+h, d=(2,0)) - surf.derivative(u, v-h, d=(2,0))) / 2 / h
+        self.assertTrue(np.allclose(jet[(2,1)], fd, atol=1e-4))
+
+        # scattered evaluation
+        jet2 = surf.jet(u, v, d=(2,2), tensor=False)
+        for k in jet:
+            self.assertTrue(np.allclose(jet2[k], np.diagonal(jet[k], axis1=0, axis2=1).T))
+
+    def test_evaluate_dtype(self):
+        surf = sf.sphere(r=2)  # rational
+        u = np.linspace(0, 1, 7) * surf.end('u')
+        v = np.linspace(0, 1, 9) * surf.end('v')
+        x = surf(u, v, dtype=np.float32)
+        self.assertEqual(x.dtype, np.float32)
+        self.assertTrue(np.allclose(x, surf(u, v), atol=1e-5))
+        for d in [(1,0), (1,1), (0,2)]:
+            dx = surf.derivative(u, v, d=d, dtype=np.float32)
+            self.assertEqual(dx.dtype, np.float32)
+            self.assertTrue(np.allclose(dx, surf.derivative(u, v, d=d), atol=1e-4))
+
+    def test_evaluate_chunks(self):
+        surf = sf.sphere(r=2)  # rational
+        u = np.linspace(0, 1, 37) * surf.end('u')
+        v = np.linspace(0, 1, 11) * surf.end('v')
+        blocks = list(surf.evaluate_chunks(u, v, chunk_size=50))
+        self.assertEqual(len(blocks), 10)
+        self.assertTrue(all(x.shape[1:] == (11, 3) for _, x in blocks))
+        self.assertTrue(np.allclose(np.concatenate([x for _, x in blocks]), surf(u, v)))
+
+        # derivatives, written to an output array
+        out = np.zeros((37, 11, 3))
+        for index, x in surf.evaluate_chunks(u, v, d=(1,0), chunk_size=100, out=out):
+            self.assertTrue(np.shares_memory(x, out))
+        self.assertTrue(np.allclose(out, surf.derivative(u, v, d=(1,0))))
+
+        # scattered points
+        out = np.zeros((11, 3))
+        list(surf.evaluate_chunks(u[:11], v, tensor=False, chunk_size=3, out=out))
+        self.assertTrue(np.allclose(out, surf(u[:11], v, tensor=False)))
+
+    def test_evaluate_workers(self):
+        from splipy.state import state
+        surf = sf.sphere(r=2)  # rational
+        surf.refine(2)
+        u = np.linspace(0, 1, 37) * surf.end('u')
+        v = np.linspace(0, 1, 11) * surf.end('v')
+        with state(block_size=1000):
+            self.assertTrue(np.allclose(surf(u, v, workers=3), surf(u, v)))
+            self.assertTrue(np.allclose(surf(u, u, tensor=False, workers=3), surf(u, u, tensor=False)))
+            self.assertTrue(np.allclose(surf.derivative(u, v, d=(1,1), workers=3), surf.derivative(u, v, d=(1,1))))
+            self.assertTrue(np.allclose(surf.normal(u, v, workers=None), surf.normal(u, v)))
+
+    def test_evaluator(self):
+        surf = sf.sphere(r=2)  # rational
+        surf.refine(1)
+        u = np.linspace(0, 1, 7) * surf.end('u')
+        v = np.linspace(0, 1, 5) * surf.end('v')
+        ev = surf.evaluator(u, v, derivatives=[(0,0), (1,1), (2,0)])
+        result = ev(surf.controlpoints)
+        self.assertTrue(np.allclose(result[(0,0)], surf(u, v)))
+        self.assertTrue(np.allclose(result[(1,1)], surf.derivative(u, v, d=(1,1))))
+        self.assertTrue(np.allclose(result[(2,0)], surf.derivative(u, v, d=(2,0))))
+
+        # the same evaluator works for any control points
+        surf.controlpoints[..., :-1] += np.random.rand(*surf.shape, 3)
+        self.assertTrue(np.allclose(ev(surf.controlpoints)[(1,1)], surf.derivative(u, v, d=(1,1))))
+
+        # evaluation matrix, on a grid and in scattered points
+        surf = Surface(BSplineBasis(3, [0,0,0,.4,1,1,1]), BSplineBasis(4))
+        surf.controlpoints = np.random.rand(*surf.controlpoints.shape)
+        cps = surf.controlpoints.reshape(-1, surf.dimension)
+        A = surf.evaluator(u / u[-1], v / v[-1]).operator()
+        self.assertEqual(A.shape, (len(u) * len(v), len(cps)))
+        self.assertTrue(np.allclose(A @ cps, surf(u / u[-1], v / v[-1]).reshape(-1, surf.dimension)))
+        w = v / v[-1]
+        A = surf.evaluator(w, w[::-1], tensor=False, derivatives=(0,1)).operator()
+        self.assertTrue(np.allclose(A @ cps, surf.derivative(w, w[::-1], d=(0,1), tensor=False)))
+
+        # single point
+        self.assertTrue(np.allclose(surf.evaluator(.3, .6)(surf.controlpoints), surf(.3, .6)))
+
+    def test_evaluate_elements(self):
+        surf = sf.sphere(r=2)  # rational
+        surf.refine(1, 2)
+        (knots1, knots2) = [np.array(k) for k in surf.knots()]
+        x1 = np.array([.2, .7, .9])
+        x2 = np.array([0, .5])
+        u = (knots1[:-1,None] + np.diff(knots1)[:,None] * x1).flatten()
+        v = (knots2[:-1,None] + np.diff(knots2)[:,None] * x2).flatten()
+        for d in [(0,0), (1,0), (1,1), (0,2)]:
+            result = surf.evaluate_elements(x1, x2, d=d)
+            self.assertEqual(result.shape, (len(knots1)-1, len(knots2)-1, 3, 2, 3))
+            expected = surf.derivative(u, v, d=d).reshape(len(knots1)-1, 3, len(knots2)-1, 2, 3)
+            self.assertTrue(np.allclose(result, expected.transpose(0, 2, 1, 3, 4)))
+
+    def test_integrate(self):
+        surf = sf.sphere(r=2)  # rational
+        surf.refine(1, 2)
+        # surface integral of z^2 over the sphere of radius 2
+        def integrand(u, x, du, dv):
+            return x[:,2]**2 * np.linalg.norm(np.cross(du, dv), axis=1)
+        expected = 4 * pi * 2**4 / 3
+        result = surf.integrate(integrand, derivatives=[(0,0), (1,0), (0,1)], points=5)
+        self.assertAlmostEqual(result, expected, places=4)
+
+        # per element, vector valued, and in small chunks
+        elements = surf.integrate(lambda u, x: x, elementwise=True)
+        self.assertEqual(elements.shape, (len(surf.element_bounds()), 3))
+        self.assertTrue(np.allclose(np.sum(elements, axis=0), surf.integrate(lambda u, x: x)))
+        old_size = state.block_size
+        try:
+            state.block_size = 1000
+            self.assertTrue(np.allclose(surf.integrate(lambda u, x: x, elementwise=True), elements))
+        finally:
+            state.block_size = old_size
+
+        # elements are ordered with the first direction slowest
+        ku, kv = np.array(surf.knots('u')), np.array(surf.knots('v'))
+        centers = np.outer((ku[:-1] + ku[1:]) / 2, (kv[:-1] + kv[1:]) / 2 + 10)
+        sizes = np.outer(np.diff(ku), np.diff(kv))
+        self.assertTrue(np.allclose(surf.integrate(lambda u, x: u[:,0] * (u[:,1] + 10), elementwise=True),
+                                    (centers * sizes).ravel()))
+
+        # parametric coordinates are passed to the integrand
+        area = (surf.end('u') - surf.start('u')) * (surf.end('v') - surf.start('v'))
+        self.assertAlmostEqual(surf.integrate(lambda u, x: u[:,0] * u[:,1]),
+                               area * (surf.end('u') + surf.start('u')) * (surf.end('v') + surf.start('v')) / 4)
+
+    def test_integrate_adaptive(self):
+        surf = sf.sphere(r=2)  # rational
+        area, error, evaluations = surf.area(full_output=True)
+        self.assertIsNone(error)
+        self.assertEqual(evaluations, 8 * 4**2)
+        self.assertGreater(abs(area - 16*pi), 1e-4)
+
+        # the error estimate is reliable, and more work gives more accuracy
+        coarse = surf.area(tol=1e-4, full_output=True)
+        fine = surf.area(tol=1e-9, full_output=True)
+        self.assertLess(abs(coarse[0] - 16*pi), 1e-4)
+        self.assertLess(abs(fine[0] - 16*pi), 1e-9)
+        self.assertLess(fine[1], 1e-9)
+        self.assertLess(coarse[2], fine[2])
+
+        # elements where the rules are exact are not subdivided
+        square = sf.square()
+        square.refine(1)
+        area, error, evaluations = square.area(tol=1e-12, full_output=True)
+        self.assertAlmostEqual(area, 1.0)
+        self.assertEqual(evaluations, 4 * (3**2 + 2**2))
+
+        # per element
+        elements = surf.integrate(lambda u, x: x**2, elementwise=True, tol=1e-9)
+        self.assertEqual(elements.shape, (8, 3))
+        self.assertTrue(np.allclose(np.sum(elements, axis=0), surf.integrate(lambda u, x: x**2, tol=1e-9)))
+        self.assertTrue(np.allclose(elements, surf.integrate(lambda u, x: x**2, elementwise=True, points=8)))
+
+    def test_element_bounds(self):
+        surf = sf.sphere(r=2)  # rational
+        surf.refine(1, 2)
+        x = np.linspace(0, 1, 11)
+        points = surf.evaluate_elements(x, x).reshape(-1, 11*11, 3)
+        for refine in [0, 1, 3]:
+            bounds = surf.element_bounds(refine)
+            self.assertEqual(bounds.shape, (points.shape[0], 3, 2))
+            self.assertTrue(np.all(bounds[..., 0] <= points.min(axis=1) + 1e-12))
+            self.assertTrue(np.all(points.max(axis=1) <= bounds[..., 1] + 1e-12))
+
+        # refined boxes are tighter, and approach the exact ones
+        coarse, fine = surf.element_bounds(), surf.element_bounds(8)
+        self.assertTrue(np.all(coarse[..., 0] <= fine[..., 0] + 1e-12))
+        self.assertTrue(np.all(fine[..., 1] <= coarse[..., 1] + 1e-12))
+        self.assertTrue(np.allclose(fine[..., 0], points.min(axis=1), atol=2e-2))
+        self.assertTrue(np.allclose(fine[..., 1], points.max(axis=1), atol=2e-2))
+
+        # the bounds are cached until the control points change
+        self.assertIs(surf.element_bounds(), coarse)
+        surf += (1, 0, 0)
+        self.assertIsNot(surf.element_bounds(), coarse)
+        self.assertTrue(np.allclose(surf.element_bounds()[:, 0], coarse[:, 0] + 1))
+
+    def test_invert(self):
+        surf = sf.sphere(r=2)  # rational, periodic and degenerate at the poles
+        surf.refine(1)
+        rng = np.random.default_rng(17)
+        u = rng.random(200) * (surf.end('u') - surf.start('u')) + surf.start('u')
+        v = rng.random(200) * (surf.end('v') - surf.start('v')) + surf.start('v')
+        x = surf(u, v, tensor=False)
+        result = surf.invert(x)
+        self.assertEqual(result.shape, (200, 2))
+        self.assertTrue(np.allclose(surf(result[:,0], result[:,1], tensor=False), x))
+
+        # closest point projection of points off the surface
+        result = surf.invert(1.5 * x)
+        self.assertTrue(np.allclose(surf(result[:,0], result[:,1], tensor=False), x))
+
+        # starting from a given guess
+        result = surf.invert(x[:5], initial_guess=np.stack([u[:5], v[:5]], axis=1) + .05)
+        self.assertTrue(np.allclose(surf(result[:,0], result[:,1], tensor=False), x[:5]))
+
+        # a guess outside the domain is clamped (or wrapped) into it
+        x = surf(1, surf.end('v') - .1)
+        result = surf.invert(x, initial_guess=[1, surf.end('v') + .5])
+        self.assertTrue(np.allclose(surf(*result), x))
+
     def test_raise_order(self):
         # more or less random 2D surface with p=[2,2] and n=[4,3]
         controlpoints = [[0, 0], [-1, 1], [0, 2], [1, -1], [1, 0], [1, 1], [2, 1], [2, 2], [2, 3],
@@ -272,6 +505,24 @@ class TestSurface(unittest.TestCase):
         self.assertAlmostEqual(evaluation_point1[0], evaluation_point2[0])
         self.assertAlmostEqual(evaluation_point1[1], evaluation_point2[1])
 
+        # periodic in one direction, non-open knot vector in the other
+        basis1 = BSplineBasis(3, [-1, 0, 0, 1, 2, 3, 4, 4, 5], periodic=0)
+        basis2 = BSplineBasis(3, [0, 1, 1, 2, 3, 4, 4, 6])
+        surf = Surface(basis1, basis2, np.random.rand(5 * 5, 3), True)
+        u = np.linspace(0, 4, 9)
+        v = np.linspace(1, 4, 7)
+        evaluation_point1 = surf(u, v)
+        surf.raise_order(2, 1)
+        self.assertEqual(surf.order(), (5, 4))
+        self.assertTrue(np.allclose(surf(u, v), evaluation_point1))
+        surf.raise_order_implicit(1, 0)
+        self.assertTrue(np.allclose(surf(u, v), evaluation_point1))
+
+        # all rows are elevated together
+        cps = np.random.rand(2, 5)
+        cps2 = raise_order_1D(4, 3, basis2.knots, cps, 2, -1)
+        self.assertTrue(np.allclose(basis2.raise_order(2)(v) @ cps2.T, basis2(v) @ cps.T))
+
     def test_insert_knot(self):
         # more or less random 2D surface with p=[3,2] and n=[4,3]
         controlpoints = [[0, 0], [-1, 1], [0, 2], [1, -1], [1, 0], [1, 1], [2, 1], [2, 2], [2, 3],
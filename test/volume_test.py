@@ -5,7 +5,7 @@ from math import pi, sqrt
 
 import numpy as np
 
-from splipy import BSplineBasis, Volume
+from splipy import BSplineBasis, Volume, SplineModel
 import splipy.volume_factory as vf
 
 
@@ -61,6 +61,66 @@ class TestVolume(unittest.TestCase):
             self.assertAlmostEqual(value[i, 1], v)  # identity map y=v
             self.assertAlmostEqual(value[i, 2], w)  # identity map z=w
 
+        # non-trivial, periodic and rational volume
+        vol = Volume(BSplineBasis(3, [0,0,0,1,2,3,3,3]), BSplineBasis(4, [0,0,0,0,.5,1,1,1,1]),
+                     BSplineBasis(3, [-1,0,0,1,2,3,3,4], periodic=0), rational=True)
+        vol.controlpoints = np.random.rand(*vol.controlpoints.shape) + 1
+        u_val = np.random.rand(20) * 3
+        v_val = np.random.rand(20)
+        w_val = np.random.rand(20) * 3
+        value = vol(u_val, v_val, w_val, tensor=False)
+        for i, (u, v, w) in enumerate(zip(u_val, v_val, w_val)):
+            self.assertTrue(np.allclose(value[i], vol(u, v, w)))
+        value = vol.derivative(u_val, v_val, w_val, d=(1,0,1), tensor=False)
+        for i, (u, v, w) in enumerate(zip(u_val, v_val, w_val)):
+            self.assertTrue(np.allclose(value[i], vol.derivative(u, v, w, d=(1,0,1))))
+
+    def test_mass_properties(self):
+        vol = vf.cylinder(r=2, h=3)  # rational
+        vol.refine(1)
+        props = vol.mass_properties(points=5)
+        mass = pi * 2**2 * 3
+        self.assertAlmostEqual(props.mass, mass, places=5)
+        self.assertAlmostEqual(props.mass, vol.volume(), places=5)
+        self.assertTrue(np.allclose(props.center, [0, 0, 1.5]))
+        self.assertTrue(np.allclose(props.moments, mass * props.center, atol=1e-5))
+        expected = np.diag([mass * (3*2**2 + 3**2) / 12] * 2 + [mass * 2**2 / 2])
+        self.assertTrue(np.allclose(props.inertia, expected, atol=1e-4))
+
+        # variable density, and several patches
+        left = vf.cube()
+        right = vf.cube() + (1, 0, 0)
+        model = SplineModel(3, 3, [left, right])
+        props = model.mass_properties(density=lambda x: x[:,0])
+        self.assertAlmostEqual(props.mass, 2)
+        self.assertTrue(np.allclose(props.center, [4/3, .5, .5]))
+        props = model.mass_properties(density=3)
+        self.assertAlmostEqual(props.mass, 6)
+        self.assertTrue(np.allclose(props.inertia, np.diag([1, 5/2, 5/2])))
+
+    def test_invert(self):
+        vol = vf.cube()
+        vol.raise_order(1, 1, 1)
+        vol.refine(2)
+        rng = np.random.default_rng(17)
+        vol.controlpoints += rng.random(vol.controlpoints.shape) * 0.05
+        u = rng.random((100, 3))
+        result = vol.invert(vol(*u.T, tensor=False))
+        self.assertEqual(result.shape, (100, 3))
+        self.assertTrue(np.allclose(result, u))
+        self.assertTrue(np.allclose(vol.invert(vol(*u[0])), u[0]))
+
+        # large objects are seeded from a thinned grid of samples
+        vol = vf.cube()
+        vol.raise_order(1, 1, 1)
+        vol.refine(30)
+        vol.controlpoints += rng.random(vol.controlpoints.shape) * 0.005
+        x = vol(*u[:10].T, tensor=False)
+        self.assertTrue(np.allclose(vol(*vol.invert(x).T, tensor=False), x))
+
+        # points outside are clamped to the boundary
+        self.assertTrue(np.allclose(vf.cube().invert([[2, .5, .5], [.5, -1, .5]]), [[1, .5, .5], [.5, 0, .5]]))
+
     def test_indexing(self):
         v = Volume()
 
@@ -164,6 +224,53 @@ class TestVolume(unittest.TestCase):
         self.assertTupleEqual(vol2.order(), (3,3,3))
 
 
+    def test_refine(self):
+        vol = vf.torus()  # rational and periodic
+        vol.raise_order(0, 1, 0)
+        u = np.linspace(vol.start(0), vol.end(0), 5)
+        v = np.linspace(vol.start(1), vol.end(1), 6)
+        w = np.linspace(vol.start(2), vol.end(2), 7)
+        expected = vol(u, v, w)
+
+        # all directions at once, on several threads, is the same as inserting
+        # the knots one direction at a time
+        sequential = vol.clone()
+        for d, n in enumerate([2, 1, 3]):
+            knots = np.array(sequential.knots(d))
+            new_knots = knots[:-1, None] + np.diff(knots)[:, None] * np.linspace(0, 1, n+2)[1:-1]
+            sequential.insert_knot(new_knots.ravel(), d)
+        vol.refine(2, 1, 3, workers=3)
+        self.assertEqual(vol.shape, sequential.shape)
+        self.assertTrue(np.allclose(vol.controlpoints, sequential.controlpoints))
+        self.assertTrue(np.allclose(vol(u, v, w), expected))
+
+        spans = [len(k) - 1 for k in vol.knots()]
+        vol.refine(1, direction='v')
+        self.assertEqual([len(k) - 1 for k in vol.knots()], [spans[0], 2*spans[1], spans[2]])
+        self.assertTrue(np.allclose(vol(u, v, w), expected))
+
+    def test_simplify(self):
+        vol = vf.cube()
+        vol.raise_order(1, 2, 0)
+        vol.refine(2)
+        vol.insert_knot([.5], 'w')
+        raised = vol.clone()
+        self.assertLess(vol.simplify(1e-10), 1e-10)
+        self.assertEqual(vol.shape, (3, 4, 2))
+        self.assertEqual(vol.order(), (3, 4, 2))
+
+        # lowering the order is opt-in
+        vol = raised
+        self.assertLess(vol.simplify(1e-10, reduce_order=True), 1e-10)
+        self.assertEqual(vol.shape, (2, 2, 2))
+        self.assertEqual(vol.order(), (2, 2, 2))
+
+        # only the chosen direction
+        vol = vf.cube()
+        vol.refine(2)
+        vol.remove_knots(direction='v')
+        self.assertEqual(vol.shape, (4, 2, 4))
+
     def test_insert_knot(self):
         # more or less random 3D volume with p=[2,2,1] and n=[4,3,2]
         controlpoints = [[0, 0, 0], [-1, 1, 0], [0, 2, 0], [1, -1, 0], [1, 0, 0], [1, 1, 0],